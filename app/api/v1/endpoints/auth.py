@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from typing import Any
 
-from app.db.database import supabase  # Supabaseクライアントをインポート
+from app.db.client import new_auth_client  # ログイン用の認証クライアント
 from app.api.v1.schemas.user import Token  # トークン用のスキーマ
 
 router = APIRouter()
@@ -17,7 +17,7 @@ def login_for_testing(form_data: OAuth2PasswordRequestForm = Depends()) -> Any:
     """
     try:
         # SupabaseのPythonライブラリを使って、ログイン処理を実行
-        res = supabase.auth.sign_in_with_password(
+        res = new_auth_client().sign_in_with_password(
             {
                 "email": form_data.username,  # form_data.username にはemailが入る
                 "password": form_data.password,
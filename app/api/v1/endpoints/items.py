@@ -1,13 +1,27 @@
 # items.py
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from typing import List, Optional
+import json
+from fastapi import APIRouter, BackgroundTasks, Depends, File, HTTPException, Request, Response, UploadFile, status, Query
+from typing import List, Literal, Optional
 from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 # 自身のプロジェクトからインポート
 from app.api.v1.schemas.user import User
 from app.api.v1.schemas.item import Item, ItemCreate
 from app.api.v1.schemas.record import Record, PriceComparison
+from app.api.v1.schemas.job import Job
 from app.core.security import get_current_active_user
+from app.db.database import DuplicateNameError
+from app.api.v1.pagination import (
+    ITEM_FIELDS,
+    PAGE_DEFAULT_LIMIT,
+    PAGE_MAX_LIMIT,
+    RECORD_FIELDS,
+    is_paged,
+    page_response,
+    parse_fields,
+)
 from app.services import db_manager, data_processor # 商品名検索にdata_processorも使用
+from app.services import exporter, importer, jobs
 
 router = APIRouter(prefix="/items", tags=["Items & History"])
 
@@ -17,19 +31,67 @@ router = APIRouter(prefix="/items", tags=["Items & History"])
 @router.get("/", response_model=List[Item])
 async def read_items(
     current_user: User = Depends(get_current_active_user),
-    query: Optional[str] = Query(None, description="商品名の一部検索クエリ")
+    query: Optional[str] = Query(None, description="商品名の一部検索クエリ"),
+    limit: Optional[int] = Query(None, ge=1, le=PAGE_MAX_LIMIT, description="1ページの件数 (指定時はページングする)"),
+    after: Optional[int] = Query(None, description="前のページの X-Next-Cursor の値"),
+    fields: Optional[str] = Query(None, description="取得する項目 (カンマ区切り)"),
 ):
-    """ユーザーが登録した商品の一覧、または部分一致で検索した結果を取得する"""
+    """
+    ユーザーが登録した商品の一覧、または部分一致で検索した結果を取得する。
+    limit / after / fields のいずれかを指定した場合は、ID順に1ページ分だけ返す
+    (続きがある場合は X-Next-Cursor ヘッダーに次の after の値が入る)。
+    """
     if query:
         # data_processorが表記ゆれを考慮した検索ロジックを持つことを想定
-        return data_processor.suggest_items(current_user.id, query)
-    return db_manager.get_items_by_user(current_user.id)
+        return await run_in_threadpool(data_processor.suggest_items, current_user.id, query)
+    if is_paged(limit, after, fields):
+        limit = limit or PAGE_DEFAULT_LIMIT
+        rows = await db_manager.aget_items_page(
+            current_user.id, parse_fields(fields, ITEM_FIELDS), limit, after
+        )
+        return page_response(rows, limit)
+    return await db_manager.aget_items_by_user(current_user.id)
 
 # 商品の新規登録 (手動登録またはOCR後の修正)
 @router.post("/", response_model=Item, status_code=status.HTTP_201_CREATED)
 async def create_item(item_in: ItemCreate, current_user: User = Depends(get_current_active_user)):
     """新しい商品情報を登録する"""
-    return db_manager.create_item(current_user.id, item_in)
+    return await db_manager.acreate_item(current_user.id, item_in)
+
+## 全データ削除機能
+# (/{item_id} より先に定義しないと、DELETE /items/data が商品の削除として扱われる)
+@router.delete("/data", response_model=Job, status_code=status.HTTP_202_ACCEPTED)
+async def delete_all_user_data_endpoint(
+    request: Request,
+    response: Response,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    認証済みユーザーの内部DBに保存されている全てのデータ（商品、購入履歴、店舗など）を削除する。
+    🚨 この操作は元に戻せません。
+    削除はバックグラウンドで行い、すぐに 202 Accepted とジョブを返す。
+    完了したかどうかは Location ヘッダーのURL (GET /items/data/jobs/{job_id}) で確認する。
+    """
+    # 削除中に再度呼ばれた場合は (別のワーカーで開始したものも含めて)、新しく始めずに実行中のジョブを返す
+    job, created = await jobs.start_job(current_user.id, jobs.DELETE_ALL_USER_DATA)
+    if created:
+        background_tasks.add_task(
+            jobs.run_job, job.id, db_manager.adelete_all_user_data, current_user.id
+        )
+
+    response.headers["Location"] = str(request.url_for("get_delete_job", job_id=job.id))
+    return job
+
+
+@router.get("/data/jobs/{job_id}", response_model=Job)
+async def get_delete_job(job_id: str, current_user: User = Depends(get_current_active_user)):
+    """全データ削除のジョブの状態 (pending / running / succeeded / failed) を取得する"""
+    job = await jobs.get_job(current_user.id, job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
+    return job
+
 
 # 商品の変更 (PUT)
 @router.put("/{item_id}", response_model=Item)
@@ -41,7 +103,14 @@ async def update_item(
     """特定の商品の正規化名を更新する"""
     # 存在チェックと所有者チェックをdb_managerで実施
     # 注意: ここで正規化名を変更すると、このIDに紐づく過去の全購入履歴に影響します。
-    updated_item = db_manager.update_item(current_user.id, item_id, item_in)
+    try:
+        updated_item = await db_manager.aupdate_item(current_user.id, item_id, item_in)
+    except DuplicateNameError:
+        # 正規化すると既存の別の商品と同じ名称になる場合 (統合はしない)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="An item with the same name already exists.",
+        )
     if not updated_item:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, 
@@ -53,7 +122,7 @@ async def update_item(
 @router.delete("/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_item(item_id: int, current_user: User = Depends(get_current_active_user)):
     """特定の商品の正規化情報を削除する (関連する購入履歴がある場合は削除せず、エラーを出す)"""
-    success = db_manager.delete_item(current_user.id, item_id)
+    success = await db_manager.adelete_item(current_user.id, item_id)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, 
@@ -64,12 +133,21 @@ async def delete_item(item_id: int, current_user: User = Depends(get_current_act
 # 商品名サジェスト機能 (表記ゆれ対策を兼ねる)
 @router.get("/suggest", response_model=List[Item])
 async def suggest_items(
+    response: Response,
     query: str = Query(..., description="入力中の商品名"),
     current_user: User = Depends(get_current_active_user)
 ):
-    """入力文字列に基づいて、既存の商品名からサジェストリストを返す"""
+    """
+    入力文字列に基づいて、既存の商品名からサジェストリストを返す。
+    前方一致と類似度計算のどちらで求めたかを X-Suggest-Path ヘッダー (prefix / fuzzy) で返す。
+    """
     # 表記ゆれ対策 (部分一致、類似度計算など) は data_processor に任せる
-    return data_processor.suggest_items(current_user.id, query)
+    # (類似度計算はCPU処理のため、イベントループを止めないようスレッドプールで実行する)
+    suggestions, path = await run_in_threadpool(
+        data_processor.suggest_items_with_path, current_user.id, query
+    )
+    response.headers["X-Suggest-Path"] = path
+    return suggestions
 
 
 ## 購入履歴 (Record) 関連
@@ -78,11 +156,23 @@ async def suggest_items(
 @router.get("/{item_id}/history", response_model=List[Record])
 async def get_item_history(
     item_id: int, 
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user),
+    limit: Optional[int] = Query(None, ge=1, le=PAGE_MAX_LIMIT, description="1ページの件数 (指定時はページングする)"),
+    after: Optional[int] = Query(None, description="前のページの X-Next-Cursor の値"),
+    fields: Optional[str] = Query(None, description="取得する項目 (カンマ区切り)"),
 ):
-    """特定の正規化された商品IDの購入履歴を全て取得する"""
+    """
+    特定の正規化された商品IDの購入履歴を全て取得する。
+    limit / after / fields のいずれかを指定した場合は、ID順に1ページ分だけ返す。
+    """
     # 履歴の取得と、ユーザーの所有物であることの確認
-    return db_manager.get_records_by_item_id(current_user.id, item_id)
+    if is_paged(limit, after, fields):
+        limit = limit or PAGE_DEFAULT_LIMIT
+        rows = await db_manager.aget_records_page_by_item_id(
+            current_user.id, item_id, parse_fields(fields, RECORD_FIELDS), limit, after
+        )
+        return page_response(rows, limit)
+    return await db_manager.aget_records_by_item_id(current_user.id, item_id)
 
 # 購入履歴の更新 (PUT)
 @router.put("/records/{record_id}", response_model=Record)
@@ -93,7 +183,7 @@ async def update_record(
 ):
     """特定の購入履歴を更新する"""
     # 存在チェックと所有者チェックをdb_managerで実施
-    updated_record = db_manager.update_record(current_user.id, record_id, record_in)
+    updated_record = await db_manager.aupdate_record(current_user.id, record_id, record_in)
     if not updated_record:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, 
@@ -105,7 +195,7 @@ async def update_record(
 @router.delete("/records/{record_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_record(record_id: int, current_user: User = Depends(get_current_active_user)):
     """特定の購入履歴を削除する"""
-    success = db_manager.delete_record(current_user.id, record_id)
+    success = await db_manager.adelete_record(current_user.id, record_id)
     if not success:
         # 削除対象が存在しない、または権限がない場合は404
         raise HTTPException(
@@ -127,7 +217,7 @@ async def get_price_comparison(
     特定の正規化された商品について、店舗ごとの最新価格と平均価格を比較して返す
     """
     # db_managerに複雑な集計ロジックを実装
-    comparison_data = db_manager.get_item_price_comparisons(current_user.id, item_id)
+    comparison_data = await db_manager.aget_item_price_comparisons(current_user.id, item_id)
     
     if not comparison_data:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No history found for this item.")
@@ -137,36 +227,87 @@ async def get_price_comparison(
 
 ## エクスポート機能
 
-@router.get("/export/csv")
-async def export_data(current_user: User = Depends(get_current_active_user)):
-    # 1. CSVファイルを生成し、一時的なファイルパスを取得する
-    #    （db_manager.export_user_data_to_csv()が一時ファイルを作成すると想定）
-    file_path = db_manager.export_user_data_to_csv(current_user.id) 
+# 出力形式ごとの (拡張子, media_type)
+EXPORT_MEDIA_TYPES = {
+    "csv": ("csv", "text/csv; charset=utf-8"),
+    "ndjson": ("ndjson", "application/x-ndjson"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+
+@router.get("/export")
+async def export_records(
+    current_user: User = Depends(get_current_active_user),
+    format: Literal["csv", "ndjson", "parquet"] = Query("csv", description="出力形式"),
+    gzip: bool = Query(False, description="True の場合、gzipで圧縮して返す (parquet は形式内で圧縮済みのため無視)"),
+):
+    """
+    全購入履歴をダウンロードする。
+    DBから1ページずつ取得しながら送信するため、一時ファイルを作らず、件数が多くてもすぐに送信が始まる。
+    ndjson / parquet では価格が数値のまま (parquet では購入日も日付型で) 出力される。
+    """
+    extension, media_type = EXPORT_MEDIA_TYPES[format]
+    if format == "parquet":
+        if not exporter.parquet_available():
+            raise HTTPException(
+                status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                detail="Parquet export is not available on this server.",
+            )
+        body = exporter.iter_records_parquet(current_user.id)
+        gzip = False
+    elif format == "ndjson":
+        body = exporter.iter_records_ndjson(current_user.id, compress=gzip)
+    else:
+        body = exporter.iter_records_csv(current_user.id, compress=gzip)
+
+    filename = f"purchase_history_{current_user.id}.{extension}"
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
 
-    # 2. ファイルをバイナリ読み込みモードで開き、StreamingResponseで返す
-    #    media_type="text/csv" でブラウザにCSVファイルであることを伝える
     return StreamingResponse(
-        open(file_path, "rb"), 
-        media_type="text/csv",
+        body,
+        media_type=media_type,
         # ダウンロード時のファイル名を指定するHTTPヘッダー
-        headers={"Content-Disposition": f"attachment; filename=purchase_history_{current_user.id}.csv"}
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
+
+
+@router.get("/export/csv")
+async def export_data(
+    current_user: User = Depends(get_current_active_user),
+    gzip: bool = Query(False, description="True の場合、gzipで圧縮した .csv.gz を返す"),
+):
+    """全購入履歴をCSVでダウンロードする (/export?format=csv と同じ)"""
+    return await export_records(current_user=current_user, format="csv", gzip=gzip)
     
-## 全データ削除機能
-@router.delete("/data", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_all_user_data_endpoint(current_user: User = Depends(get_current_active_user)):
+## インポート機能
+
+@router.post("/import")
+async def import_data(
+    file: UploadFile = File(..., description="購入履歴のCSV (エクスポートと同じ列) またはNDJSONファイル"),
+    current_user: User = Depends(get_current_active_user),
+    format: Optional[Literal["csv", "ndjson"]] = Query(None, description="入力形式 (省略時はファイル名から判定)"),
+    batch_size: int = Query(
+        importer.IMPORT_BATCH_SIZE, ge=1, le=importer.IMPORT_MAX_BATCH_SIZE,
+        description="1回のDB呼び出しで登録する行数",
+    ),
+):
     """
-    認証済みユーザーの内部DBに保存されている全てのデータ（商品、購入履歴、店舗など）を削除する。
-    🚨 この操作は元に戻せません。
+    購入履歴をファイルから一括で取り込む (スプレッドシートなどからの移行用)。
+    各行はレシートの確定と同じく名寄せされ、未登録の商品・店舗は自動で作成される。
+    batch_size 行ごとに1回のDB呼び出しで登録し、その都度、進捗と行ごとのエラーを
+    NDJSON (1行1つのJSON) で返す。最後の行は {"done": true, ...} の集計。
     """
-    success = db_manager.delete_all_user_data(current_user.id)
-    
-    if not success:
-        # DB操作で予期せぬエラーが発生した場合など
+    format = format or importer.detect_format(file.filename, file.content_type)
+    if format is None:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to delete all user data."
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Unknown file format. Upload a .csv or .ndjson file, or specify format.",
         )
-    
-    # 成功した場合、レスポンスボディなしの 204 No Content を返す
-    return
\ No newline at end of file
+
+    async def progress():
+        async for event in importer.import_records(current_user.id, file.file, format, batch_size):
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
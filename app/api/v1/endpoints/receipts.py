@@ -1,14 +1,15 @@
 # receipts.py (修正案)
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, UploadFile, File, HTTPException, Query, status
 from typing import List
+from fastapi.concurrency import run_in_threadpool
 
 # 自身のプロジェクトからインポート
 from app.api.v1.schemas.user import User
 
 # レスポンスモデルの型ヒントを変更するためにList[OCRResult]を使用
-from app.api.v1.schemas.record import Record, OCRResult, RecordCreate
+from app.api.v1.schemas.record import Record, OCRResult, RecordCreate, ReceiptLineCreate
 from app.core.security import get_current_active_user
-from app.ocr.ocr_engine import process_image
+from app.ocr.ocr_engine import FileStream, process_image
 from app.services import data_processor
 from app.services import db_manager
 
@@ -21,6 +22,7 @@ router = APIRouter(prefix="/receipts", tags=["Receipts"])
 async def upload_receipt_and_process(
     file: UploadFile = File(..., description="レシートの画像ファイル"),
     current_user: User = Depends(get_current_active_user),
+    refresh: bool = Query(False, description="True の場合、同じ画像・撮り直した画像の解析結果を使わずに解析し直す"),
 ):
     """
     レシート画像をアップロードし、OCRにかけてデータを抽出し、正規化の提案を行う。
@@ -32,12 +34,13 @@ async def upload_receipt_and_process(
             detail="Invalid file format. Only JPEG, PNG, HEIC, and HEIF are supported.",
         )
 
-    # 1. 画像データを読み込み
-    image_bytes = await file.read()
-
-    # 2. OCRサービスを実行
+    # 1. OCRサービスを実行 (結果を待つ間もイベントループは止めない)
+    # 画像は縮小・圧縮し直してから送信する (前処理できない形式の場合は、アップロードされたファイルから少しずつ読みながら送信する)
     # raw_data_listは、レシート上の各商品に対応する辞書のリストと想定
-    raw_data_list = process_image(image_bytes)
+    # 同じ画像を再アップロードした場合や、同じレシートを撮り直した場合は、以前の解析結果を使う
+    raw_data_list = await process_image(
+        FileStream(file, size=file.size), use_cache=not refresh, user_id=current_user.id
+    )
 
     if not raw_data_list:
         raise HTTPException(
@@ -45,37 +48,60 @@ async def upload_receipt_and_process(
             detail="Could not extract data from receipt.",
         )
 
-    # 3. データ正規化サービスを実行し、提案を構築
-    # すべてのOCR結果を格納するリスト
-    normalized_results: List[OCRResult] = []
-
-    # raw_data_listの要素すべてに対してループ処理を実行
-    for raw_data in raw_data_list:
-        # data_processor.normalize_ocr_dataを各要素に適用
-        ocr_result = data_processor.normalize_ocr_data(
-            user_id=current_user.id,
-            raw_store_name=raw_data.get("store_name", "不明な店舗"),
-            raw_item_name=raw_data.get("item_name", "不明な商品"),
-            raw_price=raw_data.get("price", 0.0),
-            raw_purchase_date=raw_data.get("purchase_date", None),
-        )
-
-        normalized_results.append(ocr_result)
-
-    # すべての正規化された結果のリストを返す
-    return normalized_results
+    # 2. データ正規化サービスを実行し、提案を構築
+    # (既存の店舗・商品の取得と類似度計算はレシート全体で1回にまとめる。
+    #  同期のDBアクセスと類似度計算を含むため、スレッドプールで実行する)
+    return await run_in_threadpool(
+        data_processor.normalize_receipt, current_user.id, raw_data_list
+    )
 
 
 # OCR結果の確定と購入履歴の登録
 @router.post("/confirm", response_model=Record, status_code=status.HTTP_201_CREATED)
 async def confirm_and_register_record(
-    record_in: RecordCreate, current_user: User = Depends(get_current_active_user)
+    record_in: RecordCreate,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_active_user),
 ):
     """
     ユーザーが確認・修正したOCR結果 (RecordCreate) を最終的な購入履歴としてDBに登録する。
-    （このエンドポイントの変更は不要と判断）
+    OCRで読み取った名称 -> 確定した商品・店舗 の対応は別名として保存し、次回の名寄せに使う。
     """
     # サービスの呼び出しとDBへの保存
-    db_record = db_manager.create_purchase_record(current_user.id, record_in)
+    db_record = await db_manager.acreate_purchase_record(current_user.id, record_in)
+
+    # 別名の保存はレスポンスを返した後に行う
+    background_tasks.add_task(db_manager.save_aliases, current_user.id, record_in)
 
     return db_record
+
+
+# レシート1枚分の一括確定
+@router.post("/confirm/batch", response_model=List[Record], status_code=status.HTTP_201_CREATED)
+async def confirm_receipt_batch(
+    lines: List[ReceiptLineCreate],
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    ユーザーが確認・修正したレシート1枚分の全行を、まとめて購入履歴としてDBに登録する。
+    未登録の商品・店舗は名称 (item_name / store_name) で指定すれば、同じトランザクション内で作成される。
+    行数に関わらずDBへの問い合わせは1回で、1行でも失敗した場合は何も登録しない。
+    """
+    if not lines:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No receipt lines to confirm.",
+        )
+
+    result = await db_manager.aconfirm_receipt_batch(current_user.id, lines)
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Could not confirm receipt. Items or stores may not exist.",
+        )
+    records, confirmed_lines = result
+
+    # 別名の保存はレスポンスを返した後に行う
+    background_tasks.add_task(db_manager.save_aliases, current_user.id, *confirmed_lines)
+    return records
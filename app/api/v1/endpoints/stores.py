@@ -1,27 +1,70 @@
 # stores.py
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, Response, status, Query
 from typing import List
 from typing import List, Optional
+from fastapi.concurrency import run_in_threadpool
 
 # 自身のプロジェクトからインポート
 from app.api.v1.schemas.user import User
 from app.api.v1.schemas.store import Store, StoreCreate
 from app.core.security import get_current_active_user
+from app.db.database import DuplicateNameError
 from app.services import db_manager
 from app.services import db_manager, data_processor # 商品名検索にdata_processorも使用
+from app.api.v1.pagination import (
+    PAGE_DEFAULT_LIMIT,
+    PAGE_MAX_LIMIT,
+    STORE_FIELDS,
+    is_paged,
+    page_response,
+    parse_fields,
+)
 
 router = APIRouter(prefix="/stores", tags=["Stores"])
 
 # 店舗の一覧取得
 @router.get("/", response_model=List[Store])
 async def read_stores(current_user: User = Depends(get_current_active_user),
-    query: Optional[str] = Query(None, description="商品名の一部検索クエリ")
+    query: Optional[str] = Query(None, description="商品名の一部検索クエリ"),
+    limit: Optional[int] = Query(None, ge=1, le=PAGE_MAX_LIMIT, description="1ページの件数 (指定時はページングする)"),
+    after: Optional[int] = Query(None, description="前のページの X-Next-Cursor の値"),
+    fields: Optional[str] = Query(None, description="取得する項目 (カンマ区切り)"),
     ):
-    """ユーザーが登録した店舗の一覧、または部分一致で検索した結果を取得する"""
+    """
+    ユーザーが登録した店舗の一覧、または部分一致で検索した結果を取得する。
+    limit / after / fields のいずれかを指定した場合は、ID順に1ページ分だけ返す
+    (続きがある場合は X-Next-Cursor ヘッダーに次の after の値が入る)。
+    """
     if query:
         # data_processorが表記ゆれを考慮した検索ロジックを持つことを想定
-        return data_processor.suggest_stores(current_user.id, query)
-    return db_manager.get_stores_by_user(current_user.id)
+        return await run_in_threadpool(data_processor.suggest_stores, current_user.id, query)
+    if is_paged(limit, after, fields):
+        limit = limit or PAGE_DEFAULT_LIMIT
+        rows = await db_manager.aget_stores_page(
+            current_user.id, parse_fields(fields, STORE_FIELDS), limit, after
+        )
+        return page_response(rows, limit)
+    return await db_manager.aget_stores_by_user(current_user.id)
+
+# 店舗名サジェスト機能 (表記ゆれ対策を兼ねる)
+# ("/{store_id}" より先に定義しないと、"suggest" が店舗IDとして解釈されてしまう)
+@router.get("/suggest", response_model=List[Store])
+async def suggest_stores(
+    response: Response,
+    query: str = Query(..., description="入力中の店舗名"),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    入力文字列に基づいて、既存の店舗名からサジェストリストを返す。
+    前方一致と類似度計算のどちらで求めたかを X-Suggest-Path ヘッダー (prefix / fuzzy) で返す。
+    """
+    # 表記ゆれ対策 (部分一致、類似度計算など) は data_processor に任せる
+    # (類似度計算はCPU処理のため、イベントループを止めないようスレッドプールで実行する)
+    suggestions, path = await run_in_threadpool(
+        data_processor.suggest_stores_with_path, current_user.id, query
+    )
+    response.headers["X-Suggest-Path"] = path
+    return suggestions
 
 # 店舗の詳細取得
 @router.get("/{store_id}", response_model=Store)
@@ -29,7 +72,7 @@ async def read_store(store_id: int, current_user: User = Depends(get_current_act
     """特定の店舗IDに基づいて詳細情報を取得する"""
     
     # db_managerに、IDとユーザーIDで店舗を取得する関数を呼び出す
-    store = db_manager.get_store_by_id_and_user(current_user.id, store_id)
+    store = await db_manager.aget_store_by_id(current_user.id, store_id)
     
     if not store:
         raise HTTPException(
@@ -42,7 +85,7 @@ async def read_store(store_id: int, current_user: User = Depends(get_current_act
 @router.post("/", response_model=Store, status_code=status.HTTP_201_CREATED)
 async def create_store(store_in: StoreCreate, current_user: User = Depends(get_current_active_user)):
     """新しい店舗情報を登録する"""
-    return db_manager.create_store(current_user.id, store_in)
+    return await db_manager.acreate_store(current_user.id, store_in)
 
 # 店舗の変更 (PUT / PATCH) - ここではPUTの例
 @router.put("/{store_id}", response_model=Store)
@@ -53,7 +96,14 @@ async def update_store(
 ):
     """特定の店舗情報を更新する"""
     # 存在チェックと所有者チェックをdb_managerで実施
-    updated_store = db_manager.update_store(current_user.id, store_id, store_in)
+    try:
+        updated_store = await db_manager.aupdate_store(current_user.id, store_id, store_in)
+    except DuplicateNameError:
+        # 正規化すると既存の別の店舗と同じ名称になる場合 (統合はしない)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A store with the same name already exists.",
+        )
     if not updated_store:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, 
@@ -65,20 +115,10 @@ async def update_store(
 @router.delete("/{store_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_store(store_id: int, current_user: User = Depends(get_current_active_user)):
     """特定の店舗情報を削除する (関連する購入履歴がある場合は削除せず、エラーを出す)"""
-    success = db_manager.delete_store(current_user.id, store_id)
+    success = await db_manager.adelete_store(current_user.id, store_id)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, 
             detail="Store not found or you don't have permission."
         )
     return
-
-# 店舗名サジェスト機能 (表記ゆれ対策を兼ねる)
-@router.get("/suggest", response_model=List[Store])
-async def suggest_stores(
-    query: str = Query(..., description="入力中の店舗名"),
-    current_user: User = Depends(get_current_active_user)
-):
-    """入力文字列に基づいて、既存の店舗名からサジェストリストを返す"""
-    # 表記ゆれ対策 (部分一致、類似度計算など) は data_processor に任せる
-    return data_processor.suggest_stores(current_user.id, query)
\ No newline at end of file
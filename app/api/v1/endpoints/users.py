@@ -4,22 +4,14 @@ from fastapi import APIRouter, Depends, HTTPException, status
 # AuthApiErrorの正しいインポート先
 from gotrue.errors import AuthApiError
 
-# Supabaseの同期クライアントをインポート
-from supabase import create_client, Client
-
 # 自身のプロジェクトからインポート
 from app.api.v1.schemas.user import User, UserLogin, AuthResponse
-from app.core.config import settings
 from app.core.security import get_current_active_user
+from app.db.client import new_auth_client
 from app.services import db_manager
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
-# Supabaseの同期クライアントを初期化
-SUPABASE_URL: str = settings.SUPABASE_URL
-SUPABASE_KEY: str = settings.SUPABASE_KEY
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
 # 1. 新規ユーザー登録
 
 
@@ -39,7 +31,8 @@ def register_user(
     """
     try:
         # 1. Supabase Authにユーザーを登録
-        auth_response = supabase.auth.sign_up(
+        # ログイン状態を共有クライアントに残さないよう、リクエストごとの認証クライアントを使う
+        auth_response = new_auth_client().sign_up(
             {"email": user_in.email, "password": user_in.password}
         )
 
@@ -84,7 +77,7 @@ def user_login(user_in: UserLogin) -> Any:
     Supabaseで認証を行い、成功した場合にアクセストークンとユーザー情報を返す。
     """
     try:
-        auth_response = supabase.auth.sign_in_with_password(
+        auth_response = new_auth_client().sign_in_with_password(
             {"email": user_in.email, "password": user_in.password}
         )
 
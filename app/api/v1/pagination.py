@@ -0,0 +1,62 @@
+# pagination.py
+# 一覧取得エンドポイント共通の、キーセット方式のページングと取得項目の指定 (fields) の処理
+from typing import Any, Dict, List, Optional, Sequence
+
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+
+# limit を省略して after / fields だけを指定した場合の件数
+PAGE_DEFAULT_LIMIT = 100
+# 1ページの最大件数
+PAGE_MAX_LIMIT = 500
+
+# fields で指定できる項目
+ITEM_FIELDS = ("id", "name", "user_id")
+STORE_FIELDS = ("id", "name", "user_id")
+RECORD_FIELDS = (
+    "id",
+    "user_id",
+    "price",
+    "purchase_date",
+    "item_id",
+    "store_id",
+    "item_name",
+    "store_name",
+    "raw_item_name",
+    "raw_store_name",
+    "raw_price",
+    "raw_purchase_date",
+)
+
+
+def is_paged(limit: Optional[int], after: Optional[int], fields: Optional[str]) -> bool:
+    """ページング・項目指定のどれかが指定されたか (無ければ従来どおり全件を返す)"""
+    return limit is not None or after is not None or fields is not None
+
+
+def parse_fields(fields: Optional[str], allowed: Sequence[str]) -> List[str]:
+    """
+    カンマ区切りの fields を検証して項目名のリストにする。省略時は全項目。
+    次ページのカーソルに使うため、id は常に含める。
+    """
+    if not fields:
+        return list(allowed)
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}",
+        )
+    return ["id"] + [field for field in dict.fromkeys(requested) if field != "id"]
+
+
+def page_response(rows: List[Dict[str, Any]], limit: int) -> JSONResponse:
+    """
+    1ページ分の行を返す。続きがありそうな場合 (limit 件ちょうど取得できた場合) は、
+    次のページの after に指定する値を X-Next-Cursor ヘッダーで返す。
+    """
+    headers = {}
+    if rows and len(rows) >= limit:
+        headers["X-Next-Cursor"] = str(rows[-1]["id"])
+    return JSONResponse(content=rows, headers=headers)
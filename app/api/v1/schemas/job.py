@@ -0,0 +1,27 @@
+# job.py
+from pydantic import BaseModel
+from datetime import datetime
+from enum import Enum
+from typing import Optional
+
+
+class JobStatus(str, Enum):
+    """バックグラウンドジョブの状態"""
+
+    PENDING = "pending"  # 受け付け済みで、まだ開始していない
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+# バックグラウンドジョブ（レスポンス）
+class Job(BaseModel):
+    """時間のかかる処理をバックグラウンドで実行する際の、受付番号と進行状況"""
+
+    id: str
+    kind: str  # 処理の種類 (e.g., "delete_all_user_data")
+    user_id: str  # ジョブを依頼したユーザー
+    status: JobStatus = JobStatus.PENDING
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None  # 失敗した場合の理由
@@ -1,5 +1,5 @@
 # record.py
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from datetime import date
 from typing import List, Optional
 
@@ -73,6 +73,28 @@ class RecordCreate(BaseModel):
         populate_by_name = True
 
 
+# レシート一括確定（リクエスト）：1行分
+class ReceiptLineCreate(RecordCreate):
+    """
+    レシートを一括で確定する際の1行分の登録データ。
+    既存の商品・店舗は item_id / store_id で、新規のものは item_name / store_name で指定する。
+    (名称で指定した場合、同名のものが既にあればそれを使い、無ければ新規登録する)
+    """
+
+    item_id: Optional[int] = None
+    item_name: Optional[str] = Field(None, max_length=255)
+    store_id: Optional[int] = None
+    store_name: Optional[str] = Field(None, max_length=255)
+
+    @model_validator(mode="after")
+    def check_item_and_store(self):
+        if self.item_id is None and not self.item_name:
+            raise ValueError("item_id または item_name のどちらかが必要です")
+        if self.store_id is None and not self.store_name:
+            raise ValueError("store_id または store_name のどちらかが必要です")
+        return self
+
+
 # 購入履歴（レスポンス）
 class Record(BaseModel):
     """データベースから取得した購入履歴"""
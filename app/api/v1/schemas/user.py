@@ -1,13 +1,17 @@
 # user.py
 from pydantic import BaseModel, Field
 
+# ユーザー名・メールアドレスの最大文字数
+USERNAME_MAX_LENGTH = 50
+EMAIL_MAX_LENGTH = 100
+
 
 # 共通ベーススキーマ
 class UserBase(BaseModel):
     """ユーザーの基本的な情報"""
 
-    username: str = Field(..., max_length=50)
-    email: str = Field(..., max_length=100)
+    username: str = Field(..., max_length=USERNAME_MAX_LENGTH)
+    email: str = Field(..., max_length=EMAIL_MAX_LENGTH)
 
 
 # ユーザー登録（リクエスト）
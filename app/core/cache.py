@@ -0,0 +1,264 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    エントリごとに有効期限を持つ、スレッドセーフなインプロセスLRUキャッシュ。
+    最大件数を超えた場合は、最も長く参照されていないエントリから削除する。
+    ヒット・ミス数を数えており、stats() で確認できる。
+    """
+
+    def __init__(self, max_size: int, default_ttl: float):
+        """
+        :param max_size: 保持するエントリの最大数
+        :param default_ttl: set() で ttl を省略した場合の有効期限（秒）
+        """
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """有効期限内のエントリを返す。無い場合や期限切れの場合は default を返す。"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                # 期限切れのエントリはここで捨てる
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """
+        有効期限内のエントリを返す。get() と違い、ヒット・ミス数やLRUの順序には影響しない。
+        キャッシュ済みの値をその場で更新する場合などに使う。
+        """
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """エントリを登録する。ttl が0以下の場合は何もしない。"""
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """エントリを削除し、その値を返す（期限切れかどうかは問わない）。"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self) -> None:
+        """全エントリを削除する（統計値はそのまま残す）。"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        """ヒット・ミス数などの統計値を返す。"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._data),
+            "max_size": self.max_size,
+        }
+
+
+class DiskLRUCache:
+    """
+    値をJSONファイルとしてディレクトリに保存する、スレッドセーフなLRUキャッシュ。
+    ファイルの合計サイズが max_bytes を超えた場合は、最も長く参照されていないエントリから削除する。
+    同じディレクトリを複数のプロセス (ワーカー) で共有でき、プロセスを再起動しても内容は残る
+    (参照順は各ファイルの更新日時で共有・復元する)。
+    ヒット・ミス数を数えており、stats() で確認できる。
+    """
+
+    # キーはそのままファイル名に使うため、英数字・ハイフン・アンダースコアのみ
+    _KEY_PATTERN = re.compile(r"[0-9A-Za-z_-]+")
+
+    def __init__(self, directory: str, max_bytes: int):
+        """
+        :param directory: 保存先のディレクトリ (初めて set() した時に作成する)
+        :param max_bytes: 保持するファイルの合計サイズの上限 (バイト)
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # キー -> ファイルサイズ (参照の古い順)。初めて使う時にディレクトリから読み込む
+        self._index: Optional["OrderedDict[str, int]"] = None
+        self._bytes = 0
+        self._last_touch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key: str) -> str:
+        if not self._KEY_PATTERN.fullmatch(key):
+            raise ValueError(f"Invalid cache key: {key!r}")
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _scan(self) -> "OrderedDict[str, int]":
+        # ロックを取得した状態で呼び出す。
+        # 他のプロセス (ワーカー) が書き込んだ・削除したエントリも反映するため、ディレクトリから読み直す
+        entries = []
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                key = entry.name[: -len(".json")]
+                if entry.name.endswith(".json") and self._KEY_PATTERN.fullmatch(key):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        # 読み直している間に削除された
+                        continue
+                    entries.append((stat.st_mtime, key, stat.st_size))
+        entries.sort()
+        self._index = OrderedDict((key, size) for _, key, size in entries)
+        self._bytes = sum(size for _, _, size in entries)
+        return self._index
+
+    def _load_index(self) -> "OrderedDict[str, int]":
+        # ロックを取得した状態で呼び出す
+        if self._index is None:
+            return self._scan()
+        return self._index
+
+    def _touch(self, path: str) -> None:
+        # ロックを取得した状態で呼び出す。参照順を他のプロセスと共有するため、更新日時を参照した時刻にする
+        # (自動で付く更新日時は粒度が粗く、続けて書き込むと同じ値になることがあるため、ナノ秒で明示的に設定する)
+        now = max(time.time_ns(), self._last_touch + 1)
+        self._last_touch = now
+        os.utime(path, ns=(now, now))
+
+    def _remove(self, key: str) -> None:
+        # ロックを取得した状態で呼び出す
+        self._bytes -= self._load_index().pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        エントリを返す。無い場合や読み込めない場合は default を返す。
+        他のプロセスが書き込んだエントリも読めるよう、インデックスに無いキーもファイルを確認する。
+        """
+        path = self._path(key)
+        with self._lock:
+            index = self._load_index()
+            try:
+                with open(path, "rb") as f:
+                    size = os.fstat(f.fileno()).st_size
+                    value = json.load(f)
+            except FileNotFoundError:
+                # 未登録、または他のプロセスが削除した
+                self._bytes -= index.pop(key, 0)
+            except (OSError, ValueError):
+                # 書き込み途中で壊れたなど
+                self._remove(key)
+            else:
+                self._bytes += size - index.pop(key, 0)
+                index[key] = size
+                try:
+                    self._touch(path)
+                except OSError:
+                    pass
+                self.hits += 1
+                return value
+            self.misses += 1
+            return default
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        エントリを登録する。1件で max_bytes を超える場合は何もしない。
+        合計サイズは他のプロセスが書き込んだ分も含めてディレクトリから数え直し、超えた分を古い順に削除する。
+        """
+        path = self._path(key)
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            temp_path = None
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                # 読み込み中のプロセスが書きかけのファイルを読まないよう、別名で書いてから置き換える
+                with tempfile.NamedTemporaryFile(dir=self.directory, suffix=".tmp", delete=False) as f:
+                    temp_path = f.name
+                    f.write(data)
+                os.replace(temp_path, path)
+                temp_path = None
+                self._touch(path)
+            except OSError as e:
+                print(f"Error writing disk cache entry: {e}")
+                return
+            finally:
+                # 書き込み・置き換えに失敗した一時ファイルを残さない
+                if temp_path is not None:
+                    try:
+                        os.remove(temp_path)
+                    except OSError:
+                        pass
+            index = self._scan()
+            while self._bytes > self.max_bytes and len(index) > 1:
+                oldest = next(iter(index))
+                if oldest == key:
+                    # 更新日時が同じ場合でも、登録したばかりのエントリは削除しない
+                    index.move_to_end(key)
+                    continue
+                self._remove(oldest)
+                self.evictions += 1
+
+    def pop(self, key: str) -> None:
+        """エントリを削除する（存在しない場合は何もしない）。"""
+        with self._lock:
+            self._remove(key)
+
+    def clear(self) -> None:
+        """全エントリを削除する（統計値はそのまま残す）。"""
+        with self._lock:
+            for key in list(self._scan()):
+                self._remove(key)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._scan())
+
+    def stats(self) -> Dict[str, int]:
+        """ヒット・ミス数などの統計値を返す。"""
+        with self._lock:
+            index = self._scan()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(index),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
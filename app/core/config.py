@@ -1,6 +1,7 @@
 import os
+import tempfile
 from pydantic_settings import BaseSettings
-from typing import ClassVar
+from typing import ClassVar, List, Optional
 
 
 class Settings(BaseSettings):
@@ -18,14 +19,76 @@ class Settings(BaseSettings):
     SUPABASE_URL: str
     SUPABASE_KEY: str  # Anon Key
 
+    # Supabaseへの HTTP 接続設定 (全モジュールで1つのコネクションプールを共有する)
+    SUPABASE_HTTP_MAX_CONNECTIONS: int = 100  # プール全体の最大同時接続数
+    SUPABASE_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20  # keep-alive で保持する接続数
+    SUPABASE_HTTP_KEEPALIVE_EXPIRY: float = 30.0  # アイドル接続を保持する秒数
+    SUPABASE_HTTP2: bool = True  # HTTP/2 で接続を多重化する (h2 パッケージが必要)
+    SUPABASE_HTTP_TIMEOUT: float = 10.0  # 読み書きのタイムアウト秒数
+    SUPABASE_HTTP_CONNECT_TIMEOUT: float = 5.0  # 接続確立のタイムアウト秒数
+
     # SupabaseのSettings -> API -> Project JWT Secret にある値
     SUPABASE_JWT_SECRET: str  # FastAPIがトークンを検証するために使用。
     # 追記: JWTの検証アルゴリズム (Supabaseは通常 HS256)
     JWT_ALGORITHM: str = "HS256"
+    # JWTのaudクレーム (Supabaseのログインユーザーは "authenticated")
+    JWT_AUDIENCE: str = "authenticated"
+    # JWTのissクレーム。未設定の場合は f"{SUPABASE_URL}/auth/v1" を使用する
+    JWT_ISSUER: Optional[str] = None
+    # True の場合、JWTをローカルで検証する (Supabase Authへの問い合わせを行わない)
+    JWT_VERIFY_LOCALLY: bool = True
+    # ローカル検証に失敗した場合に、Supabase Authへの問い合わせで再検証するか
+    JWT_REMOTE_FALLBACK: bool = False
+
+    # 運用者のユーザーID (Supabase AuthのUUID)。/stats などの運用向けAPIにアクセスできる
+    # 環境変数ではJSONの配列で指定する (e.g., ADMIN_USER_IDS='["uuid1", "uuid2"]')
+    ADMIN_USER_IDS: List[str] = []
+
+    # トークン検証結果のキャッシュ設定
+    TOKEN_CACHE_ENABLED: bool = True
+    TOKEN_CACHE_MAX_SIZE: int = 10000  # キャッシュするトークンの最大数
+    TOKEN_CACHE_MAX_TTL: float = 300.0  # 検証成功の最大保持秒数 (トークンのexpが先に来ればそちらまで)
+    TOKEN_CACHE_NEGATIVE_TTL: float = 10.0  # 検証失敗を保持する秒数
+
+    # ユーザーごとの商品・店舗一覧 (カタログ) のキャッシュ設定
+    # キャッシュはワーカープロセスごとにあり、他のワーカーでの変更は TTL が切れるまで反映されない。
+    # そのため名寄せ・サジェストにのみ使い、商品・店舗一覧のAPIは毎回DBから取得する
+    CATALOG_CACHE_TTL: float = 600.0  # カタログを保持する秒数
+    CATALOG_CACHE_MAX_ENTRIES: int = 2000  # 保持するカタログの最大数 (ユーザー数 x 商品/店舗)
+
+    # 全データ削除 (DELETE /items/data) の設定
+    DELETE_BATCH_SIZE: int = 5000  # 1回のDB呼び出しで削除する最大行数 (0 の場合は全件を1トランザクションで削除)
+    # バックグラウンドジョブの設定 (状態はDBの jobs テーブルに保存し、全ワーカーで共有する)
+    JOB_RESULT_TTL: float = 3600.0  # 終了したジョブの状態を保持する秒数
+    JOB_TIMEOUT: float = 3600.0  # 開始からこの秒数を過ぎても終わらないジョブは、ワーカーが停止したとみなして失敗にする
 
     # OCR関係
     OCR_ENDPOINT: str
     OCR_KEY: str
+    OCR_HTTP_MAX_CONNECTIONS: int = 20  # OCR APIへの最大同時接続数
+    OCR_HTTP_TIMEOUT: float = 30.0  # 1リクエストあたりのタイムアウト秒数 (画像の送信を含む)
+    OCR_POLL_TIMEOUT: float = 30.0  # 解析結果を待つ最大秒数
+    OCR_POLL_INITIAL_INTERVAL: float = 0.25  # 結果確認の最初の間隔 (秒)
+    OCR_POLL_MAX_INTERVAL: float = 2.0  # 結果確認の間隔の上限 (秒)
+    OCR_POLL_BACKOFF: float = 1.5  # 結果確認のたびに間隔を何倍にするか
+    # OCR結果のキャッシュ (同じ画像の再アップロードでは、OCR APIを呼び出さない)
+    OCR_CACHE_ENABLED: bool = True
+    OCR_CACHE_DIR: str = os.path.join(tempfile.gettempdir(), "my-groceries-ocr-cache")  # 保存先
+    OCR_CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # キャッシュの合計サイズの上限 (バイト)
+    # 同じレシートを撮り直した画像 (知覚ハッシュが近いもの) にも、以前のOCR結果を使う
+    OCR_NEAR_DUPLICATE_ENABLED: bool = True
+    # 256ビットのハッシュのうち、異なるビット数がこれ以下なら同じレシート
+    # (レシート部分のハッシュで、撮り直しは 12 以下、同じ背景で撮った別のレシートは 76 以上だった)
+    OCR_NEAR_DUPLICATE_MAX_DISTANCE: int = 16
+    OCR_NEAR_DUPLICATE_TTL: float = 3600.0  # 撮り直しとみなす時間 (秒)
+    OCR_NEAR_DUPLICATE_PER_USER: int = 50  # ユーザーごとに比較する直近の画像の数
+    # OCR APIに送る前の画像の前処理 (グレースケール化・レシート部分の切り抜き・縮小・再圧縮)
+    OCR_PREPROCESS_ENABLED: bool = True
+    OCR_PREPROCESS_TARGET_DPI: int = 300  # 切り抜いたレシートを縮小するときの解像度
+    OCR_PREPROCESS_RECEIPT_WIDTH_MM: float = 80.0  # 解像度の換算に使うレシート用紙の幅 (mm)
+    OCR_PREPROCESS_MAX_DIMENSION: int = 2048  # レシートを切り抜けなかった場合の長辺の上限 (px)
+    OCR_PREPROCESS_FORMAT: str = "jpeg"  # 圧縮し直す形式 ("jpeg" または "png")
+    OCR_PREPROCESS_JPEG_QUALITY: int = 85  # JPEG の画質 (0〜100)
 
     class Config:
         # .envファイルから環境変数を読み込む設定
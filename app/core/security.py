@@ -1,18 +1,140 @@
+import hashlib
+import time
+from typing import Optional
+
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from jose import jwt, JWTError
+from jose.exceptions import ExpiredSignatureError
+from pydantic import ValidationError
 
+from app.core.cache import TTLCache
 from app.core.config import settings
-from app.api.v1.schemas.user import User
+from app.api.v1.schemas.user import EMAIL_MAX_LENGTH, USERNAME_MAX_LENGTH, User
 # db_managerはもう不要になります
 # from app.services import db_manager
 
-# Supabaseクライアントをインポート
-from supabase import create_client, Client
+# 共有のSupabaseクライアントをインポート
+from app.db.client import get_supabase
 
 bearer_scheme = HTTPBearer()
 
-# Supabaseクライアントを初期化
-supabase: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+# トークン検証結果のキャッシュ (キーはトークンのSHA-256ハッシュ)
+# 値は検証済みのUser、または検証に失敗したことを表す _INVALID_TOKEN
+token_cache = TTLCache(
+    max_size=settings.TOKEN_CACHE_MAX_SIZE, default_ttl=settings.TOKEN_CACHE_MAX_TTL
+)
+_INVALID_TOKEN = object()
+
+
+def _jwt_issuer() -> str:
+    """JWTのissクレームとして期待する値を返す。"""
+    if settings.JWT_ISSUER:
+        return settings.JWT_ISSUER
+    return f"{settings.SUPABASE_URL.rstrip('/')}/auth/v1"
+
+
+def _build_user(user_id, email: Optional[str], user_metadata: Optional[dict]) -> User:
+    """
+    検証済みのトークンの情報から User を構築する。
+    user_metadata.username はユーザーが自由に設定できるため、文字列でない場合や長すぎる場合はメールアドレスを使い、
+    それでも User の上限を超える分は切り詰める (正しいトークンを持つユーザーを締め出さないため)。
+    """
+    email = email or ""
+    username = (user_metadata or {}).get("username")
+    if not isinstance(username, str) or not username or len(username) > USERNAME_MAX_LENGTH:
+        username = email
+    return User(
+        id=str(user_id),
+        email=email[:EMAIL_MAX_LENGTH],
+        username=username[:USERNAME_MAX_LENGTH],
+        is_active=True,
+    )
+
+
+def _verify_token_locally(token: str) -> User:
+    """
+    JWTの署名・exp・aud・iss をローカルで検証し、クレームから直接Userモデルを構築する。
+    Supabase Authへのネットワーク往復は発生しない。
+    """
+    claims = jwt.decode(
+        token,
+        settings.SUPABASE_JWT_SECRET,
+        algorithms=[settings.JWT_ALGORITHM],
+        audience=settings.JWT_AUDIENCE,
+        issuer=_jwt_issuer(),
+    )
+
+    user_id = claims.get("sub")
+    if not user_id:
+        raise JWTError("Token has no 'sub' claim")
+
+    return _build_user(user_id, claims.get("email"), claims.get("user_metadata"))
+
+
+def _verify_token_remotely(token: str) -> User:
+    """
+    Supabase Authにトークンを問い合わせて検証し、その応答からUserモデルを構築する。
+    """
+    # Supabaseに「このトークンは本物ですか？」と直接問い合わせる
+    user_response = get_supabase().auth.get_user(token)
+
+    if not user_response or not user_response.user:
+        raise JWTError("Supabase returned no user for the token")
+
+    auth_user = user_response.user
+
+    # 内部DBを見に行かず、Supabaseの応答から直接Userを構築
+    return _build_user(auth_user.id, auth_user.email, auth_user.user_metadata)
+
+
+def _is_rejection(e: Exception) -> bool:
+    """
+    トークン自体が不正であることが確定したエラーか。
+    署名不正・期限切れ (JWTError) や、Supabase Authが 4xx で拒否した場合は True。
+    クレームから User を構築できない場合 (ValidationError) も、何度検証しても同じ結果になるため True。
+    通信エラーや Supabase Auth の 5xx・429 など、時間をおけば成功しうるエラーは False。
+    """
+    if isinstance(e, (JWTError, ValidationError)):
+        return True
+    # Supabase Authのエラー (AuthApiError) は HTTP ステータスを status に持つ
+    # (通信エラー・5xx は AuthRetryableError になり、status は 0 または 5xx)
+    auth_status = getattr(e, "status", None)
+    return isinstance(auth_status, int) and 400 <= auth_status < 500 and auth_status != 429
+
+
+def _token_cache_key(token: str) -> str:
+    """トークンそのものをメモリに残さないよう、ハッシュ値をキーにする。"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _token_cache_ttl(token: str) -> float:
+    """検証済みトークンのキャッシュ秒数。トークンのexpと TOKEN_CACHE_MAX_TTL の早い方まで。"""
+    try:
+        exp: Optional[int] = jwt.get_unverified_claims(token).get("exp")
+    except JWTError:
+        exp = None
+    if exp is None:
+        return settings.TOKEN_CACHE_MAX_TTL
+    return min(exp - time.time(), settings.TOKEN_CACHE_MAX_TTL)
+
+
+def _verify_token(token: str) -> User:
+    """
+    JWT_VERIFY_LOCALLY が有効な場合はローカルで検証し、
+    JWT_REMOTE_FALLBACK が有効な場合に限り、失敗時にSupabaseへの問い合わせで再検証する。
+    """
+    if settings.JWT_VERIFY_LOCALLY:
+        try:
+            return _verify_token_locally(token)
+        except ExpiredSignatureError:
+            # 期限切れはSupabaseに問い合わせても結果は同じなので、再検証しない
+            raise
+        except JWTError:
+            if not settings.JWT_REMOTE_FALLBACK:
+                raise
+
+    return _verify_token_remotely(token)
 
 
 # 🚨 Supabase JWT 検証と認可のメインロジック 🚨
@@ -20,37 +142,57 @@ def get_current_active_user(
     credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
 ) -> User:
     """
-    リクエストヘッダーからJWTを取得し、Supabaseに問い合わせてユーザー情報を検証し、
-    その情報から直接Userモデルを構築する。
+    リクエストヘッダーからJWTを取得して検証し、その情報から直接Userモデルを構築する。
+    検証結果（失敗を含む）はトークンごとにキャッシュし、同じトークンの再検証を省く。
+    Supabase Authに問い合わせられなかった場合は、キャッシュせずに 503 を返す。
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials (Token invalid or expired)",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
+
     token = credentials.credentials
-    
-    try:
-        # Supabaseに「このトークンは本物ですか？」と直接問い合わせる
-        user_response = supabase.auth.get_user(token)
-        
-        if not user_response or not user_response.user:
+
+    use_cache = settings.TOKEN_CACHE_ENABLED
+    cache_key = _token_cache_key(token)
+
+    # 同じトークンの再検証を避けるため、まずキャッシュを確認する
+    if use_cache:
+        cached = token_cache.get(cache_key)
+        if cached is _INVALID_TOKEN:
             raise credentials_exception
+        if cached is not None:
+            return cached
 
-        auth_user = user_response.user
-        
-        # ▼▼▼【最重要修正】内部DBを見に行かず、Supabaseの応答から直接Userを構築▼▼▼
-        # これで、public.usersテーブルが不要になります。
-        user = User(
-            id=str(auth_user.id),
-            email=auth_user.email,
-            username=auth_user.user_metadata.get("username", auth_user.email),
-            is_active=True
-        )
-        return user
-            
+    try:
+        user = _verify_token(token)
     except Exception as e:
-        # Supabaseからの応答がエラーだった場合など
         print(f"Supabase Token Validation Error: {e}")
-        raise credentials_exception
\ No newline at end of file
+        if not _is_rejection(e):
+            # 通信エラーなど。正しいユーザーを締め出さないよう、失敗としてキャッシュしない
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Could not validate credentials (authentication service unavailable)",
+            )
+        # 署名不正・期限切れ、またはSupabaseがトークンを拒否した場合
+        if use_cache:
+            # 不正なクライアントが検証の負荷を増幅できないよう、失敗も短時間キャッシュする
+            token_cache.set(
+                cache_key, _INVALID_TOKEN, ttl=settings.TOKEN_CACHE_NEGATIVE_TTL
+            )
+        raise credentials_exception
+
+    if use_cache:
+        token_cache.set(cache_key, user, ttl=_token_cache_ttl(token))
+    return user
+
+
+def get_current_admin_user(current_user: User = Depends(get_current_active_user)) -> User:
+    """
+    運用者 (ADMIN_USER_IDS に含まれるユーザー) のみを通す。
+    ADMIN_USER_IDS が空の場合は、誰もアクセスできない。
+    """
+    if current_user.id not in settings.ADMIN_USER_IDS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin privileges required.")
+    return current_user
@@ -0,0 +1,132 @@
+"""
+Supabaseクライアントの共有ファクトリ。
+
+DBアクセス・トークン検証・管理者APIのすべてが、ここで生成する1つのクライアント
+（同期版・非同期版それぞれ1つずつ）を共有する。クライアントは最初に使われた時点で生成し、
+FastAPIの lifespan 終了時に close() / aclose() でコネクションプールを閉じる。
+"""
+import threading
+from typing import Optional
+
+import httpx
+from supabase import (
+    AsyncClient,
+    AsyncClientOptions,
+    Client,
+    ClientOptions,
+    SupabaseAuthClient,
+    create_client,
+)
+
+from app.core.config import settings
+
+_lock = threading.Lock()
+_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+_supabase: Optional[Client] = None
+_async_supabase: Optional[AsyncClient] = None
+
+
+def _http_options() -> dict:
+    """同期・非同期で共通の、コネクションプールとタイムアウトの設定。"""
+    return {
+        "limits": httpx.Limits(
+            max_connections=settings.SUPABASE_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.SUPABASE_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.SUPABASE_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(
+            settings.SUPABASE_HTTP_TIMEOUT,
+            connect=settings.SUPABASE_HTTP_CONNECT_TIMEOUT,
+        ),
+        "http2": settings.SUPABASE_HTTP2,
+    }
+
+
+def _get_http_client() -> httpx.Client:
+    global _http_client
+    if _http_client is None:
+        with _lock:
+            if _http_client is None:
+                _http_client = httpx.Client(**_http_options())
+    return _http_client
+
+
+def get_supabase() -> Client:
+    """共有の同期Supabaseクライアントを返す（初回呼び出し時に生成する）。"""
+    global _supabase
+    if _supabase is None:
+        http_client = _get_http_client()
+        with _lock:
+            if _supabase is None:
+                _supabase = create_client(
+                    settings.SUPABASE_URL,
+                    settings.SUPABASE_KEY,
+                    options=ClientOptions(
+                        httpx_client=http_client,
+                        auto_refresh_token=False,
+                        persist_session=False,
+                    ),
+                )
+    return _supabase
+
+
+def get_async_supabase() -> AsyncClient:
+    """共有の非同期Supabaseクライアントを返す（初回呼び出し時に生成する）。"""
+    global _async_http_client, _async_supabase
+    if _async_supabase is None:
+        with _lock:
+            if _async_supabase is None:
+                _async_http_client = httpx.AsyncClient(**_http_options())
+                _async_supabase = AsyncClient(
+                    settings.SUPABASE_URL,
+                    settings.SUPABASE_KEY,
+                    options=AsyncClientOptions(
+                        httpx_client=_async_http_client,
+                        auto_refresh_token=False,
+                        persist_session=False,
+                    ),
+                )
+    return _async_supabase
+
+
+def new_auth_client() -> SupabaseAuthClient:
+    """
+    ログイン・新規登録用の認証クライアントを生成する。
+
+    sign_in_with_password などはクライアントにセッションを保存し、以降のリクエストの
+    Authorizationヘッダーを書き換えてしまうため、共有クライアントでは行わない。
+    その代わり、コネクションプールは共有クライアントと同じものを使う。
+    """
+    return SupabaseAuthClient(
+        url=f"{settings.SUPABASE_URL.rstrip('/')}/auth/v1",
+        headers={
+            "apiKey": settings.SUPABASE_KEY,
+            "Authorization": f"Bearer {settings.SUPABASE_KEY}",
+        },
+        auto_refresh_token=False,
+        persist_session=False,
+        http_client=_get_http_client(),
+    )
+
+
+def close() -> None:
+    """同期クライアントのコネクションプールを閉じる。"""
+    global _http_client, _supabase
+    with _lock:
+        if _http_client is not None:
+            _http_client.close()
+        _http_client = None
+        _supabase = None
+
+
+async def aclose() -> None:
+    """同期・非同期両方のクライアントのコネクションプールを閉じる。"""
+    global _async_http_client, _async_supabase
+    with _lock:
+        http_client = _async_http_client
+        _async_http_client = None
+        _async_supabase = None
+    if http_client is not None:
+        await http_client.aclose()
+    close()
@@ -1,8 +1,7 @@
-from typing import List, Optional, Any, Dict
-from supabase import create_client, Client
-from postgrest import APIResponse
+from typing import List, Optional, Any, Dict, Tuple
+from postgrest import APIError, APIResponse
 import json
-from datetime import date
+from datetime import date, datetime, timezone
 
 from app.core.config import settings
 
@@ -10,13 +9,71 @@ from app.core.config import settings
 from app.api.v1.schemas.user import User
 from app.api.v1.schemas.item import Item, ItemCreate
 from app.api.v1.schemas.store import Store, StoreCreate
-from app.api.v1.schemas.record import Record, RecordCreate, PriceComparison
+from app.api.v1.schemas.record import Record, RecordCreate, ReceiptLineCreate, PriceComparison
+from app.api.v1.schemas.job import Job, JobStatus
 
 from app.db import database # 専門職人(database.py)をインポート
 
-# Supabaseクライアントを初期化
-# settingsオブジェクトから安全にURLとキーを読み込みます
-supabase: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+# 共有のSupabaseクライアント (初回呼び出し時に生成される)
+from app.db.client import get_supabase
+
+
+# --- 0. 共通ヘルパー ---
+
+# PostgreSQL の一意制約違反のエラーコード
+UNIQUE_VIOLATION = "23505"
+
+
+class DuplicateNameError(Exception):
+    """変更後の名称が、同じユーザーの別の商品・店舗と (正規化すると) 同じになる"""
+
+
+def _is_unique_violation(e: APIError) -> bool:
+    return e.code == UNIQUE_VIOLATION
+
+# 購入履歴を、関連する商品名・店舗名と一緒に取得するための select 句
+RECORD_SELECT = "*, items!inner(name), stores!inner(name)"
+# エクスポート用に購入履歴を取得するための select 句 (id は次のページのカーソルに使う)
+EXPORT_SELECT = "id, purchase_date, price, raw_item_name, items:items(name), stores:stores(name)"
+
+
+def _single_row(data: Any) -> Optional[Dict[str, Any]]:
+    """RPCの戻り値 (1行を返す関数はオブジェクト、それ以外は配列) から最初の1行を取り出す。"""
+    if isinstance(data, list):
+        return data[0] if data else None
+    return data or None
+
+
+def _to_record(r: Dict[str, Any]) -> Record:
+    """JOINで取得した購入履歴の行 (items/stores がネスト) を、フラットなRecordに整形する。"""
+    r["item_name"] = r["items"]["name"]
+    r["store_name"] = r["stores"]["name"]
+    return Record(**r)
+
+
+def _to_record_row(r: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    """JOINで取得した購入履歴の行から、指定された項目だけをフラットな辞書にする。"""
+    row = dict(r)
+    row["item_name"] = r["items"]["name"]
+    row["store_name"] = r["stores"]["name"]
+    return {field: row[field] for field in fields}
+
+
+def _record_page_select(fields: List[str]) -> str:
+    """購入履歴の項目指定から select 句を作る (商品名・店舗名は常にJOINして、絞り込み条件を変えない)。"""
+    columns = [field for field in fields if field not in ("item_name", "store_name")]
+    return ", ".join(columns + ["items!inner(name)", "stores!inner(name)"])
+
+
+def _to_export_row(r: Dict[str, Any]) -> Dict[str, Any]:
+    """エクスポート用に取得した購入履歴の行を、CSV出力に適した形式に整形する。"""
+    return {
+        "購入日": r["purchase_date"],
+        "価格": r["price"],
+        "商品名（レシート表記）": r["raw_item_name"],
+        "商品名（標準）": r["items"]["name"] if r.get("items") else "",
+        "店舗名": r["stores"]["name"] if r.get("stores") else "",
+    }
 
 
 # --- 1. ユーザー (User) 関連 ---
@@ -26,6 +83,7 @@ def create_user_internal(user_uuid: str, email: str, username: str) -> Optional[
     """
     Supabaseで認証された後のユーザーの内部DBレコード(public.users)を初期登録する。
     """
+    supabase = get_supabase()
     try:
         response: APIResponse = supabase.table('users').insert({
             "id": user_uuid,  # Supabase AuthのUUIDを主キーとして使用
@@ -57,6 +115,7 @@ def get_user_by_uuid(user_uuid: str) -> Optional[User]:
     """
     UUIDに基づき、管理者権限でauth.usersテーブルから直接ユーザーレコードを取得する。
     """
+    supabase = get_supabase()
     try:
         # admin を呼び出して、auth のユーザー情報を取得
         response = supabase.auth.admin.get_user_by_id(user_uuid)
@@ -75,15 +134,22 @@ def get_user_by_uuid(user_uuid: str) -> Optional[User]:
         return None
 
 
-def delete_all_user_data(user_uuid: str) -> bool:
+def delete_all_user_data(user_uuid: str, batch_size: Optional[int] = None) -> bool:
     """
     ユーザーに紐づく全てのデータと、auth.usersのユーザー本体を削除する。
+    publicスキーマのデータは delete_user_data RPC で削除する。
+    batch_size を省略した場合は全件を1トランザクションで、指定した場合は batch_size 行ずつ
+    (1回の呼び出しごとに1トランザクションで) 削除し終えるまで呼び出しを繰り返す。
     """
+    supabase = get_supabase()
     try:
-        # 関連するpublicスキーマのデータを全て削除する
-        supabase.table("purchases").delete().eq("user_id", user_uuid).execute()
-        supabase.table("items").delete().eq("user_id", user_uuid).execute()
-        supabase.table("stores").delete().eq("user_id", user_uuid).execute()
+        # 1. 関連するpublicスキーマのデータを全て削除する
+        while True:
+            response: APIResponse = supabase.rpc(
+                "delete_user_data", {"p_user_id": user_uuid, "p_batch_size": batch_size}
+            ).execute()
+            if _single_row(response.data)["done"]:
+                break
 
         # 2. admin を呼び出して auth からユーザー本体を削除する
         supabase.auth.admin.delete_user(user_uuid)
@@ -100,15 +166,16 @@ def delete_all_user_data(user_uuid: str) -> bool:
 def create_item(user_id: str, item_in: ItemCreate) -> Item:
     """
     商品を新規登録する。
+    正規化した名称が同じ商品が既にあれば、新規登録せずにそれを返す (DBの一意制約による upsert)。
     """
-    response: APIResponse = (
-        supabase.table("items")
-        .insert({"user_id": user_id, "name": item_in.name})
-        .execute()
-    )
+    supabase = get_supabase()
+    response: APIResponse = supabase.rpc(
+        "upsert_item", {"p_user_id": user_id, "p_name": item_in.name}
+    ).execute()
 
-    if response.data:
-        return Item(**response.data[0])
+    row = _single_row(response.data)
+    if row:
+        return Item(**row)
     raise Exception("Could not create item")
 
 
@@ -116,6 +183,7 @@ def get_item_by_name_and_user(user_id: str, name: str) -> Optional[Item]:
     """
     特定ユーザーのデータベースから商品名をキーに商品を取得する（名寄せに使用）。
     """
+    supabase = get_supabase()
     response: Optional[APIResponse] = (
         supabase.table("items")
         .select("*")
@@ -140,6 +208,7 @@ def get_items_by_user(user_id: str) -> List[Item]:
     """
     特定ユーザーの全商品リストを取得する。
     """
+    supabase = get_supabase()
     response: APIResponse = (
         supabase.table("items").select("*").eq("user_id", user_id).execute()
     )
@@ -148,11 +217,26 @@ def get_items_by_user(user_id: str) -> List[Item]:
         return [Item(**item) for item in response.data]
     return []
 
+def get_items_page(
+    user_id: str, fields: List[str], limit: int, after: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    特定ユーザーの商品を、ID順に after より後ろから最大 limit 件取得する (キーセット方式のページング)。
+    fields で指定した列だけを取得し、辞書のまま返す。
+    """
+    supabase = get_supabase()
+    query = supabase.table("items").select(", ".join(fields)).eq("user_id", user_id)
+    if after is not None:
+        query = query.gt("id", after)
+    response: APIResponse = query.order("id").limit(limit).execute()
+    return response.data or []
+
 
 def get_item_by_id(user_id: str, item_id: int) -> Optional[Item]:
     """
     商品IDに基づき商品を取得する。
     """
+    supabase = get_supabase()
     response: APIResponse = (
         supabase.table("items")
         .select("*")
@@ -170,14 +254,21 @@ def get_item_by_id(user_id: str, item_id: int) -> Optional[Item]:
 def update_item(user_id: str, item_id: int, item_in: ItemCreate) -> Optional[Item]:
     """
     商品情報を更新する。
+    商品名は (user_id, name_key) で一意のため、既存の商品と同じ名称にする場合は DuplicateNameError を送出する。
     """
-    response: APIResponse = (
-        supabase.table("items")
-        .update({"name": item_in.name})
-        .eq("user_id", user_id)
-        .eq("id", item_id)
-        .execute()
-    )
+    supabase = get_supabase()
+    try:
+        response: APIResponse = (
+            supabase.table("items")
+            .update({"name": item_in.name})
+            .eq("user_id", user_id)
+            .eq("id", item_id)
+            .execute()
+        )
+    except APIError as e:
+        if _is_unique_violation(e):
+            raise DuplicateNameError(item_in.name) from e
+        raise
 
     if response.data:
         return Item(**response.data[0])
@@ -188,6 +279,7 @@ def delete_item(user_id: str, item_id: int) -> bool:
     """
     商品を削除する。
     """
+    supabase = get_supabase()
     response: APIResponse = (
         supabase.table("items")
         .delete()
@@ -202,6 +294,7 @@ def search_items_by_partial_name(user_id: str, query: str) -> List[Item]:
     """
     商品名の一部が一致する商品を検索する（LIKE検索などを利用）。
     """
+    supabase = get_supabase()
     response: APIResponse = (
         supabase.table("items")
         .select("*")
@@ -221,15 +314,16 @@ def search_items_by_partial_name(user_id: str, query: str) -> List[Item]:
 def create_store(user_id: str, store_in: StoreCreate) -> Store:
     """
     店舗を新規登録する。
+    正規化した名称が同じ店舗が既にあれば、新規登録せずにそれを返す (DBの一意制約による upsert)。
     """
-    response: APIResponse = (
-        supabase.table("stores")
-        .insert({"user_id": user_id, "name": store_in.name})
-        .execute()
-    )
+    supabase = get_supabase()
+    response: APIResponse = supabase.rpc(
+        "upsert_store", {"p_user_id": user_id, "p_name": store_in.name}
+    ).execute()
 
-    if response.data:
-        return Store(**response.data[0])
+    row = _single_row(response.data)
+    if row:
+        return Store(**row)
     raise Exception("Could not create store")
 
 
@@ -237,6 +331,7 @@ def get_store_by_name_and_user(user_id: str, name: str) -> Optional[Store]:
     """
     特定ユーザーのデータベースから店舗名をキーに店舗を取得する（名寄せに使用）。
     """
+    supabase = get_supabase()
     response: APIResponse = (
         supabase.table("stores")
         .select("*")
@@ -255,6 +350,7 @@ def get_stores_by_user(user_id: str) -> List[Store]:
     """
     特定ユーザーの全店舗リストを取得する。
     """
+    supabase = get_supabase()
     response: APIResponse = (
         supabase.table("stores").select("*").eq("user_id", user_id).execute()
     )
@@ -263,11 +359,26 @@ def get_stores_by_user(user_id: str) -> List[Store]:
         return [Store(**store) for store in response.data]
     return []
 
+def get_stores_page(
+    user_id: str, fields: List[str], limit: int, after: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    特定ユーザーの店舗を、ID順に after より後ろから最大 limit 件取得する (キーセット方式のページング)。
+    fields で指定した列だけを取得し、辞書のまま返す。
+    """
+    supabase = get_supabase()
+    query = supabase.table("stores").select(", ".join(fields)).eq("user_id", user_id)
+    if after is not None:
+        query = query.gt("id", after)
+    response: APIResponse = query.order("id").limit(limit).execute()
+    return response.data or []
+
 
 def get_store_by_id(user_id: str, store_id: int) -> Optional[Store]:
     """
     店舗IDに基づき店舗を取得する。
     """
+    supabase = get_supabase()
     response: APIResponse = (
         supabase.table("stores")
         .select("*")
@@ -285,14 +396,21 @@ def get_store_by_id(user_id: str, store_id: int) -> Optional[Store]:
 def update_store(user_id: str, store_id: int, store_in: StoreCreate) -> Optional[Store]:
     """
     店舗情報を更新する。
+    店舗名は (user_id, name_key) で一意のため、既存の店舗と同じ名称にする場合は DuplicateNameError を送出する。
     """
-    response: APIResponse = (
-        supabase.table("stores")
-        .update({"name": store_in.name})
-        .eq("user_id", user_id)
-        .eq("id", store_id)
-        .execute()
-    )
+    supabase = get_supabase()
+    try:
+        response: APIResponse = (
+            supabase.table("stores")
+            .update({"name": store_in.name})
+            .eq("user_id", user_id)
+            .eq("id", store_id)
+            .execute()
+        )
+    except APIError as e:
+        if _is_unique_violation(e):
+            raise DuplicateNameError(store_in.name) from e
+        raise
 
     if response.data:
         return Store(**response.data[0])
@@ -303,6 +421,7 @@ def delete_store(user_id: str, store_id: int) -> bool:
     """
     店舗を削除する。
     """
+    supabase = get_supabase()
     response: APIResponse = (
         supabase.table("stores")
         .delete()
@@ -320,16 +439,19 @@ def create_purchase_record(user_id: str, record_in: RecordCreate) -> Record:
     """
     購入履歴を登録する。
     """
+    supabase = get_supabase()
     # 修正ポイント: mode="json" と by_alias=True を使用する
     # by_alias=True により、final_price -> price, final_purchase_date -> purchase_date に変換される
     record_dict = record_in.model_dump(mode="json", by_alias=True)
     record_dict["user_id"] = user_id  # ユーザーIDを手動で追加
 
-    response: APIResponse = supabase.table("purchases").insert(record_dict).execute()
+    # 登録した行を、関連する商品名・店舗名を含めて同じリクエストで返してもらう
+    response: APIResponse = (
+        supabase.table("purchases").insert(record_dict).select(RECORD_SELECT).execute()
+    )
 
     if response.data:
-        # 登録後、関連情報を含めて取得し直すのが確実
-        return get_record_by_id(user_id, response.data[0]["id"])
+        return _to_record(response.data[0])
     raise Exception("Could not create purchase record")
 
 
@@ -338,9 +460,10 @@ def get_records_by_item_id(user_id: str, item_id: int) -> List[Record]:
     特定商品IDに紐づく購入履歴を全て取得する（価格比較の計算に使用）。
     関連テーブルの情報も一緒に取得(JOIN)する。
     """
+    supabase = get_supabase()
     response: APIResponse = (
         supabase.table("purchases")
-        .select("*, items!inner(name), stores!inner(name)")
+        .select(RECORD_SELECT)
         .eq("user_id", user_id)
         .eq("item_id", item_id)
         .execute()
@@ -348,22 +471,37 @@ def get_records_by_item_id(user_id: str, item_id: int) -> List[Record]:
 
     if response.data:
         # ネストされたデータをフラットな構造に整形
-        records = []
-        for r in response.data:
-            r["item_name"] = r["items"]["name"]
-            r["store_name"] = r["stores"]["name"]
-            records.append(Record(**r))
-        return records
+        return [_to_record(r) for r in response.data]
     return []
 
+def get_records_page_by_item_id(
+    user_id: str, item_id: int, fields: List[str], limit: int, after: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    特定商品IDの購入履歴を、ID順に after より後ろから最大 limit 件取得する (キーセット方式のページング)。
+    fields で指定した項目だけを、フラットな辞書のリストとして返す。
+    """
+    supabase = get_supabase()
+    query = (
+        supabase.table("purchases")
+        .select(_record_page_select(fields))
+        .eq("user_id", user_id)
+        .eq("item_id", item_id)
+    )
+    if after is not None:
+        query = query.gt("id", after)
+    response: APIResponse = query.order("id").limit(limit).execute()
+    return [_to_record_row(r, fields) for r in response.data or []]
+
 
 def get_record_by_id(user_id: str, record_id: int) -> Optional[Record]:
     """
     履歴IDに基づき購入履歴を取得する。関連情報もJOINする。
     """
+    supabase = get_supabase()
     response: APIResponse = (
         supabase.table("purchases")
-        .select("*, items!inner(name), stores!inner(name)")
+        .select(RECORD_SELECT)
         .eq("user_id", user_id)
         .eq("id", record_id)
         .single()
@@ -371,10 +509,7 @@ def get_record_by_id(user_id: str, record_id: int) -> Optional[Record]:
     )
 
     if response.data:
-        r = response.data
-        r["item_name"] = r["items"]["name"]
-        r["store_name"] = r["stores"]["name"]
-        return Record(**r)
+        return _to_record(response.data)
     return None
 
 
@@ -384,17 +519,21 @@ def update_record(
     """
     購入履歴を更新する。
     """
-    record_dict = record_in.model_dump()
+    supabase = get_supabase()
+    # create_purchase_record と同じく、DBの列名 (price, purchase_date) でJSONに変換する
+    record_dict = record_in.model_dump(mode="json", by_alias=True)
+    # 更新した行を、関連する商品名・店舗名を含めて同じリクエストで返してもらう
     response: APIResponse = (
         supabase.table("purchases")
         .update(record_dict)
         .eq("user_id", user_id)
         .eq("id", record_id)
+        .select(RECORD_SELECT)
         .execute()
     )
 
     if response.data:
-        return get_record_by_id(user_id, response.data[0]["id"])
+        return _to_record(response.data[0])
     return None
 
 
@@ -402,6 +541,7 @@ def delete_record(user_id: str, record_id: int) -> bool:
     """
     購入履歴を削除する。
     """
+    supabase = get_supabase()
     response: APIResponse = (
         supabase.table("purchases")
         .delete()
@@ -412,10 +552,35 @@ def delete_record(user_id: str, record_id: int) -> bool:
     return bool(response.data)
 
 
+def confirm_receipt_batch(
+    user_id: str, lines: List[ReceiptLineCreate]
+) -> Optional[List[Record]]:
+    """
+    レシート1枚分の購入履歴をまとめて登録する。未登録の商品・店舗は名称で探し、無ければ作成する。
+    SupabaseのPostgreSQL Function (RPC) 'confirm_receipt_batch' を1回呼び出すだけで、全体が1トランザクションになる。
+    失敗した場合 (他ユーザーの商品・店舗IDが含まれる場合など) は何も登録せず None を返す。
+    """
+    supabase = get_supabase()
+    try:
+        response: APIResponse = supabase.rpc(
+            "confirm_receipt_batch",
+            {
+                "p_user_id": user_id,
+                "p_lines": [line.model_dump(mode="json", by_alias=True) for line in lines],
+            },
+        ).execute()
+    except Exception as e:
+        print(f"Error confirming receipt batch: {e}")
+        return None
+
+    return [_to_record(r) for r in response.data or []]
+
+
 def get_all_records_for_export(user_id: str) -> List[Dict[str, Any]]:
     """
     特定ユーザーの全購入履歴、関連する商品・店舗名を取得する（エクスポート機能用）。
     """
+    supabase = get_supabase()
     response: APIResponse = (
         supabase.table("purchases")
         .select(
@@ -427,25 +592,33 @@ def get_all_records_for_export(user_id: str) -> List[Dict[str, Any]]:
 
     if response.data:
         # CSV出力に適した形式に整形
-        export_data = []
-        for r in response.data:
-            export_data.append(
-                {
-                    "購入日": r["purchase_date"],
-                    "価格": r["price"],
-                    "商品名（レシート表記）": r["raw_item_name"],
-                    "商品名（標準）": r["items"]["name"] if r.get("items") else "",
-                    "店舗名": r["stores"]["name"] if r.get("stores") else "",
-                }
-            )
-        return export_data
+        return [_to_export_row(r) for r in response.data]
     return []
 
 
+def get_export_records_page(
+    user_id: str, limit: int, after: Optional[int] = None
+) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """
+    エクスポート用の購入履歴を、ID順に after より後ろから最大 limit 件取得する (キーセット方式)。
+    :return: (CSV出力に適した形式に整形した行, 次のページの after に渡す値)。最後のページなら None
+    """
+    supabase = get_supabase()
+    query = supabase.table("purchases").select(EXPORT_SELECT).eq("user_id", user_id)
+    if after is not None:
+        query = query.gt("id", after)
+    response: APIResponse = query.order("id").limit(limit).execute()
+
+    data = response.data or []
+    next_after = data[-1]["id"] if len(data) >= limit else None
+    return [_to_export_row(r) for r in data], next_after
+
+
 def get_item_store_price_averages(user_id: str, item_id: int) -> List[PriceComparison]:
     """
     SupabaseのPostgreSQL Function (RPC) を呼び出して、集計済みの結果を直接受け取る。
     """
+    supabase = get_supabase()
     # 'get_price_comparison'という名前の関数をSupabaseに依頼するだけ
     response: APIResponse = supabase.rpc(
         "get_price_comparison", {"p_user_id": user_id, "p_item_id": item_id}
@@ -454,3 +627,113 @@ def get_item_store_price_averages(user_id: str, item_id: int) -> List[PriceCompa
     if response.data:
         return [PriceComparison(**row) for row in response.data]
     return []
+
+
+# --- 5. 別名 (Alias) 関連 ---
+
+
+def get_name_aliases(user_id: str, kind: str) -> Dict[str, int]:
+    """
+    特定ユーザーの別名 (正規化済みの名称 -> 商品・店舗ID) を取得する。
+    :param kind: "items" または "stores"
+    """
+    supabase = get_supabase()
+    try:
+        response: APIResponse = (
+            supabase.table("name_aliases")
+            .select("alias_key, entity_id")
+            .eq("user_id", user_id)
+            .eq("kind", kind)
+            .execute()
+        )
+    except Exception as e:
+        # 別名が取得できなくても名寄せ自体は行えるため、空として扱う
+        print(f"Error fetching name aliases: {e}")
+        return {}
+
+    return {r["alias_key"]: r["entity_id"] for r in response.data or []}
+
+
+def record_name_alias(user_id: str, kind: str, alias_key: str, entity_id: int) -> bool:
+    """
+    別名を登録する (既にあれば使用回数と最終利用日時を更新する)。
+    SupabaseのPostgreSQL Function (RPC) 'record_name_alias' を呼び出す。
+    """
+    supabase = get_supabase()
+    try:
+        supabase.rpc(
+            "record_name_alias",
+            {
+                "p_user_id": user_id,
+                "p_kind": kind,
+                "p_alias_key": alias_key,
+                "p_entity_id": entity_id,
+            },
+        ).execute()
+        return True
+    except Exception as e:
+        print(f"Error recording name alias: {e}")
+        return False
+
+
+# --- 6. バックグラウンドジョブ (Job) 関連 ---
+
+
+def start_job(
+    user_id: str, kind: str, timeout: float, retention: float
+) -> Optional[Tuple[Job, bool]]:
+    """
+    ジョブを開始する。SupabaseのPostgreSQL Function (RPC) 'start_job' を呼び出す。
+    同じユーザー・種類の未完了ジョブがあれば新しく作らず、(そのジョブ, False) を返す。
+    開始から timeout 秒を過ぎた未完了のジョブは失敗にし、終了から retention 秒を過ぎたジョブは削除する。
+    未完了のジョブが判定の直後に終了した場合は None を返す (呼び出し側でやり直す)。
+    """
+    supabase = get_supabase()
+    response: APIResponse = supabase.rpc(
+        "start_job",
+        {
+            "p_user_id": user_id,
+            "p_kind": kind,
+            "p_timeout_seconds": timeout,
+            "p_retention_seconds": retention,
+        },
+    ).execute()
+    result = _single_row(response.data)
+    if not result or not result.get("job"):
+        return None
+    return Job(**result["job"]), bool(result["created"])
+
+
+def get_job(user_id: str, job_id: str) -> Optional[Job]:
+    """ジョブを取得する。他のユーザーのジョブや、存在しない (削除された) ジョブの場合は None"""
+    supabase = get_supabase()
+    try:
+        response: APIResponse = (
+            supabase.table("jobs")
+            .select("*")
+            .eq("id", job_id)
+            .eq("user_id", user_id)
+            .execute()
+        )
+    except Exception as e:
+        # UUIDとして正しくないIDなど
+        print(f"Error fetching job: {e}")
+        return None
+
+    if response.data:
+        return Job(**response.data[0])
+    return None
+
+
+def update_job_status(job_id: str, status: JobStatus, error: Optional[str] = None) -> bool:
+    """ジョブの状態を更新する。終了した (succeeded / failed) 場合は終了日時も記録する"""
+    values: Dict[str, Any] = {"status": status.value, "error": error}
+    if status in (JobStatus.SUCCEEDED, JobStatus.FAILED):
+        values["finished_at"] = datetime.now(timezone.utc).isoformat()
+    supabase = get_supabase()
+    try:
+        supabase.table("jobs").update(values).eq("id", job_id).execute()
+        return True
+    except Exception as e:
+        print(f"Error updating job status: {e}")
+        return False
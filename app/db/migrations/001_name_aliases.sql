@@ -0,0 +1,30 @@
+-- OCRで読み取った名称 (正規化済み) -> 商品・店舗 の対応 (別名) を保持するテーブル。
+-- /receipts/confirm で確定した購入履歴から学習し、次回以降の名寄せを類似度計算なしで行う。
+-- Supabase の SQL Editor で実行する。
+
+create table if not exists public.name_aliases (
+    user_id uuid not null references auth.users (id) on delete cascade,
+    kind text not null check (kind in ('items', 'stores')),  -- 対応先のテーブル
+    alias_key text not null,  -- text_normalizer.canonical_key で正規化した名称
+    entity_id bigint not null,  -- items.id または stores.id
+    use_count integer not null default 1,  -- 同じ対応が確定された回数
+    last_used_at timestamptz not null default now(),
+    primary key (user_id, kind, alias_key)
+);
+
+-- 別名を登録する。既にあれば回数と最終利用日時を更新し、対応先が変わった場合は回数を数え直す。
+create or replace function public.record_name_alias(
+    p_user_id uuid,
+    p_kind text,
+    p_alias_key text,
+    p_entity_id bigint
+) returns void
+language sql
+as $$
+    insert into public.name_aliases as a (user_id, kind, alias_key, entity_id)
+    values (p_user_id, p_kind, p_alias_key, p_entity_id)
+    on conflict (user_id, kind, alias_key) do update
+    set entity_id = excluded.entity_id,
+        use_count = case when a.entity_id = excluded.entity_id then a.use_count + 1 else 1 end,
+        last_used_at = now();
+$$;
@@ -0,0 +1,88 @@
+-- レシート1枚分の購入履歴を、1回のRPC (1トランザクション) でまとめて登録する関数。
+-- /receipts/confirm/batch から呼び出す。Supabase の SQL Editor で実行する。
+--
+-- p_lines は ReceiptLineCreate を JSON にした配列。各行の商品・店舗は
+--   item_id / store_id が指定されていればそれを (他ユーザーのものならエラー)、
+--   無ければ item_name / store_name で既存のものを探し、無ければ新規登録して使う。
+-- 戻り値は登録した購入履歴の行で、他の取得処理と同じく items(name) / stores(name) をネストした JSON。
+-- 途中でエラーになった場合は全体がロールバックされる。
+
+create or replace function public.confirm_receipt_batch(
+    p_user_id uuid,
+    p_lines jsonb
+) returns setof jsonb
+language plpgsql
+as $$
+declare
+    line jsonb;
+    v_item_id bigint;
+    v_item_name text;
+    v_store_id bigint;
+    v_store_name text;
+    v_purchase public.purchases%rowtype;
+begin
+    for line in select value from jsonb_array_elements(p_lines) loop
+        -- 店舗
+        v_store_id := (line ->> 'store_id')::bigint;
+        if v_store_id is not null then
+            select s.name into v_store_name
+            from public.stores s
+            where s.id = v_store_id and s.user_id = p_user_id;
+            if not found then
+                raise exception 'store % not found', v_store_id;
+            end if;
+        else
+            v_store_name := line ->> 'store_name';
+            select s.id into v_store_id
+            from public.stores s
+            where s.user_id = p_user_id and s.name = v_store_name
+            order by s.id
+            limit 1;
+            if v_store_id is null then
+                insert into public.stores (user_id, name)
+                values (p_user_id, v_store_name)
+                returning id into v_store_id;
+            end if;
+        end if;
+
+        -- 商品
+        v_item_id := (line ->> 'item_id')::bigint;
+        if v_item_id is not null then
+            select i.name into v_item_name
+            from public.items i
+            where i.id = v_item_id and i.user_id = p_user_id;
+            if not found then
+                raise exception 'item % not found', v_item_id;
+            end if;
+        else
+            v_item_name := line ->> 'item_name';
+            select i.id into v_item_id
+            from public.items i
+            where i.user_id = p_user_id and i.name = v_item_name
+            order by i.id
+            limit 1;
+            if v_item_id is null then
+                insert into public.items (user_id, name)
+                values (p_user_id, v_item_name)
+                returning id into v_item_id;
+            end if;
+        end if;
+
+        -- 購入履歴 (列の型変換は jsonb_populate_record に任せる)
+        insert into public.purchases (
+            user_id, item_id, store_id, price, purchase_date,
+            raw_item_name, raw_store_name, raw_price, raw_purchase_date
+        )
+        select
+            p_user_id, v_item_id, v_store_id, r.price, r.purchase_date,
+            r.raw_item_name, r.raw_store_name, r.raw_price, r.raw_purchase_date
+        from jsonb_populate_record(null::public.purchases, line) r
+        returning * into v_purchase;
+
+        return next to_jsonb(v_purchase) || jsonb_build_object(
+            'items', jsonb_build_object('name', v_item_name),
+            'stores', jsonb_build_object('name', v_store_name)
+        );
+    end loop;
+end;
+$$;
@@ -0,0 +1,142 @@
+-- 商品・店舗を (user_id, 正規化した名称) で一意にし、名称での登録を upsert にする。
+-- 同じユーザーのレシート確定が同時に走っても、同じ商品・店舗が二重に登録されない。
+-- Supabase の SQL Editor で実行する。
+
+-- app/services/text_normalizer.py の canonical_key と同じ正規化
+-- (NFKC -> 小文字化 -> カタカナをひらがなに -> ハイフン・波ダッシュの統一 -> 空白の統一)
+create or replace function public.canonical_name_key(p_name text) returns text
+language sql
+immutable
+as $$
+    select btrim(regexp_replace(
+        translate(
+            lower(normalize(p_name, NFKC)),
+            'ァアィイゥウェエォオカガキギクグケゲコゴサザシジスズセゼソゾタダチヂッツヅテデトドナニヌネノハバパヒビピフブプヘベペホボポマミムメモャヤュユョヨラリルレロヮワヰヱヲンヴヵヶヽヾ‐‑‒–—―−〜〰',
+            'ぁあぃいぅうぇえぉおかがきぎくぐけげこごさざしじすずせぜそぞただちぢっつづてでとどなにぬねのはばぱひびぴふぶぷへべぺほぼぽまみむめもゃやゅゆょよらりるれろゎわゐゑをんゔゕゖゝゞ-------~~'
+        ),
+        '\s+', ' ', 'g'
+    ));
+$$;
+
+alter table public.items
+    add column if not exists name_key text generated always as (public.canonical_name_key(name)) stored;
+alter table public.stores
+    add column if not exists name_key text generated always as (public.canonical_name_key(name)) stored;
+
+-- 既存の重複をまとめる (最も小さいIDを残し、購入履歴と別名を付け替える)
+with d as (
+    select id, first_value(id) over (partition by user_id, name_key order by id) as keep_id
+    from public.items
+)
+update public.purchases p set item_id = d.keep_id from d where p.item_id = d.id and d.id <> d.keep_id;
+with d as (
+    select id, first_value(id) over (partition by user_id, name_key order by id) as keep_id
+    from public.items
+)
+update public.name_aliases a set entity_id = d.keep_id
+from d where a.kind = 'items' and a.entity_id = d.id and d.id <> d.keep_id;
+with d as (
+    select id, first_value(id) over (partition by user_id, name_key order by id) as keep_id
+    from public.items
+)
+delete from public.items i using d where i.id = d.id and d.id <> d.keep_id;
+
+with d as (
+    select id, first_value(id) over (partition by user_id, name_key order by id) as keep_id
+    from public.stores
+)
+update public.purchases p set store_id = d.keep_id from d where p.store_id = d.id and d.id <> d.keep_id;
+with d as (
+    select id, first_value(id) over (partition by user_id, name_key order by id) as keep_id
+    from public.stores
+)
+update public.name_aliases a set entity_id = d.keep_id
+from d where a.kind = 'stores' and a.entity_id = d.id and d.id <> d.keep_id;
+with d as (
+    select id, first_value(id) over (partition by user_id, name_key order by id) as keep_id
+    from public.stores
+)
+delete from public.stores s using d where s.id = d.id and d.id <> d.keep_id;
+
+create unique index if not exists items_user_id_name_key_idx on public.items (user_id, name_key);
+create unique index if not exists stores_user_id_name_key_idx on public.stores (user_id, name_key);
+
+-- 名称で商品を登録する。正規化した名称が同じ商品が既にあれば、それをそのまま返す。
+-- (do update は何も変えないが、これにより既存の行が returning で返る)
+create or replace function public.upsert_item(p_user_id uuid, p_name text)
+returns public.items
+language sql
+as $$
+    insert into public.items as i (user_id, name)
+    values (p_user_id, p_name)
+    on conflict (user_id, name_key) do update set name = i.name
+    returning *;
+$$;
+
+-- 名称で店舗を登録する。正規化した名称が同じ店舗が既にあれば、それをそのまま返す。
+create or replace function public.upsert_store(p_user_id uuid, p_name text)
+returns public.stores
+language sql
+as $$
+    insert into public.stores as s (user_id, name)
+    values (p_user_id, p_name)
+    on conflict (user_id, name_key) do update set name = s.name
+    returning *;
+$$;
+
+-- レシートの一括確定 (002) も、名称で指定された商品・店舗を upsert で解決するよう置き換える
+create or replace function public.confirm_receipt_batch(
+    p_user_id uuid,
+    p_lines jsonb
+) returns setof jsonb
+language plpgsql
+as $$
+declare
+    line jsonb;
+    v_item public.items%rowtype;
+    v_store public.stores%rowtype;
+    v_purchase public.purchases%rowtype;
+begin
+    for line in select value from jsonb_array_elements(p_lines) loop
+        -- 店舗
+        if line ->> 'store_id' is not null then
+            select * into v_store
+            from public.stores s
+            where s.id = (line ->> 'store_id')::bigint and s.user_id = p_user_id;
+            if not found then
+                raise exception 'store % not found', line ->> 'store_id';
+            end if;
+        else
+            v_store := public.upsert_store(p_user_id, line ->> 'store_name');
+        end if;
+
+        -- 商品
+        if line ->> 'item_id' is not null then
+            select * into v_item
+            from public.items i
+            where i.id = (line ->> 'item_id')::bigint and i.user_id = p_user_id;
+            if not found then
+                raise exception 'item % not found', line ->> 'item_id';
+            end if;
+        else
+            v_item := public.upsert_item(p_user_id, line ->> 'item_name');
+        end if;
+
+        -- 購入履歴 (列の型変換は jsonb_populate_record に任せる)
+        insert into public.purchases (
+            user_id, item_id, store_id, price, purchase_date,
+            raw_item_name, raw_store_name, raw_price, raw_purchase_date
+        )
+        select
+            p_user_id, v_item.id, v_store.id, r.price, r.purchase_date,
+            r.raw_item_name, r.raw_store_name, r.raw_price, r.raw_purchase_date
+        from jsonb_populate_record(null::public.purchases, line) r
+        returning * into v_purchase;
+
+        return next to_jsonb(v_purchase) || jsonb_build_object(
+            'items', jsonb_build_object('name', v_item.name),
+            'stores', jsonb_build_object('name', v_store.name)
+        );
+    end loop;
+end;
+$$;
@@ -0,0 +1,85 @@
+-- ユーザーの全データ (購入履歴・商品・店舗・別名) を削除する関数。
+-- DELETE /items/data のバックグラウンドジョブから呼び出す。Supabase の SQL Editor で実行する。
+--
+-- p_batch_size を省略 (null) した場合は、全件を1回の呼び出し (1トランザクション) で削除する。
+-- 指定した場合は、1回の呼び出しで最大 p_batch_size 行だけ削除して返す。
+--   done が true になるまで呼び出しを繰り返すことで、1トランザクションが長時間ロックを持ち続けない。
+--   購入履歴 -> 別名 -> 商品 -> 店舗 の順に削除するため、途中で止まっても
+--   商品・店舗を失った購入履歴 (孤立したデータ) は残らない。
+-- 戻り値は削除した行数と、全件を削除し終えたかどうか:
+--   {"purchases": n, "name_aliases": n, "items": n, "stores": n, "done": true|false}
+
+create or replace function public.delete_user_data(
+    p_user_id uuid,
+    p_batch_size integer default null
+) returns jsonb
+language plpgsql
+as $$
+declare
+    -- この呼び出しで残り何行削除できるか (null は無制限。limit null は全件の意味になる)
+    v_budget integer := p_batch_size;
+    v_purchases integer := 0;
+    v_aliases integer := 0;
+    v_items integer := 0;
+    v_stores integer := 0;
+begin
+    if p_batch_size is not null and p_batch_size <= 0 then
+        raise exception 'p_batch_size must be positive';
+    end if;
+
+    -- 購入履歴 (商品・店舗を参照しているため最初に削除する)
+    delete from public.purchases
+    where id in (
+        select id from public.purchases
+        where user_id = p_user_id
+        order by id
+        limit v_budget
+    );
+    get diagnostics v_purchases = row_count;
+    v_budget := v_budget - v_purchases;
+
+    if v_budget is null or v_budget > 0 then
+        delete from public.name_aliases
+        where (user_id, kind, alias_key) in (
+            select user_id, kind, alias_key from public.name_aliases
+            where user_id = p_user_id
+            limit v_budget
+        );
+        get diagnostics v_aliases = row_count;
+        v_budget := v_budget - v_aliases;
+    end if;
+
+    if v_budget is null or v_budget > 0 then
+        delete from public.items
+        where id in (
+            select id from public.items
+            where user_id = p_user_id
+            order by id
+            limit v_budget
+        );
+        get diagnostics v_items = row_count;
+        v_budget := v_budget - v_items;
+    end if;
+
+    if v_budget is null or v_budget > 0 then
+        delete from public.stores
+        where id in (
+            select id from public.stores
+            where user_id = p_user_id
+            order by id
+            limit v_budget
+        );
+        get diagnostics v_stores = row_count;
+        v_budget := v_budget - v_stores;
+    end if;
+
+    return jsonb_build_object(
+        'purchases', v_purchases,
+        'name_aliases', v_aliases,
+        'items', v_items,
+        'stores', v_stores,
+        -- 予算を使い切らなかった = どのテーブルにも削除対象が残っていない
+        'done', v_budget is null or v_budget > 0
+    );
+end;
+$$;
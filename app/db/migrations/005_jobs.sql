@@ -0,0 +1,64 @@
+-- バックグラウンドジョブ (DELETE /items/data など) の状態を保持するテーブル。
+-- 状態をDBに置くことで、ジョブを開始したワーカー以外からも状態を確認でき、二重実行も防げる。
+-- Supabase の SQL Editor で実行する。
+
+create table if not exists public.jobs (
+    id uuid primary key default gen_random_uuid(),
+    -- ユーザーの全データ削除後も結果を確認できるよう、auth.users は参照しない
+    user_id uuid not null,
+    kind text not null,  -- 処理の種類 (e.g., 'delete_all_user_data')
+    status text not null default 'pending'
+        check (status in ('pending', 'running', 'succeeded', 'failed')),
+    created_at timestamptz not null default now(),
+    finished_at timestamptz,
+    error text  -- 失敗した場合の理由
+);
+
+-- 同じユーザーの同じ種類の未完了ジョブは1つだけ (複数のワーカーから同時に開始しても二重実行しない)
+create unique index if not exists jobs_user_id_kind_active_idx
+    on public.jobs (user_id, kind)
+    where status in ('pending', 'running');
+
+-- ジョブを開始する。
+-- 同じユーザー・種類の未完了ジョブがあれば新しく作らずにそれを返す ({"job": {...}, "created": false})。
+-- 開始してから p_timeout_seconds 秒を過ぎても終わっていないジョブ (ワーカーの停止など) は失敗にし、
+-- 終了してから p_retention_seconds 秒を過ぎたジョブは削除する。
+create or replace function public.start_job(
+    p_user_id uuid,
+    p_kind text,
+    p_timeout_seconds double precision,
+    p_retention_seconds double precision
+) returns jsonb
+language plpgsql
+as $$
+declare
+    v_job public.jobs;
+begin
+    delete from public.jobs
+    where user_id = p_user_id
+      and finished_at < now() - make_interval(secs => p_retention_seconds);
+
+    update public.jobs
+    set status = 'failed', finished_at = now(), error = 'timed out'
+    where user_id = p_user_id
+      and kind = p_kind
+      and status in ('pending', 'running')
+      and created_at < now() - make_interval(secs => p_timeout_seconds);
+
+    insert into public.jobs (user_id, kind)
+    values (p_user_id, p_kind)
+    on conflict (user_id, kind) where status in ('pending', 'running') do nothing
+    returning * into v_job;
+    if found then
+        return jsonb_build_object('job', to_jsonb(v_job), 'created', true);
+    end if;
+
+    -- 未完了のジョブが既にある (直前に終了した場合は null を返し、呼び出し側でやり直す)
+    select * into v_job
+    from public.jobs
+    where user_id = p_user_id
+      and kind = p_kind
+      and status in ('pending', 'running');
+    return jsonb_build_object('job', case when found then to_jsonb(v_job) end, 'created', false);
+end;
+$$;
@@ -1,12 +1,29 @@
 # app/main.py
 
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
 # 自身のプロジェクトからインポート
 from app.api.v1 import api_router  # v1/api.py でルーターを統合することを想定
+from app.api.v1.schemas.user import User
 from app.core.config import settings
+from app.core.security import get_current_admin_user, token_cache
+from app.db import client as supabase_client
+from app.ocr import ocr_engine, preprocess
+from app.services import data_processor, db_manager
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """アプリ終了時に、共有しているSupabase・OCR APIのコネクションプールを閉じる"""
+    yield
+    await supabase_client.aclose()
+    await ocr_engine.aclose()
+
 
 # --- FastAPI アプリケーションのインスタンス化 ---
 # タイトルやバージョン情報は settings.py から取得
@@ -14,6 +31,7 @@ app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     version=settings.VERSION,
+    lifespan=lifespan,
 )
 
 # --- 1. CORS (Cross-Origin Resource Sharing) の設定 ---
@@ -43,7 +61,22 @@ async def root():
     }
 
 
-# --- 4. 開発環境での実行設定 (オプション) ---
+# --- 4. キャッシュ等の統計情報 ---
+@app.get("/stats")
+async def stats(admin: User = Depends(get_current_admin_user)):
+    """キャッシュのヒット・ミス数など、運用監視用の統計情報を返す (運用者のみ)"""
+    return {
+        "token_cache": token_cache.stats(),
+        "catalog_cache": db_manager.catalog_cache.stats(),
+        "name_resolution": data_processor.resolution_stats(),
+        # ディスク上のファイルを数えるため、スレッドで実行する
+        "ocr_cache": await asyncio.to_thread(ocr_engine.ocr_cache.stats),
+        "ocr_near_duplicates": ocr_engine.near_duplicates.stats(),
+        "ocr_preprocess": preprocess.preprocess_stats(),
+    }
+
+
+# --- 5. 開発環境での実行設定 (オプション) ---
 # この部分は通常、DockerやGunicornで実行するため必須ではないが、単体実行用に含める
 if __name__ == "__main__":
     # 環境変数から設定を読み込み
@@ -0,0 +1,116 @@
+# image_hash.py
+# レシート画像の知覚ハッシュ (dHash) と、ユーザーごとの似た画像の検索。
+# 同じレシートを撮り直した画像 (写り方が少し違うだけのもの) を見分け、以前のOCR結果を使い回すために使う。
+import threading
+import time
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+from app.core.cache import TTLCache
+from app.ocr.preprocess import receipt_bounds
+
+# dHash の1辺のサイズ (HASH_SIZE x HASH_SIZE ビットのハッシュになる)
+HASH_SIZE = 16
+# ハッシュを計算するレシートの領域 (輪郭より少し内側)。
+# 輪郭の外側の背景が入ると、撮影位置が少しずれただけでハッシュが大きく変わるため
+HASH_MARGIN_RATIO = -0.02
+
+
+def dhash(file: BinaryIO, hash_size: int = HASH_SIZE) -> Optional[int]:
+    """
+    画像の dHash (隣り合う画素の明るさの大小を並べたビット列) を整数で返す。
+    写真全体ではなく、背景を除いたレシートの部分 (preprocess.receipt_bounds) から計算する。
+    同じ机の上で撮った別のレシートでも、背景が同じというだけで近い値にならないようにするため。
+    縮小してから比較するため、撮影位置・解像度・圧縮率・明るさの少しの違いでは値がほとんど変わらない。
+    画像として読み込めない場合 (Pillowが対応していない形式など) は None を返す。
+    """
+    try:
+        with Image.open(file) as img:
+            # JPEG はデコード時に縮小させて、大きな写真でも高速に読み込む
+            img.draft("L", (hash_size * 32, hash_size * 32))
+            # 撮影時の向き (EXIF) をそろえる
+            img = ImageOps.exif_transpose(img)
+            gray = np.asarray(img.convert("L"))
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+    bounds = receipt_bounds(gray, margin_ratio=HASH_MARGIN_RATIO)
+    if bounds is not None:
+        x, y, w, h = bounds
+        gray = gray[y : y + h, x : x + w]
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+
+    bits = 0
+    for row in small.tolist():
+        for col in range(hash_size):
+            bits = (bits << 1) | (row[col] > row[col + 1])
+    return bits
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """2つのハッシュで異なるビットの数"""
+    return bin(a ^ b).count("1")
+
+
+class NearDuplicateIndex:
+    """
+    ユーザーごとに、最近OCRしたレシート画像の (dHash, OCR結果のキャッシュキー) を保持する。
+    新しい画像のハッシュとのハミング距離が max_distance 以下のものがあれば、同じレシートとみなす。
+    誤って別のレシートと判定しないよう、比較するのは同じユーザーの直近 ttl 秒・max_entries 件のみ。
+    """
+
+    def __init__(self, max_distance: int, ttl: float, max_entries: int, max_users: int = 10000):
+        """
+        :param max_distance: 同じレシートとみなすハミング距離の上限
+        :param ttl: 登録した画像を比較対象にする秒数
+        :param max_entries: ユーザーごとに保持する画像の最大数 (古いものから削除する)
+        """
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # ユーザーID -> [(登録時刻, dHash, キャッシュキー), ...] (古い順)
+        self._users = TTLCache(max_size=max_users, default_ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def find(self, user_id: str, image_hash: int) -> Optional[str]:
+        """最も近い画像のキャッシュキーを返す。max_distance 以内のものが無ければ None"""
+        now = time.monotonic()
+        best: Optional[Tuple[int, str]] = None
+        with self._lock:
+            for added_at, other_hash, key in self._users.peek(user_id, []):
+                if now - added_at > self.ttl:
+                    continue
+                distance = hamming_distance(image_hash, other_hash)
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, key)
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return best[1]
+
+    def add(self, user_id: str, image_hash: int, key: str) -> None:
+        """OCRした画像を登録する"""
+        now = time.monotonic()
+        with self._lock:
+            entries: List[Tuple[float, int, str]] = [
+                entry
+                for entry in self._users.peek(user_id, [])
+                if now - entry[0] <= self.ttl and entry[2] != key
+            ]
+            entries.append((now, image_hash, key))
+            self._users.set(user_id, entries[-self.max_entries :])
+
+    def stats(self) -> Dict[str, int]:
+        """ヒット・ミス数などの統計値を返す。"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "users": len(self._users),
+            "max_distance": self.max_distance,
+        }
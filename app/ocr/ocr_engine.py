@@ -1,48 +1,240 @@
-import requests
-import time
+import asyncio
+import hashlib
+import inspect
+import io
 import json
 import re
+import threading
 from dotenv import dotenv_values
-import os
-import tempfile
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterable, AsyncIterator, BinaryIO, Dict, Iterator, Optional, Tuple, Union
+
+import httpx
 
+from app.core.cache import DiskLRUCache
 from app.core.config import settings
+from app.ocr.image_hash import NearDuplicateIndex, dhash
+from app.ocr.preprocess import preprocess_image, record_confidence
 
 
 endpoint = settings.OCR_ENDPOINT
 key = settings.OCR_KEY
 
+# 混雑を示すステータス。これと 5xx (一時的な障害) は Retry-After に従って再送する
+RETRY_STATUS_CODES = (429,)
+# ファイルから画像を読み込んで送信する際の1回の読み込みサイズ
+OCR_STREAM_CHUNK_SIZE = 64 * 1024
+
+# OCRに渡せる画像データ: メモリ上のバイト列 (コピーせずにそのまま送信する)、または非同期のバイト列ストリーム
+ImageData = Union[bytes, bytearray, memoryview, AsyncIterable[bytes]]
+
+# 画像の SHA-256 -> parse_receipt_result の結果。同じ画像の再アップロードでは OCR API を呼び出さない
+ocr_cache = DiskLRUCache(settings.OCR_CACHE_DIR, settings.OCR_CACHE_MAX_BYTES)
+# ユーザーごとの、最近OCRした画像の知覚ハッシュ -> ocr_cache のキー (撮り直した画像の判定用)
+near_duplicates = NearDuplicateIndex(
+    max_distance=settings.OCR_NEAR_DUPLICATE_MAX_DISTANCE,
+    ttl=settings.OCR_NEAR_DUPLICATE_TTL,
+    max_entries=settings.OCR_NEAR_DUPLICATE_PER_USER,
+)
+
+# OCR APIとの通信に使う共有の非同期クライアント (初回呼び出し時に生成する)
+_lock = threading.Lock()
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    """共有の非同期HTTPクライアントを返す。アップロードが並行しても接続を使い回す。"""
+    global _http_client
+    if _http_client is None:
+        with _lock:
+            if _http_client is None:
+                _http_client = httpx.AsyncClient(
+                    headers={"Ocp-Apim-Subscription-Key": key},
+                    limits=httpx.Limits(max_connections=settings.OCR_HTTP_MAX_CONNECTIONS),
+                    timeout=httpx.Timeout(settings.OCR_HTTP_TIMEOUT),
+                )
+    return _http_client
+
+
+async def aclose() -> None:
+    """共有クライアントのコネクションプールを閉じる (FastAPIの lifespan 終了時に呼び出す)"""
+    global _http_client
+    with _lock:
+        http_client = _http_client
+        _http_client = None
+    if http_client is not None:
+        await http_client.aclose()
+
+
+class FileStream:
+    """
+    UploadFile など、非同期で読める (await read() / await seek() を持つ) ファイルを画像データとして渡すためのラッパー。
+    全体を読み込まずに、少しずつ読みながらそのまま送信する。
+    反復のたびに先頭から読み直すため、429 などで再送する場合も同じ内容を送れる。
+    """
+
+    def __init__(self, file: Any, size: Optional[int] = None, chunk_size: int = OCR_STREAM_CHUNK_SIZE):
+        """
+        :param file: 読み込むファイル
+        :param size: ファイルのバイト数 (分かっていれば Content-Length として送る)
+        """
+        self.file = file
+        self.size = size
+        self.chunk_size = chunk_size
+
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        return self._read()
+
+    def sync_file(self) -> Optional[BinaryIO]:
+        """同期的に読める元のファイル (UploadFile の場合は file.file)。無ければ None"""
+        return getattr(self.file, "file", None)
+
+    async def _read(self) -> AsyncIterator[bytes]:
+        await self.file.seek(0)
+        while True:
+            chunk = await self.file.read(self.chunk_size)
+            if not chunk:
+                break
+            yield chunk
 
-def azure_receipt_ocr(image_path):
+
+class _BufferBody:
+    """
+    bytearray / memoryview を、コピーせずに1チャンクの本文として送るためのラッパー。
+    反復のたびに新しいジェネレーターを作るため、429 などで再送する場合も同じ内容を送れる。
+    """
+
+    def __init__(self, view: memoryview):
+        self.view = view
+
+    def __aiter__(self) -> AsyncIterator[memoryview]:
+        return self._read()
+
+    async def _read(self) -> AsyncIterator[memoryview]:
+        yield self.view
+
+
+def _request_body(image: ImageData) -> Tuple[Any, Dict[str, str], bool]:
+    """
+    画像データを httpx に渡す形にする。
+    :return: (content, 追加のヘッダー, 再送できるか) のタプル
+    """
+    if isinstance(image, bytes):
+        return image, {}, True
+    if isinstance(image, (bytearray, memoryview)):
+        # bytes() に変換するとコピーになるため、バッファのまま1チャンクとして送る
+        view = memoryview(image).cast("B")
+        return _BufferBody(view), {"Content-Length": str(view.nbytes)}, True
+    headers = {}
+    size = getattr(image, "size", None)
+    if size is not None:
+        headers["Content-Length"] = str(size)
+    # 非同期ジェネレーターは1度しか読めないため、再送できない
+    return image, headers, not inspect.isasyncgen(image)
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Retry-After ヘッダー (秒数またはHTTP日付) を、待つべき秒数にする。無ければ None"""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _poll_intervals() -> Iterator[float]:
+    """
+    結果確認の間隔。最初は短い間隔で確認し (小さいレシートはすぐに終わるため)、
+    確認のたびに OCR_POLL_BACKOFF 倍ずつ OCR_POLL_MAX_INTERVAL まで間隔を広げる。
+    """
+    interval = settings.OCR_POLL_INITIAL_INTERVAL
+    while True:
+        yield interval
+        interval = min(interval * settings.OCR_POLL_BACKOFF, settings.OCR_POLL_MAX_INTERVAL)
+
+
+async def _request(
+    method: str, url: str, deadline: float, replayable: bool = True, **kwargs
+) -> Optional[httpx.Response]:
+    """
+    リクエストを送信する。429 / 5xx の場合は Retry-After (無ければ結果確認と同じ間隔) だけ待って再送する。
+    待つと deadline (time.monotonic() の値) を過ぎる場合や、本文を再送できない場合は None を返す。
+    """
+    client = _get_http_client()
+    intervals = _poll_intervals()
+    while True:
+        response = await client.request(method, url, **kwargs)
+        if response.status_code not in RETRY_STATUS_CODES and not response.is_server_error:
+            return response
+        if not replayable:
+            return None
+        wait = _retry_after(response)
+        if wait is None:
+            wait = next(intervals)
+        if time.monotonic() + wait > deadline:
+            return None
+        await asyncio.sleep(wait)
+
+
+async def azure_receipt_ocr(image: ImageData) -> dict:
+    """
+    Azureのレシート解析APIに画像を送信し、解析結果 (JSON) を返す。失敗した場合は空の辞書を返す。
+    送信・結果確認とも非同期で行い、待っている間はイベントループを止めない。
+    画像はコピーや一時ファイルへの書き出しをせず、そのままリクエストの本文として送る。
+    """
+    content, body_headers, replayable = _request_body(image)
     url = (
         endpoint
         + "formrecognizer/documentModels/prebuilt-receipt:analyze?api-version=2023-07-31"
     )
-    headers = {
-        "Ocp-Apim-Subscription-Key": key,
-        "Content-Type": "application/octet-stream",
-    }
-    with open(image_path, "rb") as f:
-        img_data = f.read()
-    response = requests.post(url, headers=headers, data=img_data)
-    response.raise_for_status()
-    result_url = response.headers.get("operation-location")
-    if not result_url:
-        print("operation-location ヘッダーがありません。")
-        return {}
-
-    for _ in range(20):
-        result_response = requests.get(
-            result_url, headers={"Ocp-Apim-Subscription-Key": key}
+    deadline = time.monotonic() + settings.OCR_POLL_TIMEOUT
+    try:
+        response = await _request(
+            "POST",
+            url,
+            deadline,
+            replayable=replayable,
+            content=content,
+            headers={"Content-Type": "application/octet-stream", **body_headers},
         )
-        result_json = result_response.json()
-        status = result_json.get("status")
-        if status == "succeeded":
-            return result_json
-        elif status == "failed":
-            print("解析失敗")
+        if response is None:
+            print("OCR APIが混雑しているため、解析を開始できませんでした。")
             return {}
-        time.sleep(1)
+        response.raise_for_status()
+        result_url = response.headers.get("operation-location")
+        if not result_url:
+            print("operation-location ヘッダーがありません。")
+            return {}
+
+        for interval in _poll_intervals():
+            if time.monotonic() + interval > deadline:
+                break
+            await asyncio.sleep(interval)
+            result_response = await _request("GET", result_url, deadline)
+            if result_response is None:
+                break
+            result_response.raise_for_status()
+            try:
+                result_json = result_response.json()
+            except ValueError:
+                print("解析結果をJSONとして読み取れません")
+                return {}
+            status = result_json.get("status") if isinstance(result_json, dict) else None
+            if status == "succeeded":
+                return result_json
+            elif status == "failed":
+                print("解析失敗")
+                return {}
+    except httpx.HTTPError as e:
+        print(f"OCR API Error: {e}")
+        return {}
     print("タイムアウト")
     return {}
 
@@ -215,36 +407,109 @@ def parse_receipt_text(text):
         i += 1
     return items
 
-def process_image(image_bytes):
+async def _image_hash(image: ImageData) -> Optional[str]:
     """
-    入力画像バイトデータを受け取り、一時ファイルに保存後、OCR処理を行い、商品リストを抽出して返す関数
+    画像データの SHA-256 (16進数) を返す。FileStream などは少しずつ読みながら計算する。
+    1度しか読めないストリームは、ここで読むとOCRに送れなくなるため None を返す (キャッシュしない)。
     """
-    # 1. バイトデータを安全な一時ファイルに保存
-    # delete=False を指定して、withブロック終了後もファイルが残るようにし、
-    # finallyブロックで明示的に削除する
-    with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
-        tmp_file.write(image_bytes)
-        image_path = tmp_file.name # 安全な一時ファイルパスを取得
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(image).hexdigest()
+    if inspect.isasyncgen(image):
+        return None
+    digest = hashlib.sha256()
+    async for chunk in image:
+        digest.update(chunk)
+    return digest.hexdigest()
 
-    raw_data_list = []
-    try:
-        # 2. 一時ファイルパスを使ってOCRを実行
-        result_json = azure_receipt_ocr(image_path)
-        
-        # 3. 解析
+
+def _perceptual_hash(image: ImageData) -> Optional[int]:
+    """
+    画像データの知覚ハッシュ (dHash) を返す。画像をデコードするため、スレッドで実行する。
+    同期的に読めない画像データや、Pillowで読み込めない形式の場合は None を返す。
+    """
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return dhash(io.BytesIO(image))
+    file = image.sync_file() if isinstance(image, FileStream) else None
+    if file is None:
+        return None
+    file.seek(0)
+    return dhash(file)
+
+
+def _preprocessed(image: ImageData) -> Optional[bytes]:
+    """
+    OCR APIに送るために小さくした画像を返す。画像をデコードするため、スレッドで実行する。
+    同期的に読めない画像データや、前処理できなかった場合は None を返す (元の画像をそのまま送る)。
+    """
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return preprocess_image(image)
+    file = image.sync_file() if isinstance(image, FileStream) else None
+    if file is None:
+        return None
+    file.seek(0)
+    return preprocess_image(file.read())
+
+
+def _mean_confidence(result_json: dict) -> Optional[float]:
+    """OCR結果の単語ごとの信頼度 (0〜1) の平均。単語が無い場合は None"""
+    confidences = [
+        word["confidence"]
+        for page in result_json.get("analyzeResult", {}).get("pages", [])
+        for word in page.get("words", [])
+        if "confidence" in word
+    ]
+    return sum(confidences) / len(confidences) if confidences else None
+
+
+async def process_image(image: ImageData, use_cache: bool = True, user_id: Optional[str] = None):
+    """
+    入力画像データ (バイト列、またはアップロードされたファイルの FileStream など) を受け取り、
+    OCR処理を行い、商品リストを抽出して返す関数
+
+    同じ画像 (SHA-256 が一致するもの) の解析結果はキャッシュから返し、OCR APIを呼び出さない。
+    キャッシュはディスク上にあるため、読み書きはスレッドで行う (イベントループを止めない)。
+    user_id を指定した場合は、そのユーザーが最近アップロードした画像と知覚ハッシュを比較し、
+    同じレシートを撮り直したものであれば、以前の解析結果を返す。
+    :param use_cache: False の場合はキャッシュを使わずに解析し直す (結果はキャッシュに保存する)
+    """
+    key = await _image_hash(image) if settings.OCR_CACHE_ENABLED else None
+    result = await asyncio.to_thread(ocr_cache.get, key) if key and use_cache else None
+
+    image_hash = None
+    if result is None and key and user_id and settings.OCR_NEAR_DUPLICATE_ENABLED:
+        image_hash = await asyncio.to_thread(_perceptual_hash, image)
+        if image_hash is not None and use_cache:
+            similar_key = near_duplicates.find(user_id, image_hash)
+            if similar_key:
+                result = await asyncio.to_thread(ocr_cache.get, similar_key)
+                if result is not None:
+                    # 同じ画像を再度アップロードした場合は、知覚ハッシュを計算せずに済むようにする
+                    await asyncio.to_thread(ocr_cache.set, key, result)
+
+    if result is None:
+        # 1. 送信する画像を小さくする (前処理できない場合は、元の画像をコピーせずにそのまま送信する)
+        payload = await asyncio.to_thread(_preprocessed, image) if settings.OCR_PREPROCESS_ENABLED else None
+
+        # 2. OCRを実行
+        result_json = await azure_receipt_ocr(image if payload is None else payload)
+        confidence = _mean_confidence(result_json)
+        record_confidence(payload is not None, confidence)
+        if confidence is not None:
+            print(f"OCR信頼度: {confidence:.3f} (前処理={'あり' if payload is not None else 'なし'})")
+
+        # 3. 解析 (失敗した結果はキャッシュしない)
         result = parse_receipt_result(result_json)
-        raw_data_list = parse_receipt_text(result.get("生データ", ""))
-        
-    finally:
-        # 4. 処理後、確実に一時ファイルを削除
-        if os.path.exists(image_path):
-            os.unlink(image_path)
-            
-    return raw_data_list
+        if key and result:
+            await asyncio.to_thread(ocr_cache.set, key, result)
+            if image_hash is not None:
+                near_duplicates.add(user_id, image_hash, key)
+
+    return parse_receipt_text(result.get("生データ", ""))
 
 
 # 使い方例
 if __name__ == "__main__":
-    items = process_image("app/ocr/receipt_sample.jpg")
+    with open("app/ocr/receipt_sample.jpg", "rb") as f:
+        items = asyncio.run(process_image(f.read()))
     for d in items:
         print(d)
@@ -0,0 +1,154 @@
+# preprocess.py
+# OCR APIに送る前のレシート画像の前処理。
+# スマートフォンの写真 (4〜12MB) をそのまま送ると、アップロードとAzure側の解析に時間がかかるため、
+# グレースケール化・レシート部分の切り抜き・縮小をしてから、JPEG (または PNG) に圧縮し直す。
+import threading
+import time
+from typing import Dict, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from app.core.config import settings
+
+# Azure Document Intelligence が受け付ける画像の1辺の最大サイズ (px)
+MAX_OCR_DIMENSION = 10000
+# レシートの輪郭を探すときに縮小する長辺のサイズ (px)
+DETECT_DIMENSION = 800
+# 切り抜くレシートの面積が画像全体に占める割合の範囲 (外れる場合は切り抜かない)
+MIN_RECEIPT_AREA_RATIO = 0.2
+MAX_RECEIPT_AREA_RATIO = 0.95
+# 切り抜くときに輪郭の外側に残す余白 (レシートの幅・高さに対する割合)
+CROP_MARGIN_RATIO = 0.02
+
+# 前処理の結果の件数・バイト数と、OCR結果の信頼度の合計 (前処理の効果と精度への影響の確認用)
+_stats: Dict[str, float] = {
+    "images": 0,  # 前処理した画像の数
+    "skipped": 0,  # 読み込めない形式・小さくならなかったため、元の画像を送った数
+    "cropped": 0,  # レシート部分を切り抜いた数
+    "bytes_in": 0,
+    "bytes_out": 0,
+}
+# 前処理した画像 / 元の画像それぞれの、OCR結果の信頼度の (合計, 件数)
+_confidence: Dict[str, Tuple[float, int]] = {"preprocessed": (0.0, 0), "original": (0.0, 0)}
+_stats_lock = threading.Lock()
+
+
+def receipt_bounds(
+    gray: np.ndarray, margin_ratio: float = CROP_MARGIN_RATIO
+) -> Optional[Tuple[int, int, int, int]]:
+    """
+    背景より明るいレシートの領域を探し、(x, y, 幅, 高さ) を返す。
+    見つからない場合や、画像のほぼ全体がレシートの場合は None を返す。
+    :param margin_ratio: 輪郭の外側に残す余白の割合 (負の値の場合は、輪郭より内側を返す)
+    """
+    height, width = gray.shape
+    scale = min(1.0, DETECT_DIMENSION / max(height, width))
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    blurred = cv2.GaussianBlur(small, (5, 5), 0)
+    _, mask = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # 文字の部分の穴を埋めて、レシート全体を1つの領域にする
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((15, 15), np.uint8))
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+
+    x, y, w, h = cv2.boundingRect(max(contours, key=cv2.contourArea))
+    area_ratio = (w * h) / (small.shape[0] * small.shape[1])
+    if not MIN_RECEIPT_AREA_RATIO <= area_ratio <= MAX_RECEIPT_AREA_RATIO:
+        return None
+
+    margin_x, margin_y = int(w * margin_ratio), int(h * margin_ratio)
+    left = max(0, int((x - margin_x) / scale))
+    top = max(0, int((y - margin_y) / scale))
+    right = min(width, int((x + w + margin_x) / scale))
+    bottom = min(height, int((y + h + margin_y) / scale))
+    return left, top, right - left, bottom - top
+
+
+def _target_scale(gray: np.ndarray, cropped: bool) -> float:
+    """
+    縮小率を返す (拡大はしない)。
+    切り抜いた場合は短辺をレシートの幅とみなし、OCR_PREPROCESS_TARGET_DPI になるよう縮小する
+    (横向きに撮影した場合や、EXIF の向きの情報が無い場合も、レシートの長さを幅として扱わない)。
+    切り抜けなかった場合はレシートの大きさが分からないため、長辺を OCR_PREPROCESS_MAX_DIMENSION に収める。
+    """
+    height, width = gray.shape
+    if cropped:
+        target_width = settings.OCR_PREPROCESS_RECEIPT_WIDTH_MM / 25.4 * settings.OCR_PREPROCESS_TARGET_DPI
+        scale = target_width / min(height, width)
+    else:
+        scale = settings.OCR_PREPROCESS_MAX_DIMENSION / max(height, width)
+    return min(1.0, scale, MAX_OCR_DIMENSION / max(height, width))
+
+
+def _encode(gray: np.ndarray) -> Optional[bytes]:
+    if settings.OCR_PREPROCESS_FORMAT == "png":
+        ok, encoded = cv2.imencode(".png", gray, [cv2.IMWRITE_PNG_COMPRESSION, 6])
+    else:
+        ok, encoded = cv2.imencode(
+            ".jpg", gray, [cv2.IMWRITE_JPEG_QUALITY, settings.OCR_PREPROCESS_JPEG_QUALITY]
+        )
+    return encoded.tobytes() if ok else None
+
+
+def _count(**values: float) -> None:
+    with _stats_lock:
+        for name, value in values.items():
+            _stats[name] += value
+
+
+def preprocess_image(data: Union[bytes, bytearray, memoryview]) -> Optional[bytes]:
+    """
+    レシート画像を OCR 用に小さくしたバイト列を返す。画像をデコードするため、スレッドで実行する。
+    OpenCV で読み込めない形式 (HEIC など) や、元の画像より小さくならなかった場合は None を返す
+    (元の画像をそのまま送る)。
+    """
+    started = time.perf_counter()
+    original_bytes = len(data) if not isinstance(data, memoryview) else data.nbytes
+    # 撮影時の向き (EXIF) は imdecode が自動でそろえる
+    gray = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        _count(skipped=1)
+        return None
+
+    bounds = receipt_bounds(gray)
+    if bounds is not None:
+        x, y, w, h = bounds
+        gray = gray[y : y + h, x : x + w]
+    scale = _target_scale(gray, cropped=bounds is not None)
+    if scale < 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    encoded = _encode(gray)
+    if encoded is None or len(encoded) >= original_bytes:
+        _count(skipped=1)
+        return None
+
+    _count(images=1, cropped=int(bounds is not None), bytes_in=original_bytes, bytes_out=len(encoded))
+    print(
+        f"OCR前処理: {original_bytes} -> {len(encoded)} bytes ({len(encoded) / original_bytes:.1%}), "
+        f"{gray.shape[1]}x{gray.shape[0]}px, 切り抜き={'あり' if bounds else 'なし'}, "
+        f"{(time.perf_counter() - started) * 1000:.0f}ms"
+    )
+    return encoded
+
+
+def record_confidence(preprocessed: bool, confidence: Optional[float]) -> None:
+    """OCR結果の信頼度を、前処理した画像 / 元の画像に分けて集計する (精度への影響の確認用)"""
+    if confidence is None:
+        return
+    name = "preprocessed" if preprocessed else "original"
+    with _stats_lock:
+        total, count = _confidence[name]
+        _confidence[name] = (total + confidence, count + 1)
+
+
+def preprocess_stats() -> Dict[str, Optional[float]]:
+    """前処理の件数・バイト数の削減率と、OCR結果の平均信頼度を返す"""
+    with _stats_lock:
+        stats: Dict[str, Optional[float]] = dict(_stats)
+        stats["byte_ratio"] = _stats["bytes_out"] / _stats["bytes_in"] if _stats["bytes_in"] else None
+        for name, (total, count) in _confidence.items():
+            stats[f"{name}_confidence"] = total / count if count else None
+    return stats
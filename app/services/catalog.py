@@ -0,0 +1,236 @@
+import bisect
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from app.api.v1.schemas.item import Item
+from app.api.v1.schemas.store import Store
+from app.services.text_normalizer import canonical_key
+
+Entity = Union[Item, Store]
+
+# このエンティティ数の割合を超えて出現する n-gram (「パック」など) は候補の絞り込みに使わない
+NGRAM_MAX_DF_RATIO = 0.2
+# 候補を数えるときに走査するIDの合計の上限 (出現頻度の低い n-gram から順に数え、超えたら打ち切る)
+NGRAM_MAX_POSTINGS = 20000
+
+
+def _ngrams(key: str) -> Set[str]:
+    """
+    正規化済みのキーを1文字 (ユニグラム) と文字バイグラムの集合に分解する (空白は取り除く)。
+    かな・漢字も1文字ずつ扱う。ユニグラムも含めるのは、入力途中の1文字のクエリにも候補を返すため。
+    """
+    text = key.replace(" ", "")
+    return set(text) | {text[i : i + 2] for i in range(len(text) - 1)}
+
+
+class Catalog:
+    """
+    あるユーザーの商品一覧（または店舗一覧）をメモリ上に保持するクラス。
+    db_manager がユーザーごとにキャッシュし、商品・店舗の登録/更新/削除のたびにその場で更新する。
+
+    各エンティティの名称は登録時に1度だけ canonical_key で正規化し、そのキーで
+    - 完全一致の辞書 (表記ゆれだけの違いなら類似度計算なしで特定する)
+    - 別名の辞書 (ユーザーが確定したOCRの読み取り結果 -> エンティティ)
+    - ユニグラム・バイグラムの転置インデックス (類似度計算の候補の絞り込み)
+    - ソート済み配列 (前方一致の検索)
+    を合わせて更新する。
+    """
+
+    def __init__(self, entities: Iterable[Entity], aliases: Optional[Dict[str, int]] = None):
+        """
+        :param entities: 商品または店舗のリスト
+        :param aliases: DBに保存済みの別名 (正規化済みの名称 -> ID)
+        """
+        self._lock = threading.Lock()
+        self._by_id: Dict[int, Entity] = {}
+        # ID -> 正規化済みのキー
+        self._keys: Dict[int, str] = {}
+        # 正規化済みのキー -> そのキーを持つエンティティのID (登録順)
+        self._by_key: Dict[str, List[int]] = {}
+        # 正規化済みの別名 -> エンティティのID
+        self._aliases: Dict[str, int] = {}
+        # ユニグラム・バイグラム -> それをキーに含むエンティティのIDの集合
+        self._index: Dict[str, Set[int]] = {}
+        # (正規化済みのキー, ID) のソート済み配列
+        self._sorted_keys: List[Tuple[str, int]] = []
+        # 類似度計算用のスナップショット (更新があるまで使い回す)
+        self._snapshot: Optional[Tuple[List[Entity], List[str]]] = None
+        for entity in entities:
+            self._add(entity, keep_sorted=False)
+        self._sorted_keys.sort()
+        for key, entity_id in (aliases or {}).items():
+            if self._keys.get(entity_id) not in (None, key):
+                self._aliases[key] = entity_id
+
+    def _add(self, entity: Entity, keep_sorted: bool = True) -> None:
+        key = canonical_key(entity.name)
+        self._by_id[entity.id] = entity
+        self._keys[entity.id] = key
+        self._by_key.setdefault(key, []).append(entity.id)
+        for gram in _ngrams(key):
+            self._index.setdefault(gram, set()).add(entity.id)
+        if keep_sorted:
+            bisect.insort(self._sorted_keys, (key, entity.id))
+        else:
+            self._sorted_keys.append((key, entity.id))
+
+    def _discard(self, entity_id: int) -> bool:
+        if self._by_id.pop(entity_id, None) is None:
+            return False
+        key = self._keys.pop(entity_id)
+        ids = self._by_key[key]
+        ids.remove(entity_id)
+        if not ids:
+            del self._by_key[key]
+        for gram in _ngrams(key):
+            gram_ids = self._index.get(gram)
+            if gram_ids is not None:
+                gram_ids.discard(entity_id)
+                if not gram_ids:
+                    del self._index[gram]
+        position = bisect.bisect_left(self._sorted_keys, (key, entity_id))
+        if position < len(self._sorted_keys) and self._sorted_keys[position] == (key, entity_id):
+            del self._sorted_keys[position]
+        return True
+
+    @property
+    def entities(self) -> List[Entity]:
+        """保持している全件のリスト（呼び出し側で変更しても影響しないようコピーを返す）"""
+        with self._lock:
+            return list(self._by_id.values())
+
+    def snapshot(self) -> Tuple[List[Entity], List[str]]:
+        """
+        (全件のリスト, 正規化済みのキーのリスト) を返す。2つのリストは同じ順序で並ぶ。
+        更新があるまで同じリストを返すので、呼び出し側で変更しないこと。
+        """
+        with self._lock:
+            if self._snapshot is None:
+                entities = list(self._by_id.values())
+                self._snapshot = (entities, [self._keys[entity.id] for entity in entities])
+            return self._snapshot
+
+    def lookup(self, key: str) -> Optional[Entity]:
+        """正規化済みのキーが完全に一致するエンティティを返す (複数あれば先に登録されたもの)"""
+        with self._lock:
+            ids = self._by_key.get(key)
+            return self._by_id[ids[0]] if ids else None
+
+    def resolve_alias(self, key: str) -> Optional[Entity]:
+        """正規化済みのキーが別名として登録されていれば、そのエンティティを返す"""
+        with self._lock:
+            entity_id = self._aliases.get(key)
+            return None if entity_id is None else self._by_id.get(entity_id)
+
+    def add_alias(self, raw_name: str, entity_id: int) -> None:
+        """
+        raw_name (OCRで読み取った名称など) を entity_id の別名として登録する。
+        正規化後に名称そのものと一致する場合や、エンティティが無い場合は何もしない。
+        """
+        key = canonical_key(raw_name)
+        with self._lock:
+            if key and self._keys.get(entity_id) not in (None, key):
+                self._aliases[key] = entity_id
+
+    def candidates(self, key: str, limit: int) -> Tuple[List[Entity], List[str]]:
+        """
+        正規化済みのキーと n-gram を多く共有するエンティティを最大 limit 件返す。
+        戻り値は snapshot() と同じ (エンティティのリスト, 正規化済みのキーのリスト) の形式。
+        バイグラムで数え、使えるバイグラムが無い場合 (1文字のクエリなど) はユニグラムで数える。
+        出現頻度の高すぎる n-gram は数えないが、クエリの n-gram がすべて高頻度の場合は、
+        出現頻度の低いものから順に絞り込む。共有する n-gram が無ければ空のリストを返す。
+        """
+        grams = _ngrams(key)
+        with self._lock:
+            max_df = max(limit, int(len(self._by_id) * NGRAM_MAX_DF_RATIO))
+            bigrams = [self._index[gram] for gram in grams if len(gram) == 2 and gram in self._index]
+            unigrams = [self._index[gram] for gram in grams if len(gram) == 1 and gram in self._index]
+            for postings in (bigrams, unigrams):
+                selective = sorted((ids for ids in postings if len(ids) <= max_df), key=len)
+                if selective:
+                    ids = self._count(selective, limit)
+                    break
+            else:
+                ids = self._narrow(sorted(bigrams + unigrams, key=len), limit)
+            return [self._by_id[i] for i in ids], [self._keys[i] for i in ids]
+
+    @staticmethod
+    def _count(postings: List[Set[int]], limit: int) -> List[int]:
+        """
+        出現頻度の低い n-gram から順に、共有する数を数えて上位 limit 件のIDを返す。
+        走査するIDの合計が NGRAM_MAX_POSTINGS を超えたら、それより頻度の高い n-gram は数えない。
+        """
+        counts: Counter = Counter(postings[0])
+        scanned = len(postings[0])
+        for ids in postings[1:]:
+            scanned += len(ids)
+            if scanned > NGRAM_MAX_POSTINGS:
+                break
+            counts.update(ids)
+        return [entity_id for entity_id, _ in counts.most_common(limit)]
+
+    @staticmethod
+    def _narrow(postings: List[Set[int]], limit: int) -> List[int]:
+        """
+        高頻度の n-gram だけのクエリ用。出現頻度の低い n-gram から順に積集合をとり、
+        より多くの n-gram を含むエンティティから最大 limit 件を返す (全件の数え上げはしない)。
+        """
+        if not postings:
+            return []
+        levels = [postings[0]]
+        for ids in postings[1:]:
+            narrowed = levels[-1] & ids
+            if not narrowed:
+                break
+            levels.append(narrowed)
+
+        result: List[int] = []
+        seen: Set[int] = set()
+        for level in reversed(levels):
+            for entity_id in level:
+                if entity_id not in seen:
+                    seen.add(entity_id)
+                    result.append(entity_id)
+                    if len(result) >= limit:
+                        return result
+        return result
+
+    def prefix_matches(self, prefix: str, limit: int) -> List[Entity]:
+        """
+        正規化済みのキーが prefix (正規化済み) で始まるエンティティを、キーの順に最大 limit 件返す。
+        ソート済み配列の二分探索で開始位置を求めるため、カタログ全体を走査しない。
+        """
+        if not prefix:
+            return []
+        with self._lock:
+            position = bisect.bisect_left(self._sorted_keys, (prefix,))
+            matches: List[Entity] = []
+            for key, entity_id in self._sorted_keys[position : position + limit]:
+                if not key.startswith(prefix):
+                    break
+                matches.append(self._by_id[entity_id])
+        return matches
+
+    def get(self, entity_id: int) -> Optional[Entity]:
+        """IDでエンティティを取得する"""
+        return self._by_id.get(entity_id)
+
+    def upsert(self, entity: Entity) -> None:
+        """エンティティを追加する。同じIDのものがあれば置き換える。"""
+        with self._lock:
+            self._discard(entity.id)
+            self._add(entity)
+            self._snapshot = None
+
+    def remove(self, entity_id: int) -> None:
+        """エンティティを削除する（存在しない場合は何もしない）"""
+        with self._lock:
+            if self._discard(entity_id):
+                self._snapshot = None
+                self._aliases = {
+                    key: alias_id for key, alias_id in self._aliases.items() if alias_id != entity_id
+                }
+
+    def __len__(self) -> int:
+        return len(self._by_id)
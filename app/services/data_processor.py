@@ -1,17 +1,60 @@
-from typing import List, Tuple, Optional, Union
+from typing import Dict, Iterable, List, Tuple, Optional
 from datetime import date, datetime
 import re
-from rapidfuzz import fuzz  # 類似度計算ライブラリ
+import threading
+import numpy as np
+from pydantic import ValidationError
+from rapidfuzz import fuzz, process  # 類似度計算ライブラリ
 
 from app.api.v1.schemas.item import Item
 from app.api.v1.schemas.store import Store
 from app.api.v1.schemas.record import OCRResult
 from app.services import db_manager
+from app.services.catalog import Catalog, Entity
+from app.services.text_normalizer import canonical_key
 
 # 類似度の閾値 (SIMILARITY_THRESHOLD点以上で既存と判定)
 SIMILARITY_THRESHOLD = 70.0
 # サジェストの上限数
 SUGGESTION_LIMIT = 10
+# サジェストに含める最低スコア (0の場合は類似度に関わらず上位 SUGGESTION_LIMIT 件を返す)
+SUGGESTION_SCORE_CUTOFF = 0.0
+# カタログがこの件数以上の場合は、n-gram の転置インデックスで候補を絞り込んでから類似度を計算する
+NGRAM_INDEX_MIN_SIZE = 2000
+# 絞り込む候補の最大数
+NGRAM_CANDIDATE_LIMIT = 500
+# 絞り込んだ候補がこの件数未満の場合は、カタログの先頭から NGRAM_CANDIDATE_LIMIT 件まで補う (全件は走査しない)
+NGRAM_MIN_CANDIDATES = SUGGESTION_LIMIT
+
+# サジェストを返した方法 (レスポンスヘッダー X-Suggest-Path の値)
+SUGGEST_PATH_PREFIX = "prefix"  # 前方一致のみで上位 SUGGESTION_LIMIT 件が揃った
+SUGGEST_PATH_FUZZY = "fuzzy"  # 類似度計算で求めた
+
+# 名寄せの各段階 (安いものから順に試し、見つかった時点で終了する)
+TIER_EXACT = "exact"  # 正規化したキーが既存の名称と完全一致
+TIER_ALIAS = "alias"  # ユーザーが過去に確定した別名と一致
+TIER_PREFIX = "prefix"  # 既存の名称の先頭部分と一致し、類似度も閾値以上
+TIER_FUZZY = "fuzzy"  # 類似度計算で閾値以上
+TIER_NEW = "new"  # どれにも該当せず新規と判定 (類似度計算は行った)
+RESOLUTION_TIERS = (TIER_EXACT, TIER_ALIAS, TIER_PREFIX, TIER_FUZZY, TIER_NEW)
+# 前方一致の段階で比較する候補数
+PREFIX_TIER_LIMIT = 10
+
+# 段階ごとの件数 (類似度計算をどれだけ省けているかの確認用)
+_tier_counts: Dict[str, int] = {tier: 0 for tier in RESOLUTION_TIERS}
+_tier_lock = threading.Lock()
+
+
+def _count_tier(tier: str) -> None:
+    with _tier_lock:
+        _tier_counts[tier] += 1
+
+
+def resolution_stats() -> Dict[str, int]:
+    """名寄せの段階ごとの件数を返す"""
+    with _tier_lock:
+        return dict(_tier_counts)
+
 
 # --- ヘルパー関数 ---
 
@@ -21,6 +64,11 @@ def _normalize_date(date_input) -> date:
     様々な形式の日付文字列（例: '2025/10/1', '2025年 10月1日'）を YYYY-MM-DD 形式の date オブジェクトに変換する。
     変換できない場合は、本日の日付を返す。
     """
+    return _parse_date(date_input) or date.today()  # どの形式にも一致しない場合は本日の日付
+
+
+def _parse_date(date_input) -> Optional[date]:
+    """_normalize_date と同じ規則で日付を読み取る。変換できない場合は None を返す。"""
 
     date_str = str(date_input).strip()
 
@@ -53,7 +101,7 @@ def _normalize_date(date_input) -> date:
     except ValueError:
         pass
 
-    return date.today()  # どの形式にも一致しない場合は本日の日付
+    return None
 
 
 def _normalize_price(s: str) -> float:
@@ -90,133 +138,256 @@ def _normalize_price(s: str) -> float:
         return 0.0
 
 
-def _normalize_name(
-    user_id: str, raw_name: Optional[str], existing_data_getter
-) -> Tuple[bool, Optional[int], Optional[str]]:
+def _parse_import_price(raw_price) -> Optional[float]:
     """
-    商品名または店舗名の名寄せ処理を実行し、結果を返す。
+    一括取り込み用に価格を読み取る。桁区切りのカンマと、前後の通貨記号 (¥, ￥, 円など) は取り除く。
+    _normalize_price と違い、数字以外の文字を 0 に置き換えず、読み取れない場合や 0 以下の場合は None を返す。
+    """
+    s = re.sub(r"[,，\s]", "", str(raw_price))
+    s = re.sub(r"^[¥￥\\]", "", s)
+    s = re.sub(r"(円|yen)$", "", s, flags=re.IGNORECASE)
+    if not re.fullmatch(r"\d+(?:\.\d+)?", s):
+        return None
+    price = float(s)
+    return price if price > 0 else None
 
-    :param raw_name: OCRから読み取られた元の名称
-    :param existing_data_getter: 既存のデータを取得する関数 (e.g., db_manager.get_items_by_user)
-    :return: (is_new, suggested_id, suggested_name) のタプル
+
+# 名寄せ結果 (is_new, suggested_id, suggested_name)
+NameMatch = Tuple[bool, Optional[int], Optional[str]]
+
+
+def _search_space(catalog: Catalog, query_key: str) -> Tuple[List, List[str]]:
     """
-    # raw_name が None の場合、.lower() を呼び出すとエラーになるため、ここで処理を止める
-    if raw_name is None or not str(raw_name).strip():
-        # 新規と判定し、IDはNone、名称は空文字列として返す（または、元のraw_nameがNoneであればNoneを返す）
-        return (True, None, raw_name) 
+    類似度を計算する対象 (エンティティのリスト, 正規化済みのキーのリスト) を返す。
+    大きなカタログでは転置インデックスで候補を絞り込む。候補が少なすぎる場合 (共有する文字の無いクエリなど) も
+    全件は走査せず、カタログの先頭の一部で補う (サジェストの件数を揃えるため。類似度はいずれも低い)。
+    """
+    if len(catalog) < NGRAM_INDEX_MIN_SIZE:
+        return catalog.snapshot()
+
+    entities, keys = catalog.candidates(query_key, NGRAM_CANDIDATE_LIMIT)
+    if len(entities) < NGRAM_MIN_CANDIDATES:
+        found = {entity.id for entity in entities}
+        all_entities, all_keys = catalog.snapshot()
+        for entity, key in zip(all_entities, all_keys):
+            if len(entities) >= NGRAM_CANDIDATE_LIMIT:
+                break
+            if entity.id not in found:
+                entities.append(entity)
+                keys.append(key)
+    return entities, keys
+
+
+def _resolve_cheaply(key: str, catalog: Catalog) -> Optional[Tuple[str, Entity]]:
+    """
+    類似度計算を行わずに済む段階 (完全一致 -> 別名 -> 前方一致) で名寄せを試みる。
+    :return: 見つかった場合は (段階, エンティティ)、見つからなければ None
+    """
+    exact_match = catalog.lookup(key)
+    if exact_match is not None:
+        return TIER_EXACT, exact_match
 
-    # raw_name を文字列として扱い、前後の空白を除去
-    raw_name = str(raw_name).strip()
-    
-    # データベースから既存のデータを取得
-    existing_list = existing_data_getter(user_id)
+    alias_match = catalog.resolve_alias(key)
+    if alias_match is not None:
+        return TIER_ALIAS, alias_match
 
-    if not existing_list:
-        return (True, None, raw_name)
+    # 読み取った名称で始まる既存の名称のうち、最も短い (余分な部分が少ない) もの
+    prefix_matches = catalog.prefix_matches(key, PREFIX_TIER_LIMIT)
+    if prefix_matches:
+        shortest = min(prefix_matches, key=lambda entity: len(canonical_key(entity.name)))
+        if fuzz.WRatio(key, canonical_key(shortest.name)) >= SIMILARITY_THRESHOLD:
+            return TIER_PREFIX, shortest
 
-    # 名寄せ処理
-    best_match: Optional[Union[Item, Store]] = None
-    best_score = 0.0
+    return None
 
-    for entity in existing_list:
-        # Item/Storeスキーマの name 属性を使用
-        existing_name = entity.name
 
-        # RapidFuzzによる類似度計算 (WRatioは単語の順序や長さの違いに強い)
-        score = fuzz.WRatio(raw_name.lower(), existing_name.lower())
-
-        if score > best_score:
-            best_score = score
-            best_match = entity
-
-    # print(
-    #     f"Best match for '{raw_name}': '{best_match.name if best_match else None}' with score {best_score}"
-    # )
-    if best_score >= SIMILARITY_THRESHOLD and best_match is not None:
-        # 既存のものと判定
-        return (False, best_match.id, best_match.name)
+def _match_names(
+    raw_names: Iterable[Optional[str]], catalog: Catalog
+) -> Dict[str, NameMatch]:
+    """
+    複数の名称をまとめて名寄せする。
+    名称は canonical_key で正規化し、完全一致 -> 別名 -> 前方一致 -> 類似度計算 の順に試す。
+    同じ名称 (レシートの全行で同じ店舗名など) は1度だけ計算し、
+    安い段階で決まらなかった全名称 x 既存データの類似度を rapidfuzz の cdist で一括計算する。
+    (大きなカタログでは、名称ごとに転置インデックスで絞り込んだ候補とだけ比較する)
+
+    :param raw_names: OCRから読み取られた元の名称のリスト
+    :param catalog: 既存の商品または店舗のカタログ
+    :return: 前後の空白を除去した名称 -> (is_new, suggested_id, suggested_name) の辞書
+    """
+    queries = list(
+        dict.fromkeys(
+            str(raw_name).strip()
+            for raw_name in raw_names
+            if raw_name is not None and str(raw_name).strip()
+        )
+    )
+    if not queries:
+        return {}
+
+    if not len(catalog):
+        for _ in queries:
+            _count_tier(TIER_NEW)
+        return {query: (True, None, query) for query in queries}
+
+    matches: Dict[str, NameMatch] = {}
+    query_keys: Dict[str, str] = {}
+    for query in queries:
+        key = canonical_key(query)
+        resolved = _resolve_cheaply(key, catalog)
+        if resolved is not None:
+            tier, entity = resolved
+            _count_tier(tier)
+            matches[query] = (False, entity.id, entity.name)
+        else:
+            query_keys[query] = key
+    if not query_keys:
+        return matches
+
+    # (名称のリスト, 比較対象のエンティティ, その正規化済みのキー) の組
+    if len(catalog) < NGRAM_INDEX_MIN_SIZE:
+        groups = [(list(query_keys), *catalog.snapshot())]
     else:
-        # 新規と判定（または類似度が低すぎる）
-        # 提案名には生のOCRデータをセット
+        groups = [([query], *_search_space(catalog, key)) for query, key in query_keys.items()]
+
+    for group_queries, existing_list, existing_keys in groups:
+        # RapidFuzzによる類似度計算 (WRatioは単語の順序や長さの違いに強い)
+        scores = process.cdist(
+            [query_keys[query] for query in group_queries],
+            existing_keys,
+            scorer=fuzz.WRatio,
+            dtype=np.float64,
+        )
+
+        for query, row in zip(group_queries, scores):
+            # 同点の場合は先に現れたものを採用する
+            best_index = int(row.argmax())
+            best_match = existing_list[best_index]
+            if row[best_index] >= SIMILARITY_THRESHOLD:
+                # 既存のものと判定
+                _count_tier(TIER_FUZZY)
+                matches[query] = (False, best_match.id, best_match.name)
+            else:
+                # 新規と判定（または類似度が低すぎる）
+                # 提案名には生のOCRデータをセット
+                _count_tier(TIER_NEW)
+                matches[query] = (True, None, query)
+    return matches
+
+
+def _match_names_exactly(raw_names: Iterable[Optional[str]], catalog: Catalog) -> Dict[str, NameMatch]:
+    """
+    一括取り込み用の名寄せ。正規化したキーが既存の名称か別名と完全に一致するものだけを既存と判定し、
+    それ以外は新規とする (ユーザーの確認が無いため、「低脂肪牛乳」を「牛乳」にまとめるような類似度での判定はしない)。
+
+    :return: _match_names と同じ形式の辞書
+    """
+    matches: Dict[str, NameMatch] = {}
+    for raw_name in raw_names:
+        query = "" if raw_name is None else str(raw_name).strip()
+        if not query or query in matches:
+            continue
+        key = canonical_key(query)
+        entity = catalog.lookup(key) or catalog.resolve_alias(key)
+        matches[query] = (True, None, query) if entity is None else (False, entity.id, entity.name)
+    return matches
+
+
+def _lookup_match(matches: Dict[str, NameMatch], raw_name: Optional[str]) -> NameMatch:
+    """_match_names の結果から raw_name の名寄せ結果を取り出す"""
+    # raw_name が None や空の場合は新規と判定し、IDはNone、名称は元のraw_nameのまま返す
+    if raw_name is None or not str(raw_name).strip():
         return (True, None, raw_name)
+    return matches[str(raw_name).strip()]
 
 
-def _suggest_by_similarity(
-    user_id: str, query: str, existing_data_getter, entity_type
-) -> List:
+def _normalize_name(
+    user_id: str, raw_name: Optional[str], catalog_getter
+) -> NameMatch:
     """
-    商品・店舗サジェスト機能の共通ロジック。
-    類似度計算(WRatio)に基づき、スコアの高い順に上位 SUGGESTION_LIMIT 件を返す。
+    商品名または店舗名の名寄せ処理を実行し、結果を返す。
+
+    :param raw_name: OCRから読み取られた元の名称
+    :param catalog_getter: 既存データのカタログを取得する関数 (e.g., db_manager.get_item_catalog)
+    :return: (is_new, suggested_id, suggested_name) のタプル
     """
-    # DBから既存データを取得
-    all_entities = existing_data_getter(user_id)
-    query_lower = query.lower()
+    if raw_name is None or not str(raw_name).strip():
+        return (True, None, raw_name)
 
-    if not all_entities:
-        return []
+    # 既存のデータを取得 (キャッシュ済みならDBには問い合わせない)
+    catalog = catalog_getter(user_id)
+    return _lookup_match(_match_names([raw_name], catalog), raw_name)
 
-    scored_entities = []
-    for entity in all_entities:
-        # Item/Storeスキーマの name 属性を使用
-        existing_name = entity.name
 
-        # RapidFuzzによる類似度計算 (WRatioは単語の順序や長さの違いに強い)
-        score = fuzz.WRatio(query_lower, existing_name.lower())
+def _suggest_by_similarity(user_id: str, query: str, catalog_getter) -> Tuple[List, str]:
+    """
+    商品・店舗サジェスト機能の共通ロジック。
+    名称は canonical_key で正規化して比較する。
+    入力途中の名称で前方一致するものが SUGGESTION_LIMIT 件以上あれば、それを名称順に返す。
+    足りない場合は、類似度計算(WRatio)に基づき、スコアの高い順に上位 SUGGESTION_LIMIT 件を返す。
+    上位件数の抽出は rapidfuzz.process.extract に任せる (同点の場合はカタログ内の順序を保つ)。
+
+    :return: (サジェストのリスト, どちらの方法で求めたか) のタプル
+    """
+    query_key = canonical_key(query)
+    catalog = catalog_getter(user_id)
 
-        # スコアとエンティティをタプルで保持
-        scored_entities.append((score, entity))
+    # 前方一致 (タイプ中の入力の大半はこちらで足りる)
+    prefix_matches = catalog.prefix_matches(query_key, SUGGESTION_LIMIT)
+    if len(prefix_matches) >= SUGGESTION_LIMIT:
+        return prefix_matches, SUGGEST_PATH_PREFIX
 
-    # スコアで降順ソート
-    scored_entities.sort(key=lambda x: x[0], reverse=True)
+    # 既存データから、類似度を計算する対象を絞り込む (名称は正規化済み)
+    all_entities, keys = _search_space(catalog, query_key)
 
-    # 上位 SUGGESTION_LIMIT 件を抽出し、エンティティ本体のみを返す
-    # (SUGGESTION_LIMIT はコード冒頭で定義された定数)
-    suggestions = [entity for score, entity in scored_entities[:SUGGESTION_LIMIT]]
+    if not all_entities:
+        return [], SUGGEST_PATH_FUZZY
+
+    results = process.extract(
+        query_key,
+        keys,
+        scorer=fuzz.WRatio,
+        limit=SUGGESTION_LIMIT,
+        score_cutoff=SUGGESTION_SCORE_CUTOFF,
+    )
 
-    return suggestions
+    # (名称, スコア, インデックス) のタプルから、エンティティ本体のみを返す
+    return [all_entities[index] for _, _, index in results], SUGGEST_PATH_FUZZY
 
 
 # --- メインロジック ---
 
 
-def normalize_ocr_data(
-    user_id: str,
+def _none_to_empty(raw_name: Optional[str]) -> str:
+    """名称が None の場合は空文字列として扱う"""
+    return "" if raw_name is None else raw_name
+
+
+def _build_ocr_result(
     raw_store_name: str,
     raw_item_name: str,
-    raw_price: str,
+    raw_price,
     raw_purchase_date: Optional[str],
+    store_match: NameMatch,
+    item_match: NameMatch,
+    price: Optional[float] = None,
 ) -> OCRResult:
     """
-    OCR抽出データを正規化し、名寄せ結果（提案）を含むOCRResultスキーマを返す。
+    名寄せ結果と、日付・価格の正規化結果から OCRResult スキーマを構築する。
+    price を指定した場合は、raw_price を正規化せずにその値を使う。
     """
-    if raw_store_name is None:
-        raw_store_name = ""
-        
-    if raw_item_name is None:
-        raw_item_name = ""
-    
-    # raw_purchase_date は既に None のチェックがあるが、
-    # _normalize_name の呼び出し側で str() されることを考えると、
-    # 他の raw データもここで安全を確保しておくと良い。
     if raw_purchase_date is None:
         raw_purchase_date = ""
-    
+
     # 日付の正規化
     normalized_date = _normalize_date(raw_purchase_date)
 
     raw_price = str(raw_price)
     # 価格の正規化
-    normalized_price = _normalize_price(raw_price)
+    normalized_price = _normalize_price(raw_price) if price is None else price
 
-    # 店舗名の名寄せ
-    (is_new_store, suggested_store_id, suggested_store_name) = _normalize_name(
-        user_id, raw_store_name, db_manager.get_stores_by_user  # 既存店舗取得関数
-    )
-
-    # 商品名の名寄せ
-    (is_new_item, suggested_item_id, suggested_item_name) = _normalize_name(
-        user_id, raw_item_name, db_manager.get_items_by_user  # 既存商品取得関数
-    )
+    (is_new_store, suggested_store_id, suggested_store_name) = store_match
+    (is_new_item, suggested_item_id, suggested_item_name) = item_match
 
     # OCRResult スキーマの構築
     # raw_priceはfloatで、raw_purchase_dateはdateオブジェクト
@@ -236,19 +407,152 @@ def normalize_ocr_data(
     )
 
 
+def normalize_ocr_data(
+    user_id: str,
+    raw_store_name: str,
+    raw_item_name: str,
+    raw_price: str,
+    raw_purchase_date: Optional[str],
+) -> OCRResult:
+    """
+    OCR抽出データを正規化し、名寄せ結果（提案）を含むOCRResultスキーマを返す。
+    レシート全体をまとめて処理する場合は normalize_receipt を使うこと。
+    """
+    raw_store_name = _none_to_empty(raw_store_name)
+    raw_item_name = _none_to_empty(raw_item_name)
+
+    # 店舗名の名寄せ
+    store_match = _normalize_name(
+        user_id, raw_store_name, db_manager.get_store_catalog  # 既存店舗取得関数
+    )
+
+    # 商品名の名寄せ
+    item_match = _normalize_name(
+        user_id, raw_item_name, db_manager.get_item_catalog  # 既存商品取得関数
+    )
+
+    return _build_ocr_result(
+        raw_store_name, raw_item_name, raw_price, raw_purchase_date, store_match, item_match
+    )
+
+
+def normalize_receipt(user_id: str, raw_data_list: List[dict]) -> List[OCRResult]:
+    """
+    レシート1枚分のOCR抽出データ (各行の辞書のリスト) をまとめて正規化する。
+    既存の店舗・商品は1度だけ取得し、名寄せは行をまたいで一括計算する。
+    """
+    lines = [
+        (
+            _none_to_empty(raw_data.get("store_name", "不明な店舗")),
+            _none_to_empty(raw_data.get("item_name", "不明な商品")),
+            raw_data.get("price", 0.0),
+            raw_data.get("purchase_date", None),
+        )
+        for raw_data in raw_data_list
+    ]
+    if not lines:
+        return []
+
+    # 既存データの取得はレシート1枚につき1回ずつ
+    store_matches = _match_names(
+        (line[0] for line in lines), db_manager.get_store_catalog(user_id)
+    )
+    item_matches = _match_names(
+        (line[1] for line in lines), db_manager.get_item_catalog(user_id)
+    )
+
+    return [
+        _build_ocr_result(
+            raw_store_name,
+            raw_item_name,
+            raw_price,
+            raw_purchase_date,
+            _lookup_match(store_matches, raw_store_name),
+            _lookup_match(item_matches, raw_item_name),
+        )
+        for raw_store_name, raw_item_name, raw_price, raw_purchase_date in lines
+    ]
+
+
+def normalize_import_rows(
+    user_id: str, raw_data_list: List[dict]
+) -> Tuple[List[Tuple[int, OCRResult]], List[Tuple[int, str]]]:
+    """
+    一括取り込み用に、normalize_receipt と同様の名寄せ・正規化をまとめて行う。
+    OCRと違い値は補わず、日付や価格を読み取れない行は、その行だけをエラーとして返す。
+    名寄せは完全一致と別名だけで行い、一致しない名称は新規とする (_match_names_exactly)。
+
+    :param raw_data_list: normalize_receipt と同じ形式の辞書のリスト
+    :return: (正規化できた行の (添字, OCRResult), できなかった行の (添字, 理由)) のタプル
+    """
+    results: List[Tuple[int, OCRResult]] = []
+    errors: List[Tuple[int, str]] = []
+    lines = []
+    for index, raw_data in enumerate(raw_data_list):
+        store_name = str(_none_to_empty(raw_data.get("store_name"))).strip()
+        item_name = str(_none_to_empty(raw_data.get("item_name"))).strip()
+        raw_price = raw_data.get("price")
+        raw_purchase_date = raw_data.get("purchase_date")
+        price = _parse_import_price(raw_price)
+        if not item_name:
+            errors.append((index, "item name is missing"))
+        elif not store_name:
+            errors.append((index, "store name is missing"))
+        elif _parse_date(raw_purchase_date or "") is None:
+            errors.append((index, f"invalid purchase date: {raw_purchase_date!r}"))
+        elif price is None:
+            errors.append((index, f"invalid price: {raw_price!r}"))
+        else:
+            lines.append((index, store_name, item_name, raw_price, price, str(raw_purchase_date)))
+    if not lines:
+        return results, errors
+
+    # 既存データの取得は、まとめて1回ずつ
+    store_matches = _match_names_exactly((line[1] for line in lines), db_manager.get_store_catalog(user_id))
+    item_matches = _match_names_exactly((line[2] for line in lines), db_manager.get_item_catalog(user_id))
+
+    for index, store_name, item_name, raw_price, price, raw_purchase_date in lines:
+        try:
+            result = _build_ocr_result(
+                store_name,
+                item_name,
+                raw_price,
+                raw_purchase_date,
+                _lookup_match(store_matches, store_name),
+                _lookup_match(item_matches, item_name),
+                price=price,
+            )
+        except ValidationError as e:
+            # 名称が長すぎる場合など
+            errors.append((index, f"invalid row: {e.errors()[0]['msg']}"))
+            continue
+        results.append((index, result))
+    return results, errors
+
+
 def suggest_items(user_id: str, query: str) -> List[Item]:
     """
     ユーザーIDと入力クエリに基づいて、既存の商品名からサジェストリストを返す。
-    類似度計算(WRatio)に基づき、スコアの高い順に上位10件を返す。
+    前方一致で10件揃えばそれを、揃わなければ類似度計算(WRatio)に基づき、スコアの高い順に上位10件を返す。
     """
-    # 共通ロジック関数を呼び出し、既存商品取得関数と商品型を渡す
-    return _suggest_by_similarity(user_id, query, db_manager.get_items_by_user, Item)
+    return suggest_items_with_path(user_id, query)[0]
+
+
+def suggest_items_with_path(user_id: str, query: str) -> Tuple[List[Item], str]:
+    """suggest_items と同じだが、どの方法で求めたか (SUGGEST_PATH_*) も合わせて返す"""
+    # 共通ロジック関数を呼び出し、既存商品のカタログ取得関数を渡す
+    return _suggest_by_similarity(user_id, query, db_manager.get_item_catalog)
 
 
 def suggest_stores(user_id: str, query: str) -> List[Store]:
     """
     ユーザーIDと入力クエリに基づいて、既存の店舗名からサジェストリストを返す。
-    類似度計算(WRatio)に基づき、スコアの高い順に上位10件を返す。
+    前方一致で10件揃えばそれを、揃わなければ類似度計算(WRatio)に基づき、スコアの高い順に上位10件を返す。
     """
-    # 共通ロジック関数を呼び出し、既存店舗取得関数と店舗型を渡す
-    return _suggest_by_similarity(user_id, query, db_manager.get_stores_by_user, Store)
+    return suggest_stores_with_path(user_id, query)[0]
+
+
+def suggest_stores_with_path(user_id: str, query: str) -> Tuple[List[Store], str]:
+    """suggest_stores と同じだが、どの方法で求めたか (SUGGEST_PATH_*) も合わせて返す"""
+    # 共通ロジック関数を呼び出し、既存店舗のカタログ取得関数を渡す
+    return _suggest_by_similarity(user_id, query, db_manager.get_store_catalog)
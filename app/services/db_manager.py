@@ -1,11 +1,105 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+from app.core.cache import TTLCache
+from app.core.config import settings
 from app.api.v1.schemas.user import User
 from app.api.v1.schemas.item import Item, ItemCreate
 from app.api.v1.schemas.store import Store, StoreCreate
-from app.api.v1.schemas.record import Record, RecordCreate, PriceComparison
+from app.api.v1.schemas.record import Record, RecordCreate, ReceiptLineCreate, PriceComparison
+from app.api.v1.schemas.job import Job, JobStatus
 
 # データベース操作の専門家であるdatabaseモジュールをインポート
 from app.db import database
+# その非同期版 (async def のエンドポイントからは、こちらを await して使う)
+from app.db import async_database
+from app.services.catalog import Catalog, Entity
+from app.services.text_normalizer import canonical_key
+
+
+# --- 0. 商品・店舗一覧 (カタログ) のキャッシュ ---
+# キーは ("items" | "stores", user_id)。名寄せやサジェストのたびに全件をDBから取得しないよう、
+# ユーザーごとのカタログをメモリに保持し、登録/更新/削除のたびにその場で更新する。
+catalog_cache = TTLCache(
+    max_size=settings.CATALOG_CACHE_MAX_ENTRIES, default_ttl=settings.CATALOG_CACHE_TTL
+)
+ITEMS = "items"
+STORES = "stores"
+
+
+def _catalog_upsert(kind: str, user_id: str, entity: Optional[Entity]) -> None:
+    """キャッシュ済みのカタログがあれば、エンティティを追加・置換する"""
+    catalog = catalog_cache.peek((kind, user_id))
+    if catalog is not None and entity is not None:
+        catalog.upsert(entity)
+
+
+def _catalog_remove(kind: str, user_id: str, entity_id: int) -> None:
+    """キャッシュ済みのカタログがあれば、エンティティを削除する"""
+    catalog = catalog_cache.peek((kind, user_id))
+    if catalog is not None:
+        catalog.remove(entity_id)
+
+
+def invalidate_catalogs(user_id: str) -> None:
+    """ユーザーの商品・店舗カタログのキャッシュを破棄する"""
+    catalog_cache.pop((ITEMS, user_id))
+    catalog_cache.pop((STORES, user_id))
+
+
+def learn_aliases(user_id: str, record_in: RecordCreate) -> None:
+    """
+    確定した購入履歴の、OCRで読み取った名称 -> 商品・店舗 の対応を別名としてカタログに覚えさせる。
+    次回以降、同じ読み取り結果は類似度計算なしで名寄せできる。
+    (DBへの保存は save_aliases で行う)
+    """
+    item_catalog = catalog_cache.peek((ITEMS, user_id))
+    if item_catalog is not None and record_in.raw_item_name:
+        item_catalog.add_alias(record_in.raw_item_name, record_in.item_id)
+    store_catalog = catalog_cache.peek((STORES, user_id))
+    if store_catalog is not None and record_in.raw_store_name:
+        store_catalog.add_alias(record_in.raw_store_name, record_in.store_id)
+
+
+def save_aliases(user_id: str, *records_in: RecordCreate) -> None:
+    """
+    確定した購入履歴の、OCRで読み取った名称 -> 商品・店舗 の対応を別名テーブルに保存する。
+    (レシート1枚分など複数件を渡した場合、同じ対応は1回だけ保存する)
+    レスポンスを待たせないよう、エンドポイントからはバックグラウンドタスクとして呼び出す。
+    """
+    aliases = {}
+    for record_in in records_in:
+        for kind, raw_name, entity_id in (
+            (ITEMS, record_in.raw_item_name, record_in.item_id),
+            (STORES, record_in.raw_store_name, record_in.store_id),
+        ):
+            alias_key = canonical_key(raw_name or "")
+            if alias_key:
+                aliases[(kind, alias_key)] = entity_id
+    for (kind, alias_key), entity_id in aliases.items():
+        database.record_name_alias(user_id, kind, alias_key, entity_id)
+
+
+def get_item_catalog(user_id: str) -> Catalog:
+    """特定ユーザーの商品カタログを返す（キャッシュに無ければDBから取得する）"""
+    catalog = catalog_cache.get((ITEMS, user_id))
+    if catalog is None:
+        catalog = Catalog(
+            database.get_items_by_user(user_id=user_id),
+            database.get_name_aliases(user_id, ITEMS),
+        )
+        catalog_cache.set((ITEMS, user_id), catalog)
+    return catalog
+
+
+def get_store_catalog(user_id: str) -> Catalog:
+    """特定ユーザーの店舗カタログを返す（キャッシュに無ければDBから取得する）"""
+    catalog = catalog_cache.get((STORES, user_id))
+    if catalog is None:
+        catalog = Catalog(
+            database.get_stores_by_user(user_id=user_id),
+            database.get_name_aliases(user_id, STORES),
+        )
+        catalog_cache.set((STORES, user_id), catalog)
+    return catalog
 
 
 # --- 1. ユーザー (User) 関連 ---
@@ -25,60 +119,106 @@ def get_user_by_uuid(user_uuid: str) -> Optional[User]:
     return database.get_user_by_uuid(user_uuid=user_uuid)
 
 
+def _delete_batch_size() -> Optional[int]:
+    """全データ削除で1回に削除する行数 (0以下なら None = 全件を1トランザクションで)"""
+    return settings.DELETE_BATCH_SIZE if settings.DELETE_BATCH_SIZE > 0 else None
+
+
 def delete_all_user_data(user_uuid: str) -> bool:
     """ユーザーの全データを削除する"""
-    return database.delete_all_user_data(user_uuid=user_uuid)
+    success = database.delete_all_user_data(user_uuid=user_uuid, batch_size=_delete_batch_size())
+    invalidate_catalogs(user_uuid)
+    return success
 
 
 # --- 2. 商品 (Item) 関連 ---
 
 def create_item(user_id: str, item_in: ItemCreate) -> Item:
     """商品を新規登録する"""
-    return database.create_item(user_id=user_id, item_in=item_in)
+    item = database.create_item(user_id=user_id, item_in=item_in)
+    _catalog_upsert(ITEMS, user_id, item)
+    return item
 
 
 def get_items_by_user(user_id: str) -> List[Item]:
-    """特定ユーザーの全商品リストを取得する"""
+    """
+    特定ユーザーの全商品リストを取得する。
+    カタログキャッシュはプロセスごとにあり、他のワーカーでの変更が反映されないため、一覧は毎回DBから取得する
+    (キャッシュは名寄せ・サジェストにのみ使う)。
+    """
     return database.get_items_by_user(user_id=user_id)
 
 
+def get_items_page(
+    user_id: str, fields: List[str], limit: int, after: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """特定ユーザーの商品を1ページ分取得する (キーセット方式。カタログキャッシュは使わない)"""
+    return database.get_items_page(user_id=user_id, fields=fields, limit=limit, after=after)
+
+
 def update_item(user_id: str, item_id: int, item_in: ItemCreate) -> Optional[Item]:
     """商品情報を更新する"""
-    return database.update_item(user_id=user_id, item_id=item_id, item_in=item_in)
+    item = database.update_item(user_id=user_id, item_id=item_id, item_in=item_in)
+    _catalog_upsert(ITEMS, user_id, item)
+    return item
 
 
 def delete_item(user_id: str, item_id: int) -> bool:
     """商品を削除する"""
-    return database.delete_item(user_id=user_id, item_id=item_id)
+    success = database.delete_item(user_id=user_id, item_id=item_id)
+    if success:
+        _catalog_remove(ITEMS, user_id, item_id)
+    return success
 
 
 # --- 3. 店舗 (Store) 関連 ---
 
 def create_store(user_id: str, store_in: StoreCreate) -> Store:
     """店舗を新規登録する"""
-    return database.create_store(user_id=user_id, store_in=store_in)
+    store = database.create_store(user_id=user_id, store_in=store_in)
+    _catalog_upsert(STORES, user_id, store)
+    return store
 
 
 def get_stores_by_user(user_id: str) -> List[Store]:
-    """特定ユーザーの全店舗リストを取得する"""
+    """特定ユーザーの全店舗リストを取得する (一覧はカタログキャッシュを使わず、毎回DBから取得する)"""
     return database.get_stores_by_user(user_id=user_id)
 
 
+def get_stores_page(
+    user_id: str, fields: List[str], limit: int, after: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """特定ユーザーの店舗を1ページ分取得する (キーセット方式。カタログキャッシュは使わない)"""
+    return database.get_stores_page(user_id=user_id, fields=fields, limit=limit, after=after)
+
+
+def get_store_by_id(user_id: str, store_id: int) -> Optional[Store]:
+    """店舗IDで店舗を取得する"""
+    return database.get_store_by_id(user_id=user_id, store_id=store_id)
+
+
 def update_store(user_id: str, store_id: int, store_in: StoreCreate) -> Optional[Store]:
     """店舗情報を更新する"""
-    return database.update_store(user_id=user_id, store_id=store_id, store_in=store_in)
+    store = database.update_store(user_id=user_id, store_id=store_id, store_in=store_in)
+    _catalog_upsert(STORES, user_id, store)
+    return store
 
 
 def delete_store(user_id: str, store_id: int) -> bool:
     """店舗を削除する"""
-    return database.delete_store(user_id=user_id, store_id=store_id)
+    success = database.delete_store(user_id=user_id, store_id=store_id)
+    if success:
+        _catalog_remove(STORES, user_id, store_id)
+    return success
 
 
 # --- 4. 購入履歴 (Record) 関連 ---
 
 def create_purchase_record(user_id: str, record_in: RecordCreate) -> Record:
-    """購入履歴を登録する"""
-    return database.create_purchase_record(user_id=user_id, record_in=record_in)
+    """購入履歴を登録する (OCRで読み取った名称は別名として覚える)"""
+    record = database.create_purchase_record(user_id=user_id, record_in=record_in)
+    learn_aliases(user_id, record_in)
+    return record
 
 
 def get_records_by_item_id(user_id: str, item_id: int) -> List[Record]:
@@ -86,6 +226,15 @@ def get_records_by_item_id(user_id: str, item_id: int) -> List[Record]:
     return database.get_records_by_item_id(user_id=user_id, item_id=item_id)
 
 
+def get_records_page_by_item_id(
+    user_id: str, item_id: int, fields: List[str], limit: int, after: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """特定商品IDの購入履歴を1ページ分取得する (キーセット方式)"""
+    return database.get_records_page_by_item_id(
+        user_id=user_id, item_id=item_id, fields=fields, limit=limit, after=after
+    )
+
+
 def update_record(user_id: str, record_id: int, record_in: RecordCreate) -> Optional[Record]:
     """購入履歴を更新する"""
     return database.update_record(user_id=user_id, record_id=record_id, record_in=record_in)
@@ -96,9 +245,260 @@ def delete_record(user_id: str, record_id: int) -> bool:
     return database.delete_record(user_id=user_id, record_id=record_id)
 
 
+def _confirmed_lines(
+    user_id: str, lines: List[ReceiptLineCreate], records: List[Record]
+) -> List[RecordCreate]:
+    """
+    一括登録の結果 (DB側で作成された商品・店舗を含む) をカタログに反映し、
+    各行を商品・店舗IDの確定した RecordCreate として返す (別名の学習・保存用)。
+    """
+    confirmed: List[RecordCreate] = []
+    for line, record in zip(lines, records):
+        _catalog_upsert(ITEMS, user_id, Item(id=record.item_id, name=record.item_name, user_id=user_id))
+        _catalog_upsert(STORES, user_id, Store(id=record.store_id, name=record.store_name, user_id=user_id))
+        confirmed_line = line.model_copy(update={"item_id": record.item_id, "store_id": record.store_id})
+        learn_aliases(user_id, confirmed_line)
+        confirmed.append(confirmed_line)
+    return confirmed
+
+
+def confirm_receipt_batch(
+    user_id: str, lines: List[ReceiptLineCreate]
+) -> Optional[Tuple[List[Record], List[RecordCreate]]]:
+    """
+    レシート1枚分の購入履歴を、未登録の商品・店舗の作成も含めて1回のDB呼び出しで登録する。
+    :return: (登録した購入履歴, IDの確定した各行) のタプル。失敗した場合は None
+    """
+    records = database.confirm_receipt_batch(user_id=user_id, lines=lines)
+    if records is None:
+        return None
+    return records, _confirmed_lines(user_id, lines, records)
+
+
 # --- 5. 特別集計・その他 ---
 
 def get_item_price_comparisons(user_id: str, item_id: int) -> List[PriceComparison]:
     """特定商品の店舗ごとの価格比較データを取得する"""
     # 専門家(database)に、RPCを使った特別な調査を依頼する
     return database.get_item_store_price_averages(user_id=user_id, item_id=item_id)
+
+
+def get_export_records_page(
+    user_id: str, limit: int, after: Optional[int] = None
+) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """エクスポート用の購入履歴を1ページ分取得する。(行, 次のページの after) を返す"""
+    return database.get_export_records_page(user_id=user_id, limit=limit, after=after)
+
+
+def start_job(user_id: str, kind: str) -> Optional[Tuple[Job, bool]]:
+    """ジョブを開始する。同じ種類の未完了ジョブがあれば (そのジョブ, False) を返す"""
+    return database.start_job(
+        user_id=user_id, kind=kind, timeout=settings.JOB_TIMEOUT, retention=settings.JOB_RESULT_TTL
+    )
+
+
+def get_job(user_id: str, job_id: str) -> Optional[Job]:
+    """ジョブの状態を取得する"""
+    return database.get_job(user_id=user_id, job_id=job_id)
+
+
+def update_job_status(job_id: str, status: JobStatus, error: Optional[str] = None) -> bool:
+    """ジョブの状態を更新する"""
+    return database.update_job_status(job_id=job_id, status=status, error=error)
+
+
+# --- 6. 非同期版 ---
+# 上記の各関数と同じ処理を、async_database を使って非同期で行う。
+# async def のエンドポイントから呼び出しても、DBへの往復の間にイベントループを止めない。
+
+async def acreate_internal_user_record(user_uuid: str, email: str, username: str) -> Optional[User]:
+    """新しいユーザーの内部DBレコードを作成する"""
+    return await async_database.create_user_internal(
+        user_uuid=user_uuid,
+        email=email,
+        username=username
+    )
+
+
+async def aget_user_by_uuid(user_uuid: str) -> Optional[User]:
+    """UUIDでユーザーを取得する"""
+    return await async_database.get_user_by_uuid(user_uuid=user_uuid)
+
+
+async def adelete_all_user_data(user_uuid: str) -> bool:
+    """ユーザーの全データを削除する"""
+    success = await async_database.delete_all_user_data(
+        user_uuid=user_uuid, batch_size=_delete_batch_size()
+    )
+    invalidate_catalogs(user_uuid)
+    return success
+
+
+async def aget_item_catalog(user_id: str) -> Catalog:
+    """特定ユーザーの商品カタログを返す（キャッシュに無ければDBから取得する）"""
+    catalog = catalog_cache.get((ITEMS, user_id))
+    if catalog is None:
+        catalog = Catalog(
+            await async_database.get_items_by_user(user_id=user_id),
+            await async_database.get_name_aliases(user_id, ITEMS),
+        )
+        catalog_cache.set((ITEMS, user_id), catalog)
+    return catalog
+
+
+async def aget_store_catalog(user_id: str) -> Catalog:
+    """特定ユーザーの店舗カタログを返す（キャッシュに無ければDBから取得する）"""
+    catalog = catalog_cache.get((STORES, user_id))
+    if catalog is None:
+        catalog = Catalog(
+            await async_database.get_stores_by_user(user_id=user_id),
+            await async_database.get_name_aliases(user_id, STORES),
+        )
+        catalog_cache.set((STORES, user_id), catalog)
+    return catalog
+
+
+async def acreate_item(user_id: str, item_in: ItemCreate) -> Item:
+    """商品を新規登録する"""
+    item = await async_database.create_item(user_id=user_id, item_in=item_in)
+    _catalog_upsert(ITEMS, user_id, item)
+    return item
+
+
+async def aget_items_by_user(user_id: str) -> List[Item]:
+    """特定ユーザーの全商品リストを取得する (一覧はカタログキャッシュを使わず、毎回DBから取得する)"""
+    return await async_database.get_items_by_user(user_id=user_id)
+
+
+async def aget_items_page(
+    user_id: str, fields: List[str], limit: int, after: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """特定ユーザーの商品を1ページ分取得する (キーセット方式。カタログキャッシュは使わない)"""
+    return await async_database.get_items_page(user_id=user_id, fields=fields, limit=limit, after=after)
+
+
+async def aupdate_item(user_id: str, item_id: int, item_in: ItemCreate) -> Optional[Item]:
+    """商品情報を更新する"""
+    item = await async_database.update_item(user_id=user_id, item_id=item_id, item_in=item_in)
+    _catalog_upsert(ITEMS, user_id, item)
+    return item
+
+
+async def adelete_item(user_id: str, item_id: int) -> bool:
+    """商品を削除する"""
+    success = await async_database.delete_item(user_id=user_id, item_id=item_id)
+    if success:
+        _catalog_remove(ITEMS, user_id, item_id)
+    return success
+
+
+async def acreate_store(user_id: str, store_in: StoreCreate) -> Store:
+    """店舗を新規登録する"""
+    store = await async_database.create_store(user_id=user_id, store_in=store_in)
+    _catalog_upsert(STORES, user_id, store)
+    return store
+
+
+async def aget_stores_by_user(user_id: str) -> List[Store]:
+    """特定ユーザーの全店舗リストを取得する (一覧はカタログキャッシュを使わず、毎回DBから取得する)"""
+    return await async_database.get_stores_by_user(user_id=user_id)
+
+
+async def aget_stores_page(
+    user_id: str, fields: List[str], limit: int, after: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """特定ユーザーの店舗を1ページ分取得する (キーセット方式。カタログキャッシュは使わない)"""
+    return await async_database.get_stores_page(user_id=user_id, fields=fields, limit=limit, after=after)
+
+
+async def aget_store_by_id(user_id: str, store_id: int) -> Optional[Store]:
+    """店舗IDで店舗を取得する"""
+    return await async_database.get_store_by_id(user_id=user_id, store_id=store_id)
+
+
+async def aupdate_store(user_id: str, store_id: int, store_in: StoreCreate) -> Optional[Store]:
+    """店舗情報を更新する"""
+    store = await async_database.update_store(user_id=user_id, store_id=store_id, store_in=store_in)
+    _catalog_upsert(STORES, user_id, store)
+    return store
+
+
+async def adelete_store(user_id: str, store_id: int) -> bool:
+    """店舗を削除する"""
+    success = await async_database.delete_store(user_id=user_id, store_id=store_id)
+    if success:
+        _catalog_remove(STORES, user_id, store_id)
+    return success
+
+
+async def acreate_purchase_record(user_id: str, record_in: RecordCreate) -> Record:
+    """購入履歴を登録する (OCRで読み取った名称は別名として覚える)"""
+    record = await async_database.create_purchase_record(user_id=user_id, record_in=record_in)
+    learn_aliases(user_id, record_in)
+    return record
+
+
+async def aget_records_by_item_id(user_id: str, item_id: int) -> List[Record]:
+    """特定商品IDに紐づく購入履歴を全て取得する"""
+    return await async_database.get_records_by_item_id(user_id=user_id, item_id=item_id)
+
+
+async def aconfirm_receipt_batch(
+    user_id: str, lines: List[ReceiptLineCreate]
+) -> Optional[Tuple[List[Record], List[RecordCreate]]]:
+    """
+    レシート1枚分の購入履歴を、未登録の商品・店舗の作成も含めて1回のDB呼び出しで登録する。
+    :return: (登録した購入履歴, IDの確定した各行) のタプル。失敗した場合は None
+    """
+    records = await async_database.confirm_receipt_batch(user_id=user_id, lines=lines)
+    if records is None:
+        return None
+    return records, _confirmed_lines(user_id, lines, records)
+
+
+async def aget_records_page_by_item_id(
+    user_id: str, item_id: int, fields: List[str], limit: int, after: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """特定商品IDの購入履歴を1ページ分取得する (キーセット方式)"""
+    return await async_database.get_records_page_by_item_id(
+        user_id=user_id, item_id=item_id, fields=fields, limit=limit, after=after
+    )
+
+
+async def aupdate_record(user_id: str, record_id: int, record_in: RecordCreate) -> Optional[Record]:
+    """購入履歴を更新する"""
+    return await async_database.update_record(user_id=user_id, record_id=record_id, record_in=record_in)
+
+
+async def adelete_record(user_id: str, record_id: int) -> bool:
+    """購入履歴を削除する"""
+    return await async_database.delete_record(user_id=user_id, record_id=record_id)
+
+
+async def aget_item_price_comparisons(user_id: str, item_id: int) -> List[PriceComparison]:
+    """特定商品の店舗ごとの価格比較データを取得する"""
+    return await async_database.get_item_store_price_averages(user_id=user_id, item_id=item_id)
+
+
+async def aget_export_records_page(
+    user_id: str, limit: int, after: Optional[int] = None
+) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """エクスポート用の購入履歴を1ページ分取得する。(行, 次のページの after) を返す"""
+    return await async_database.get_export_records_page(user_id=user_id, limit=limit, after=after)
+
+
+async def astart_job(user_id: str, kind: str) -> Optional[Tuple[Job, bool]]:
+    """ジョブを開始する。同じ種類の未完了ジョブがあれば (そのジョブ, False) を返す"""
+    return await async_database.start_job(
+        user_id=user_id, kind=kind, timeout=settings.JOB_TIMEOUT, retention=settings.JOB_RESULT_TTL
+    )
+
+
+async def aget_job(user_id: str, job_id: str) -> Optional[Job]:
+    """ジョブの状態を取得する"""
+    return await async_database.get_job(user_id=user_id, job_id=job_id)
+
+
+async def aupdate_job_status(job_id: str, status: JobStatus, error: Optional[str] = None) -> bool:
+    """ジョブの状態を更新する"""
+    return await async_database.update_job_status(job_id=job_id, status=status, error=error)
@@ -0,0 +1,176 @@
+# exporter.py
+# 購入履歴のエクスポート。
+# DBからキーセット方式で1ページずつ取得し、出力を少しずつ生成して返す。
+# 一時ファイルを作らず、全件をメモリに載せないため、履歴の件数によらずメモリ使用量は一定になる。
+import csv
+import importlib.util
+import io
+import json
+import zlib
+from datetime import date
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from app.services import db_manager
+
+# 1回のDB呼び出しで取得する行数
+EXPORT_PAGE_SIZE = 1000
+# Parquet の1つの行グループにまとめる行数 (この行数ごとに書き出して送信する)
+PARQUET_ROW_GROUP_SIZE = 10000
+# 対応している出力形式
+EXPORT_FORMATS = ("csv", "ndjson", "parquet")
+# 出力の列 (database._to_export_row のキーと同じ順序)
+EXPORT_COLUMNS: List[str] = [
+    "購入日",
+    "価格",
+    "商品名（レシート表記）",
+    "商品名（標準）",
+    "店舗名",
+]
+
+
+def parquet_available() -> bool:
+    """Parquet 出力に必要な pyarrow がインストールされているか"""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+async def _iter_pages(user_id: str, page_size: int) -> AsyncIterator[List[Dict[str, Any]]]:
+    """エクスポート用の購入履歴を、DBから1ページずつ取得して返す"""
+    after: Optional[int] = None
+    while True:
+        rows, after = await db_manager.aget_export_records_page(user_id, page_size, after)
+        if rows:
+            yield rows
+        if after is None:
+            break
+
+
+async def _gzip(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """バイト列をgzip形式 (ヘッダー付き) で圧縮しながら返す"""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        # チャンクごとに圧縮データを送り出す (SYNC_FLUSH しないと最後までまとめて溜め込まれる)
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+async def _csv_chunks(user_id: str, page_size: int) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS, lineterminator="\n")
+
+    def drain() -> bytes:
+        # バッファに書き出した分を取り出し、バッファを空にする
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    # 最初のページを待たずにヘッダー行を返す
+    writer.writeheader()
+    yield drain()
+    async for rows in _iter_pages(user_id, page_size):
+        writer.writerows(rows)
+        yield drain()
+
+
+async def _ndjson_chunks(user_id: str, page_size: int) -> AsyncIterator[bytes]:
+    async for rows in _iter_pages(user_id, page_size):
+        yield "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+
+
+def iter_records_csv(
+    user_id: str, compress: bool = False, page_size: int = EXPORT_PAGE_SIZE
+) -> AsyncIterator[bytes]:
+    """
+    特定ユーザーの全購入履歴をCSV (UTF-8) のバイト列として少しずつ返す。
+    最初にヘッダー行を返し、以降はDBから取得した1ページごとにまとめて返す。
+    :param compress: True の場合、gzipで圧縮したバイト列を返す
+    :param page_size: 1回のDB呼び出しで取得する行数
+    """
+    chunks = _csv_chunks(user_id, page_size)
+    return _gzip(chunks) if compress else chunks
+
+
+def iter_records_ndjson(
+    user_id: str, compress: bool = False, page_size: int = EXPORT_PAGE_SIZE
+) -> AsyncIterator[bytes]:
+    """
+    特定ユーザーの全購入履歴を、1行1件のJSON (NDJSON) として少しずつ返す。
+    CSVと違い、価格は数値のまま出力される。
+    """
+    chunks = _ndjson_chunks(user_id, page_size)
+    return _gzip(chunks) if compress else chunks
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    ParquetWriter の書き込み先。書き込まれたバイト列を溜めておき、take() で取り出す。
+    Parquet のフッターには各行グループの位置が記録されるため、tell() は取り出した分も含めた累計を返す。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _parquet_table(pa, schema, rows: List[Dict[str, Any]]):
+    """整形済みの行を、型付きの列 (購入日: date32, 価格: float64) の Arrow テーブルにする"""
+    columns = {name: [row[name] for row in rows] for name in EXPORT_COLUMNS}
+    columns["購入日"] = [date.fromisoformat(value) if value else None for value in columns["購入日"]]
+    return pa.Table.from_pydict(columns, schema=schema)
+
+
+async def iter_records_parquet(
+    user_id: str,
+    page_size: int = EXPORT_PAGE_SIZE,
+    row_group_size: int = PARQUET_ROW_GROUP_SIZE,
+) -> AsyncIterator[bytes]:
+    """
+    特定ユーザーの全購入履歴を Parquet 形式のバイト列として少しずつ返す。
+    row_group_size 行ごとに1つの行グループとして書き出し、その分をすぐに返す。
+    pyarrow が必要 (呼び出し前に parquet_available() で確認すること)。
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [
+            ("購入日", pa.date32()),
+            ("価格", pa.float64()),
+            ("商品名（レシート表記）", pa.string()),
+            ("商品名（標準）", pa.string()),
+            ("店舗名", pa.string()),
+        ]
+    )
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+    pending: List[Dict[str, Any]] = []
+    try:
+        async for rows in _iter_pages(user_id, page_size):
+            pending.extend(rows)
+            while len(pending) >= row_group_size:
+                group, pending = pending[:row_group_size], pending[row_group_size:]
+                writer.write_table(_parquet_table(pa, schema, group))
+                yield sink.take()
+        if pending:
+            writer.write_table(_parquet_table(pa, schema, pending))
+    finally:
+        writer.close()
+    # フッターを含めた残りを返す
+    yield sink.take()
@@ -0,0 +1,216 @@
+# importer.py
+# 購入履歴の一括取り込み (スプレッドシートなどからの移行用)。
+# アップロードされたファイルを batch_size 行ずつ読み込み、レシートと同じ名寄せ処理を通してから、
+# 未登録の商品・店舗の作成も含めて1バッチ1回のDB呼び出し (confirm_receipt_batch) で登録する。
+import codecs
+import csv
+import json
+from typing import Any, AsyncIterator, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+
+from app.api.v1.schemas.record import OCRResult, ReceiptLineCreate
+from app.services import data_processor, db_manager
+
+# 1回のDB呼び出しで登録する行数
+IMPORT_BATCH_SIZE = 1000
+# batch_size に指定できる最大値
+IMPORT_MAX_BATCH_SIZE = 5000
+# 対応している入力形式
+IMPORT_FORMATS = ("csv", "ndjson")
+# 1回の進捗で返す行エラーの最大数 (残りは件数だけ数える)
+MAX_REPORTED_ERRORS = 100
+# CSVの文字コードを判定するために読む先頭のバイト数
+ENCODING_SNIFF_BYTES = 64 * 1024
+
+# 列名の対応 (エクスポートの列名 -> 内部の名前)。英語の列名はそのまま使える
+COLUMN_ALIASES: Dict[str, str] = {
+    "購入日": "purchase_date",
+    "価格": "price",
+    "商品名（レシート表記）": "raw_item_name",
+    "商品名（標準）": "item_name",
+    "店舗名": "store_name",
+}
+
+# (ファイル内の行番号, 列名を内部の名前にそろえた行) または (行番号, 読み取れなかった理由)
+ParsedRow = Tuple[int, Any]
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str]) -> Optional[str]:
+    """ファイル名の拡張子、または Content-Type から入力形式を判定する。判定できなければ None"""
+    name = (filename or "").lower()
+    if name.endswith(".csv") or content_type == "text/csv":
+        return "csv"
+    if name.endswith((".ndjson", ".jsonl")) or content_type in (
+        "application/x-ndjson",
+        "application/jsonl",
+    ):
+        return "ndjson"
+    return None
+
+
+def _canonical_columns(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        COLUMN_ALIASES.get(str(key).strip(), str(key).strip()): value
+        for key, value in row.items()
+        if key is not None
+    }
+
+
+def _detect_encoding(file: BinaryIO) -> str:
+    """
+    CSVの文字コードを判定する。先頭が UTF-8 として読めなければ、Excel で保存した Shift_JIS (cp932) とみなす。
+    判定のために読んだ分は、ファイルの先頭に戻す。
+    """
+    head = file.read(ENCODING_SNIFF_BYTES)
+    file.seek(0)
+    try:
+        # 途中で切れた最後の1文字は、エラーにしない
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+    except UnicodeDecodeError:
+        return "cp932"
+    # Excel で保存したCSVの BOM は読み飛ばす
+    return "utf-8-sig"
+
+
+def _decode_lines(file: BinaryIO, encoding: str) -> Iterator[str]:
+    """1行ずつデコードする (読めない行より前の行は取り込めるよう、まとめてはデコードしない)"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for line in file:
+        yield decoder.decode(line)
+
+
+def _iter_csv(file: BinaryIO) -> Iterator[ParsedRow]:
+    encoding = _detect_encoding(file)
+    reader = csv.DictReader(_decode_lines(file, encoding))
+    try:
+        for row in reader:
+            yield reader.line_num, _canonical_columns(row)
+    except UnicodeDecodeError:
+        # 判定した文字コードで読めない行があれば、それ以降は読み込まない
+        yield reader.line_num + 1, f"could not decode the file as {'Shift_JIS' if encoding == 'cp932' else 'UTF-8'}"
+
+
+def _iter_ndjson(file: BinaryIO) -> Iterator[ParsedRow]:
+    for line_number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, "invalid JSON"
+            continue
+        if not isinstance(row, dict):
+            yield line_number, "each line must be a JSON object"
+            continue
+        yield line_number, _canonical_columns(row)
+
+
+def _read_batch(rows: Iterator[ParsedRow], size: int) -> List[ParsedRow]:
+    """size 行分を読み込む (ファイルの読み込みを含むため、スレッドプールで実行する)"""
+    batch = []
+    for parsed in rows:
+        batch.append(parsed)
+        if len(batch) >= size:
+            break
+    return batch
+
+
+def _to_line(row: Dict[str, Any], result: OCRResult) -> ReceiptLineCreate:
+    """名寄せ結果から、一括登録の1行分を作る。既存のものはIDで、新規のものは名称で指定する"""
+    return ReceiptLineCreate(
+        # レシート表記の列があればそれを、無ければ名寄せに使った名称を残す
+        raw_item_name=str(row.get("raw_item_name") or result.raw_item_name),
+        raw_store_name=str(row.get("raw_store_name") or result.raw_store_name),
+        raw_price=result.raw_price,
+        raw_purchase_date=result.raw_purchase_date,
+        item_id=result.suggested_item_id,
+        item_name=None if result.suggested_item_id else result.suggested_item_name,
+        store_id=result.suggested_store_id,
+        store_name=None if result.suggested_store_id else result.suggested_store_name,
+        price=result.price,
+        purchase_date=result.purchase_date,
+    )
+
+
+def _normalize_batch(
+    user_id: str, batch: List[ParsedRow]
+) -> Tuple[List[ReceiptLineCreate], List[Dict[str, Any]]]:
+    """
+    1バッチ分の行を名寄せし、(登録する行, 行エラー) を返す。
+    カタログはキャッシュ済みのものを使い、前のバッチで作成された商品・店舗も名寄せの対象になる。
+    """
+    errors: List[Dict[str, Any]] = []
+    rows: List[Tuple[int, Dict[str, Any]]] = []
+    for line_number, parsed in batch:
+        if isinstance(parsed, str):
+            errors.append({"row": line_number, "error": parsed})
+        else:
+            rows.append((line_number, parsed))
+
+    raw_data_list = [
+        {
+            "item_name": row.get("item_name") or row.get("raw_item_name"),
+            "store_name": row.get("store_name") or row.get("raw_store_name"),
+            "price": row.get("price"),
+            "purchase_date": row.get("purchase_date"),
+        }
+        for _, row in rows
+    ]
+    results, failures = data_processor.normalize_import_rows(user_id, raw_data_list)
+    errors.extend({"row": rows[index][0], "error": reason} for index, reason in failures)
+
+    lines: List[ReceiptLineCreate] = []
+    for index, result in results:
+        line_number, row = rows[index]
+        try:
+            lines.append(_to_line(row, result))
+        except ValidationError as e:
+            errors.append({"row": line_number, "error": f"invalid row: {e.errors()[0]['msg']}"})
+    errors.sort(key=lambda error: error["row"])
+    return lines, errors
+
+
+async def import_records(
+    user_id: str, file: BinaryIO, format: str, batch_size: int = IMPORT_BATCH_SIZE
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    ファイルの購入履歴を batch_size 行ずつ取り込み、バッチごとに進捗を返す。
+    1バッチは1トランザクションで登録し、DB側で失敗した場合はそのバッチだけが登録されない。
+    最後に全体の件数をまとめた {"done": True, ...} を返す。
+    """
+    rows = _iter_csv(file) if format == "csv" else _iter_ndjson(file)
+    total = {"rows": 0, "imported": 0, "failed": 0}
+    batch_number = 0
+    while True:
+        batch = await run_in_threadpool(_read_batch, rows, batch_size)
+        if not batch:
+            break
+        batch_number += 1
+
+        lines, errors = await run_in_threadpool(_normalize_batch, user_id, batch)
+        imported = 0
+        if lines:
+            result = await db_manager.aconfirm_receipt_batch(user_id, lines)
+            if result is None:
+                # 1トランザクションのため、このバッチの行は1件も登録されていない
+                errors = [
+                    {"row": batch[0][0], "error": f"batch could not be saved (rows {batch[0][0]}-{batch[-1][0]})"}
+                ] + errors
+            else:
+                imported = len(result[0])
+
+        failed = len(batch) - imported
+        total["rows"] += len(batch)
+        total["imported"] += imported
+        total["failed"] += failed
+        yield {
+            "batch": batch_number,
+            "rows": len(batch),
+            "imported": imported,
+            "failed": failed,
+            "errors": errors[:MAX_REPORTED_ERRORS],
+        }
+
+    yield {"done": True, "batches": batch_number, **total}
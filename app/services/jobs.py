@@ -0,0 +1,52 @@
+# jobs.py
+# 時間のかかる処理をバックグラウンドで実行し、その状態をDB (jobs テーブル) に保存する。
+# エンドポイントはジョブを登録して 202 Accepted を返し、クライアントは状態取得のエンドポイントで完了を確認する。
+# 状態はDBにあるため、ジョブを開始したワーカー以外からも確認でき、別のワーカーから二重に開始されることもない。
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from app.api.v1.schemas.job import Job, JobStatus
+from app.services import db_manager
+
+# ジョブの種類
+DELETE_ALL_USER_DATA = "delete_all_user_data"
+
+# 未完了のジョブが判定の直後に終了した場合に、開始をやり直す回数
+START_ATTEMPTS = 3
+
+
+async def start_job(user_id: str, kind: str) -> Tuple[Job, bool]:
+    """
+    ジョブを登録する (実行は run_job で行う)。
+    同じユーザーの同じ種類のジョブが未完了であれば、新しく作らずにそれを返す (二重実行の防止)。
+    :return: (ジョブ, 新しく作成したか) のタプル
+    """
+    for _ in range(START_ATTEMPTS):
+        started = await db_manager.astart_job(user_id, kind)
+        if started is not None:
+            return started
+    raise RuntimeError(f"Could not start job {kind}")
+
+
+async def get_job(user_id: str, job_id: str) -> Optional[Job]:
+    """ジョブを取得する。他のユーザーのジョブや、保持期間の過ぎたジョブの場合は None"""
+    return await db_manager.aget_job(user_id, job_id)
+
+
+async def run_job(job_id: str, func: Callable[..., Awaitable[Any]], *args: Any) -> None:
+    """
+    func(*args) を実行し、ジョブの状態を更新する。
+    func が例外を投げた場合や False を返した場合は失敗とする。
+    エンドポイントからは BackgroundTasks に登録して呼び出す。
+    """
+    await db_manager.aupdate_job_status(job_id, JobStatus.RUNNING)
+    try:
+        result = await func(*args)
+    except Exception as e:
+        print(f"Error running job {job_id}: {e}")
+        await db_manager.aupdate_job_status(job_id, JobStatus.FAILED, error=str(e))
+        return
+
+    if result is False:
+        await db_manager.aupdate_job_status(job_id, JobStatus.FAILED, error=f"{func.__name__} failed")
+    else:
+        await db_manager.aupdate_job_status(job_id, JobStatus.SUCCEEDED)
@@ -0,0 +1,38 @@
+import re
+import unicodedata
+from functools import lru_cache
+
+import jaconv
+
+# NFKC でも統一されない、ハイフン・長音・波ダッシュの表記ゆれ
+_SYMBOL_TABLE = str.maketrans(
+    {
+        "‐": "-",  # HYPHEN
+        "‑": "-",  # NON-BREAKING HYPHEN
+        "‒": "-",  # FIGURE DASH
+        "–": "-",  # EN DASH
+        "—": "-",  # EM DASH
+        "―": "-",  # HORIZONTAL BAR
+        "−": "-",  # MINUS SIGN
+        "〜": "~",  # WAVE DASH
+        "〰": "~",  # WAVY DASH
+    }
+)
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=65536)
+def canonical_key(text: str) -> str:
+    """
+    商品名・店舗名の表記ゆれを吸収した比較用のキーを返す。
+    - NFKC 正規化 (全角英数字・半角カナ・丸数字などを統一)
+    - 小文字化
+    - カタカナをひらがなに統一
+    - ハイフン・波ダッシュの類を統一
+    - 連続する空白を1つにまとめ、前後の空白を除去
+    例: "ﾎﾟﾃﾄﾁｯﾌﾟｽ　１００ｇ" -> "ぽてとちっぷす 100g"
+    """
+    key = unicodedata.normalize("NFKC", text)
+    key = jaconv.kata2hira(key.lower())
+    key = key.translate(_SYMBOL_TABLE)
+    return _WHITESPACE.sub(" ", key).strip()
@@ -10,6 +10,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # tests/conftest.py (pytestのフィクスチャファイル)
 
 from typing import Generator
+from unittest.mock import patch
 import pytest
 from httpx import AsyncClient
 from fastapi.testclient import TestClient
@@ -30,4 +31,13 @@ MOCK_USER = User(
 def client() -> Generator:
     """FastAPIテストクライアント"""
     with TestClient(app) as c:
-        yield c
\ No newline at end of file
+        yield c
+
+
+@pytest.fixture(autouse=True)
+def no_stored_aliases():
+    """カタログ生成時の別名テーブルの取得 (DBアクセス) を、空の結果に差し替える"""
+    with patch("app.db.database.get_name_aliases", return_value={}), patch(
+        "app.db.async_database.get_name_aliases", return_value={}
+    ):
+        yield
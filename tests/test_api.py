@@ -2,6 +2,7 @@ import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock
 import io
+import json
 import os
 from datetime import date
 from typing import List
@@ -71,8 +72,8 @@ def test_read_users_me_success():
 # -----------------------------------------------------------
 
 
-@patch("app.services.db_manager.create_purchase_record")
-@patch("app.services.data_processor.normalize_ocr_data")
+@patch("app.services.db_manager.acreate_purchase_record")
+@patch("app.services.data_processor.normalize_receipt")
 @patch("app.api.v1.endpoints.receipts.process_image")
 def test_upload_receipt_and_process_success(
     mock_process_image, mock_normalize, mock_create_record
@@ -88,7 +89,7 @@ def test_upload_receipt_and_process_success(
     mock_process_image.return_value = [mock_raw_data]
 
     # 2. 正規化結果のモック (既存アイテムへの名寄せを提案)
-    mock_normalize.return_value = {
+    mock_normalize.return_value = [{
         "raw_item_name": "牛乳パック",
         "raw_store_name": "ファミマ",
         "raw_price": "240.0",
@@ -103,7 +104,7 @@ def test_upload_receipt_and_process_success(
         "suggested_store_name": "ファミリーマート",
         "price": 240.0,
         "purchase_date": date.today().isoformat(),
-    }
+    }]
 
     files = {"file": ("receipt.jpg", DUMMY_IMAGE_BYTES, "image/jpeg")}
     response = client.post("/api/v1/receipts/upload", files=files)
@@ -116,8 +117,9 @@ def test_upload_receipt_and_process_success(
     mock_normalize.assert_called_once()
 
 
-@patch("app.services.db_manager.create_purchase_record")
-def test_confirm_and_register_record_success(mock_create_record):
+@patch("app.services.db_manager.save_aliases")
+@patch("app.services.db_manager.acreate_purchase_record")
+def test_confirm_and_register_record_success(mock_create_record, mock_save_aliases):
     """OCR結果確定後の購入履歴登録テスト"""
     from app.api.v1.schemas.record import RecordCreate, Record
 
@@ -153,6 +155,54 @@ def test_confirm_and_register_record_success(mock_create_record):
     assert response.json()["id"] == 500
     mock_create_record.assert_called_once()
     assert mock_create_record.call_args[0][0] == MOCK_USER.id  # user_idが渡されているか
+    # OCRの読み取り結果 -> 確定した商品・店舗 の対応が別名として保存される
+    mock_save_aliases.assert_called_once()
+    assert mock_save_aliases.call_args[0][0] == MOCK_USER.id
+
+
+@patch("app.services.db_manager.save_aliases")
+@patch("app.services.db_manager.aconfirm_receipt_batch")
+def test_confirm_receipt_batch_success(mock_confirm_batch, mock_save_aliases):
+    """レシート1枚分の一括確定のテスト (新規の商品は名称で指定できる)"""
+    from app.api.v1.schemas.record import ReceiptLineCreate, Record
+
+    lines = [
+        ReceiptLineCreate(
+            raw_item_name="牛乳パック", raw_store_name="ファミマ", raw_price="240", raw_purchase_date="2024-05-15",
+            item_id=101, store_id=201, price=240.0,
+        ),
+        ReceiptLineCreate(
+            raw_item_name="ﾁｮｺﾊﾟﾝ", raw_store_name="ファミマ", raw_price="150", raw_purchase_date="2024-05-15",
+            item_name="チョコパン", store_id=201, price=150.0,
+        ),
+    ]
+    records = [
+        Record(id=500 + i, user_id=MOCK_USER.id, price=line.final_price, purchase_date=date.today(),
+               item_id=101 + i, store_id=201, item_name=name, store_name="ファミリーマート")
+        for i, (line, name) in enumerate(zip(lines, ["牛乳", "チョコパン"]))
+    ]
+    confirmed = [line.model_copy(update={"item_id": r.item_id}) for line, r in zip(lines, records)]
+    mock_confirm_batch.return_value = (records, confirmed)
+
+    response = client.post(
+        "/api/v1/receipts/confirm/batch",
+        json=[line.model_dump(mode="json", by_alias=True) for line in lines],
+    )
+
+    assert response.status_code == 201
+    assert [r["id"] for r in response.json()] == [500, 501]
+    assert mock_confirm_batch.call_args[0][0] == MOCK_USER.id
+    assert len(mock_confirm_batch.call_args[0][1]) == 2
+    mock_save_aliases.assert_called_once_with(MOCK_USER.id, *confirmed)
+
+
+def test_confirm_receipt_batch_requires_item_id_or_name():
+    """商品IDも商品名も無い行は 422 になる"""
+    response = client.post(
+        "/api/v1/receipts/confirm/batch",
+        json=[{"raw_item_name": "?", "raw_store_name": "?", "raw_price": "1", "raw_purchase_date": "", "store_id": 1, "price": 1.0}],
+    )
+    assert response.status_code == 422
 
 
 # -----------------------------------------------------------
@@ -160,7 +210,7 @@ def test_confirm_and_register_record_success(mock_create_record):
 # -----------------------------------------------------------
 
 
-@patch("app.services.db_manager.update_item")
+@patch("app.services.db_manager.aupdate_item")
 def test_update_item_owner_check_failure(mock_update_item):
     """商品更新時の所有権チェック失敗テスト (DBマネージャがNoneを返す)"""
     from app.api.v1.schemas.item import ItemCreate
@@ -174,15 +224,27 @@ def test_update_item_owner_check_failure(mock_update_item):
     assert "not found or you don't have permission" in response.json()["detail"]
 
 
-@patch("app.services.data_processor.suggest_items")
+@patch("app.services.db_manager.aupdate_item")
+def test_update_item_to_existing_name_conflicts(mock_update_item):
+    """正規化すると既存の別の商品と同じ名称になる変更は 409 になる"""
+    from app.db.database import DuplicateNameError
+
+    mock_update_item.side_effect = DuplicateNameError("ぎゅうにゅう")
+
+    response = client.put("/api/v1/items/1", json={"name": "ぎゅうにゅう"})
+
+    assert response.status_code == 409
+
+
+@patch("app.services.data_processor.suggest_items_with_path")
 def test_suggest_items_feature(mock_suggest_items):
     """商品名サジェスト機能のテスト (表記ゆれ対策の連携)"""
     from app.api.v1.schemas.item import Item
 
-    mock_suggest_items.return_value = [
+    mock_suggest_items.return_value = ([
         Item(id=10, user_id=MOCK_USER.id, name="サッポロ一番"),
         Item(id=11, user_id=MOCK_USER.id, name="サッポロポテト"),
-    ]
+    ], "fuzzy")
 
     response = client.get("/api/v1/items/suggest?query=サッポ")
 
@@ -190,10 +252,56 @@ def test_suggest_items_feature(mock_suggest_items):
     data = response.json()
     assert len(data) == 2
     assert "サッポロ一番" in data[0]["name"]
+    assert response.headers["X-Suggest-Path"] == "fuzzy"
     mock_suggest_items.assert_called_once_with(MOCK_USER.id, "サッポ")
 
 
-@patch("app.services.db_manager.get_item_price_comparisons")
+@patch("app.services.data_processor.suggest_stores_with_path")
+def test_suggest_stores_is_not_shadowed_by_store_id_route(mock_suggest_stores):
+    """/stores/suggest が /stores/{store_id} として扱われないことのテスト"""
+    mock_suggest_stores.return_value = ([], "prefix")
+
+    response = client.get("/api/v1/stores/suggest?query=イオ")
+
+    assert response.status_code == 200
+    assert response.headers["X-Suggest-Path"] == "prefix"
+    mock_suggest_stores.assert_called_once_with(MOCK_USER.id, "イオ")
+
+
+@patch("app.services.db_manager.aget_items_page")
+def test_read_items_page_with_fields(mock_items_page):
+    """limit / fields を指定すると1ページ分だけ返し、次のカーソルをヘッダーで返す"""
+    mock_items_page.return_value = [{"id": 3, "name": "牛乳"}, {"id": 7, "name": "卵"}]
+
+    response = client.get("/api/v1/items/?limit=2&after=1&fields=name")
+
+    assert response.status_code == 200
+    assert response.json() == [{"id": 3, "name": "牛乳"}, {"id": 7, "name": "卵"}]
+    assert response.headers["X-Next-Cursor"] == "7"
+    mock_items_page.assert_called_once_with(MOCK_USER.id, ["id", "name"], 2, 1)
+
+
+@patch("app.services.db_manager.aget_stores_page")
+def test_read_stores_last_page_has_no_cursor(mock_stores_page):
+    """limit 件に満たない最後のページでは X-Next-Cursor を返さない"""
+    mock_stores_page.return_value = [{"id": 9, "name": "ライフ", "user_id": MOCK_USER.id}]
+
+    response = client.get("/api/v1/stores/?after=8")
+
+    assert response.status_code == 200
+    assert "X-Next-Cursor" not in response.headers
+    mock_stores_page.assert_called_once_with(MOCK_USER.id, ["id", "name", "user_id"], 100, 8)
+
+
+def test_read_item_history_rejects_unknown_fields():
+    """fields に存在しない項目を指定すると400を返す"""
+    response = client.get("/api/v1/items/1/history?fields=price,password")
+
+    assert response.status_code == 400
+    assert "password" in response.json()["detail"]
+
+
+@patch("app.services.db_manager.aget_item_price_comparisons")
 def test_get_price_comparison_success(mock_comparison):
     """価格比較機能のテスト (集計ロジックの連携)"""
     # db_managerが返すモックデータ
@@ -221,41 +329,168 @@ def test_get_price_comparison_success(mock_comparison):
     mock_comparison.assert_called_once_with(MOCK_USER.id, 101)
 
 
-# @patch("os.remove")  # 実際の一時ファイル削除をスキップ
-# @patch("app.services.db_manager.export_user_data_to_csv")
-# def test_export_data_csv_export(mock_export_csv, mock_remove):
-#     """データエクスポート機能のテスト"""
+@patch("app.services.db_manager.aget_export_records_page")
+def test_export_data_csv_export(mock_export_page):
+    """データエクスポート機能のテスト (一時ファイルを作らず、ページごとに送信する)"""
+    row = {
+        "購入日": "2023-10-01",
+        "価格": 200,
+        "商品名（レシート表記）": "ギュウニュウ",
+        "商品名（標準）": "牛乳",
+        "店舗名": "Aスーパー",
+    }
+    mock_export_page.return_value = ([row], None)
 
-#     # 仮想的なCSVファイルを作成し、db_managerがそのパスを返すようにモック
-#     TEST_CSV_CONTENT = (
-#         "date,store_name,item_name,price\n2023-10-01,Aスーパー,牛乳,200\n"
-#     )
+    response = client.get("/api/v1/items/export/csv")
 
-#     # 🚨 修正: tempfileを使用して、OSに関係なく安全な一時ファイルを作成 🚨
-#     with tempfile.NamedTemporaryFile(mode="wb", delete=False) as tmp:
-#         tmp.write(TEST_CSV_CONTENT.encode("utf-8"))  # <-- .encode('utf-8') を追加
-#         TEMP_FILE_PATH = tmp.name  # 作成された一時ファイルのパスを取得
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "text/csv; charset=utf-8"
+    assert (
+        f"filename=purchase_history_{MOCK_USER.id}.csv"
+        in response.headers["content-disposition"]
+    )
+    assert response.content.decode("utf-8") == (
+        "購入日,価格,商品名（レシート表記）,商品名（標準）,店舗名\n"
+        "2023-10-01,200,ギュウニュウ,牛乳,Aスーパー\n"
+    )
+    mock_export_page.assert_called_once_with(MOCK_USER.id, 1000, None)
 
-#     # db_managerのモックが一時ファイルのパスを返すように設定
-#     mock_export_csv.return_value = TEMP_FILE_PATH
 
-#     # 1. API呼び出し
-#     response = client.get("/api/v1/items/export/csv")
+@patch("app.services.db_manager.aget_export_records_page")
+def test_export_ndjson_format(mock_export_page):
+    """format=ndjson では1行1件のJSONを返す"""
+    mock_export_page.return_value = ([{"購入日": "2023-10-01", "価格": 200}], None)
 
-#     # 2. テスト後、一時ファイルを削除
-#     try:
-#         os.remove(TEMP_FILE_PATH)
-#     except Exception:
-#         pass  # 削除失敗は無視 (テスト結果に影響しないため)
+    response = client.get("/api/v1/items/export?format=ndjson")
 
-#     assert response.status_code == 200
-#     assert response.headers["content-type"] == "text/csv; charset=utf-8"
-#     assert (
-#         f"filename=purchase_history_{MOCK_USER.id}.csv"
-#         in response.headers["content-disposition"]
-#     )
-#     assert response.content.decode("utf-8") == TEST_CSV_CONTENT  # 内容の検証
-#     mock_export_csv.assert_called_once_with(MOCK_USER.id)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert f"purchase_history_{MOCK_USER.id}.ndjson" in response.headers["content-disposition"]
+    assert response.json() == {"購入日": "2023-10-01", "価格": 200}
+
+
+@patch("app.services.importer.import_records")
+def test_import_streams_progress_as_ndjson(mock_import):
+    """一括取り込みは、バッチごとの進捗をNDJSONで返す"""
+
+    async def events(user_id, file, format, batch_size):
+        yield {"batch": 1, "rows": 2, "imported": 2, "failed": 0, "errors": []}
+        yield {"done": True, "batches": 1, "rows": 2, "imported": 2, "failed": 0}
+
+    mock_import.side_effect = events
+
+    response = client.post(
+        "/api/v1/items/import?batch_size=500",
+        files={"file": ("history.csv", b"purchase_date,price\n", "text/csv")},
+    )
+
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[-1]["done"] is True
+    assert mock_import.call_args.args[2:] == ("csv", 500)
+
+
+def test_import_rejects_unknown_file_format():
+    """ファイル名からも指定からも形式が分からない場合は400を返す"""
+    response = client.post(
+        "/api/v1/items/import",
+        files={"file": ("history.xlsx", b"...", "application/octet-stream")},
+    )
+
+    assert response.status_code == 400
+
+
+@pytest.fixture
+def job_table():
+    """DBの jobs テーブルの代わり (全ワーカーで共有される状態として、辞書に保存する)"""
+    from datetime import datetime, timezone
+
+    from app.api.v1.schemas.job import Job, JobStatus
+
+    table = {}
+
+    async def start_job(user_id, kind):
+        for job in table.values():
+            if job.user_id == user_id and job.kind == kind and job.status in (JobStatus.PENDING, JobStatus.RUNNING):
+                return job, False
+        job = Job(id=f"job-{len(table) + 1}", kind=kind, user_id=user_id, created_at=datetime.now(timezone.utc))
+        table[job.id] = job
+        return job, True
+
+    async def get_job(user_id, job_id):
+        job = table.get(job_id)
+        return job if job is not None and job.user_id == user_id else None
+
+    async def update_job_status(job_id, status, error=None):
+        table[job_id] = table[job_id].model_copy(update={"status": status, "error": error})
+        return True
+
+    with patch("app.services.db_manager.astart_job", side_effect=start_job), patch(
+        "app.services.db_manager.aget_job", side_effect=get_job
+    ), patch("app.services.db_manager.aupdate_job_status", side_effect=update_job_status):
+        yield table
+
+
+@patch("app.services.db_manager.adelete_all_user_data")
+def test_delete_all_user_data_runs_as_background_job(mock_delete, job_table):
+    """全データ削除はすぐに202とジョブを返し、完了は状態取得のエンドポイントで確認できる"""
+    from app.services import jobs
+
+    mock_delete.return_value = True
+
+    response = client.delete("/api/v1/items/data")
+
+    assert response.status_code == 202
+    job = response.json()
+    assert job["kind"] == jobs.DELETE_ALL_USER_DATA
+    assert response.headers["Location"].endswith(f"/api/v1/items/data/jobs/{job['id']}")
+    mock_delete.assert_awaited_once_with(MOCK_USER.id)
+
+    status_response = client.get(f"/api/v1/items/data/jobs/{job['id']}")
+    assert status_response.status_code == 200
+    assert status_response.json()["status"] == "succeeded"
+
+
+@patch("app.services.db_manager.adelete_all_user_data")
+def test_delete_all_user_data_job_reports_failure(mock_delete, job_table):
+    """削除に失敗した場合、ジョブの状態は failed になる"""
+    mock_delete.return_value = False
+
+    job_id = client.delete("/api/v1/items/data").json()["id"]
+
+    assert client.get(f"/api/v1/items/data/jobs/{job_id}").json()["status"] == "failed"
+    assert client.get("/api/v1/items/data/jobs/unknown").status_code == 404
+
+
+@patch("app.services.db_manager.adelete_all_user_data")
+def test_delete_all_user_data_is_not_started_twice(mock_delete, job_table):
+    """未完了の削除ジョブがあれば (別のワーカーが開始したものでも)、新しく開始せずにそれを返す"""
+    from datetime import datetime, timezone
+
+    from app.api.v1.schemas.job import Job, JobStatus
+    from app.services import jobs
+
+    job_table["running"] = Job(
+        id="running",
+        kind=jobs.DELETE_ALL_USER_DATA,
+        user_id=MOCK_USER.id,
+        status=JobStatus.RUNNING,
+        created_at=datetime.now(timezone.utc),
+    )
+
+    response = client.delete("/api/v1/items/data")
+
+    assert response.status_code == 202
+    assert response.json()["id"] == "running"
+    mock_delete.assert_not_called()
+
+
+@patch("app.services.exporter.parquet_available", return_value=False)
+def test_export_parquet_without_pyarrow(mock_available):
+    """pyarrow が無い環境では、Parquet出力は501を返す"""
+    response = client.get("/api/v1/items/export?format=parquet")
+
+    assert response.status_code == 501
 
 
 # -----------------------------------------------------------
@@ -263,7 +498,7 @@ def test_get_price_comparison_success(mock_comparison):
 # -----------------------------------------------------------
 
 
-@patch("app.services.db_manager.create_store")
+@patch("app.services.db_manager.acreate_store")
 def test_create_store_success(mock_create_store):
     """店舗の新規登録テスト"""
     from app.api.v1.schemas.store import StoreCreate, Store
@@ -280,7 +515,19 @@ def test_create_store_success(mock_create_store):
     mock_create_store.assert_called_once()
 
 
-@patch("app.services.db_manager.delete_store")
+@patch("app.services.db_manager.aupdate_store")
+def test_update_store_to_existing_name_conflicts(mock_update_store):
+    """正規化すると既存の別の店舗と同じ名称になる変更は 409 になる"""
+    from app.db.database import DuplicateNameError
+
+    mock_update_store.side_effect = DuplicateNameError("ライフ")
+
+    response = client.put("/api/v1/stores/2", json={"name": "ﾗｲﾌ"})
+
+    assert response.status_code == 409
+
+
+@patch("app.services.db_manager.adelete_store")
 def test_delete_store_success(mock_delete_store):
     """店舗の削除テスト (成功)"""
     mock_delete_store.return_value = True  # 削除成功
@@ -291,7 +538,7 @@ def test_delete_store_success(mock_delete_store):
     mock_delete_store.assert_called_once_with(MOCK_USER.id, 301)
 
 
-@patch("app.services.db_manager.delete_store")
+@patch("app.services.db_manager.adelete_store")
 def test_delete_store_not_found(mock_delete_store):
     """店舗の削除テスト (失敗: 存在しない/権限なし)"""
     mock_delete_store.return_value = False  # 削除失敗
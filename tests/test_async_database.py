@@ -0,0 +1,223 @@
+import asyncio
+import inspect
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.db import database, async_database
+from app.api.v1.schemas.item import Item
+
+TEST_USER_ID = "test-user-uuid-123"
+
+
+def test_every_database_function_has_async_variant():
+    """database.py の全関数に、同名の非同期版が async_database.py に存在する"""
+    sync_functions = {
+        name
+        for name, obj in inspect.getmembers(database, inspect.isfunction)
+        if obj.__module__ == database.__name__ and not name.startswith("_")
+    }
+    # db_manager と重複していたラッパー関数は対象外
+    sync_functions.discard("create_internal_user_record")
+
+    for name in sync_functions:
+        async_function = getattr(async_database, name, None)
+        assert async_function is not None, f"async_database.{name} がありません"
+        assert inspect.iscoroutinefunction(async_function), name
+
+
+def test_get_items_by_user_awaits_async_client():
+    """非同期クライアントのクエリ結果が、同期版と同じくItemのリストに変換される"""
+    client = MagicMock()
+    query = client.table.return_value.select.return_value.eq.return_value
+    query.execute = AsyncMock(
+        return_value=MagicMock(data=[{"id": 1, "name": "牛乳", "user_id": TEST_USER_ID}])
+    )
+
+    with patch("app.db.async_database.get_async_supabase", return_value=client):
+        items = asyncio.run(async_database.get_items_by_user(TEST_USER_ID))
+
+    assert items == [Item(id=1, name="牛乳", user_id=TEST_USER_ID)]
+    client.table.assert_called_once_with("items")
+    query.execute.assert_awaited_once()
+
+
+def _joined_row(**overrides):
+    row = {
+        "id": 500,
+        "user_id": TEST_USER_ID,
+        "price": 240.0,
+        "purchase_date": "2024-05-15",
+        "item_id": 1,
+        "store_id": 2,
+        "items": {"name": "牛乳"},
+        "stores": {"name": "ライフ"},
+    }
+    row.update(overrides)
+    return row
+
+
+def _record_in():
+    from app.api.v1.schemas.record import RecordCreate
+
+    return RecordCreate(
+        raw_item_name="牛乳パック",
+        raw_store_name="ライフ",
+        raw_price="240",
+        raw_purchase_date="2024-05-15",
+        item_id=1,
+        store_id=2,
+        price=240.0,
+        purchase_date="2024-05-15",
+    )
+
+
+def test_create_purchase_record_returns_joined_row_in_one_request():
+    """登録と関連名の取得を1回のリクエストで行い、取得し直さない"""
+    client = MagicMock()
+    query = client.table.return_value.insert.return_value.select.return_value
+    query.execute = AsyncMock(return_value=MagicMock(data=[_joined_row()]))
+
+    with patch("app.db.async_database.get_async_supabase", return_value=client):
+        record = asyncio.run(async_database.create_purchase_record(TEST_USER_ID, _record_in()))
+
+    assert (record.id, record.item_name, record.store_name) == (500, "牛乳", "ライフ")
+    client.table.assert_called_once_with("purchases")
+    inserted = client.table.return_value.insert.call_args[0][0]
+    assert inserted["price"] == 240.0 and inserted["user_id"] == TEST_USER_ID
+    client.table.return_value.insert.return_value.select.assert_called_once_with(
+        database.RECORD_SELECT
+    )
+
+
+def test_update_record_sends_db_columns_and_returns_joined_row():
+    """更新ではDBの列名 (price, purchase_date) をJSONで送り、関連名付きの行をそのまま返す"""
+    client = MagicMock()
+    update = client.table.return_value.update
+    query = update.return_value.eq.return_value.eq.return_value.select.return_value
+    query.execute = AsyncMock(return_value=MagicMock(data=[_joined_row(price=199.0)]))
+
+    with patch("app.db.async_database.get_async_supabase", return_value=client):
+        record = asyncio.run(async_database.update_record(TEST_USER_ID, 500, _record_in()))
+
+    assert record.price == 199.0 and record.item_name == "牛乳"
+    client.table.assert_called_once_with("purchases")
+    sent = update.call_args[0][0]
+    assert sent["price"] == 240.0 and sent["purchase_date"] == "2024-05-15"
+    assert "final_price" not in sent
+
+
+def test_create_item_upserts_by_name_through_rpc():
+    """商品の登録は upsert_item RPC 1回で行い、既存の行 (オブジェクト形式) もそのまま返す"""
+    from app.api.v1.schemas.item import ItemCreate
+
+    client = MagicMock()
+    client.rpc.return_value.execute = AsyncMock(
+        return_value=MagicMock(
+            data={"id": 1, "name": "牛乳", "user_id": TEST_USER_ID, "name_key": "牛乳"}
+        )
+    )
+
+    with patch("app.db.async_database.get_async_supabase", return_value=client):
+        item = asyncio.run(async_database.create_item(TEST_USER_ID, ItemCreate(name="牛乳")))
+
+    assert item == Item(id=1, name="牛乳", user_id=TEST_USER_ID)
+    client.rpc.assert_called_once_with("upsert_item", {"p_user_id": TEST_USER_ID, "p_name": "牛乳"})
+    client.table.assert_not_called()
+
+
+def test_get_items_page_uses_keyset_and_projection():
+    """ページ取得は指定した列だけを、after より大きいIDからID順に limit 件取得する"""
+    client = MagicMock()
+    select = client.table.return_value.select
+    query = select.return_value.eq.return_value.gt.return_value.order.return_value.limit.return_value
+    query.execute = AsyncMock(return_value=MagicMock(data=[{"id": 4, "name": "卵"}]))
+
+    with patch("app.db.async_database.get_async_supabase", return_value=client):
+        rows = asyncio.run(async_database.get_items_page(TEST_USER_ID, ["id", "name"], 50, after=3))
+
+    assert rows == [{"id": 4, "name": "卵"}]
+    select.assert_called_once_with("id, name")
+    select.return_value.eq.return_value.gt.assert_called_once_with("id", 3)
+    select.return_value.eq.return_value.gt.return_value.order.return_value.limit.assert_called_once_with(50)
+
+
+def test_delete_all_user_data_repeats_rpc_until_done():
+    """全データ削除は、RPCが done を返すまで batch_size 行ずつ呼び出し、最後にユーザー本体を削除する"""
+    client = MagicMock()
+    client.rpc.return_value.execute = AsyncMock(
+        side_effect=[
+            MagicMock(data={"purchases": 2, "name_aliases": 0, "items": 0, "stores": 0, "done": False}),
+            MagicMock(data={"purchases": 0, "name_aliases": 0, "items": 1, "stores": 1, "done": True}),
+        ]
+    )
+    client.auth.admin.delete_user = AsyncMock()
+
+    with patch("app.db.async_database.get_async_supabase", return_value=client):
+        assert asyncio.run(async_database.delete_all_user_data(TEST_USER_ID, batch_size=2))
+
+    assert client.rpc.call_count == 2
+    client.rpc.assert_called_with("delete_user_data", {"p_user_id": TEST_USER_ID, "p_batch_size": 2})
+    client.auth.admin.delete_user.assert_awaited_once_with(TEST_USER_ID)
+    client.table.assert_not_called()
+
+
+def test_update_item_unique_violation_raises_duplicate_name_error():
+    """名称の一意制約違反 (23505) は DuplicateNameError にし、その他のエラーはそのまま送出する"""
+    import pytest
+    from postgrest import APIError
+
+    from app.api.v1.schemas.item import ItemCreate
+
+    client = MagicMock()
+    query = client.table.return_value.update.return_value.eq.return_value.eq.return_value
+    query.execute = AsyncMock(
+        side_effect=[
+            APIError({"message": "duplicate key value", "code": "23505", "hint": None, "details": None}),
+            APIError({"message": "permission denied", "code": "42501", "hint": None, "details": None}),
+        ]
+    )
+
+    with patch("app.db.async_database.get_async_supabase", return_value=client):
+        with pytest.raises(database.DuplicateNameError):
+            asyncio.run(async_database.update_item(TEST_USER_ID, 1, ItemCreate(name="牛乳")))
+        with pytest.raises(APIError):
+            asyncio.run(async_database.update_item(TEST_USER_ID, 1, ItemCreate(name="牛乳")))
+
+
+def test_start_job_returns_existing_active_job():
+    """start_job RPC が既存の未完了ジョブを返した場合は、(そのジョブ, False) になる"""
+    client = MagicMock()
+    job_row = {
+        "id": "0b7c0e6a-0000-4000-8000-000000000001",
+        "kind": "delete_all_user_data",
+        "user_id": TEST_USER_ID,
+        "status": "running",
+        "created_at": "2024-05-15T10:00:00+00:00",
+        "finished_at": None,
+        "error": None,
+    }
+    client.rpc.return_value.execute = AsyncMock(
+        side_effect=[
+            MagicMock(data={"job": job_row, "created": False}),
+            MagicMock(data={"job": None, "created": False}),
+        ]
+    )
+
+    with patch("app.db.async_database.get_async_supabase", return_value=client):
+        job, created = asyncio.run(
+            async_database.start_job(TEST_USER_ID, "delete_all_user_data", timeout=60, retention=3600)
+        )
+        # 未完了のジョブが直後に終了した場合は、やり直せるよう None を返す
+        assert asyncio.run(
+            async_database.start_job(TEST_USER_ID, "delete_all_user_data", timeout=60, retention=3600)
+        ) is None
+
+    assert created is False and job.status == "running"
+    client.rpc.assert_called_with(
+        "start_job",
+        {
+            "p_user_id": TEST_USER_ID,
+            "p_kind": "delete_all_user_data",
+            "p_timeout_seconds": 60,
+            "p_retention_seconds": 3600,
+        },
+    )
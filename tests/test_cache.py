@@ -0,0 +1,73 @@
+import os
+from unittest.mock import patch
+
+from app.core.cache import DiskLRUCache
+
+
+def test_least_recently_used_entries_are_evicted_by_size(tmp_path):
+    """合計サイズが上限を超えたら、最も長く参照されていないエントリから削除する"""
+    cache = DiskLRUCache(str(tmp_path), max_bytes=30)  # 1件12バイト (JSONの引用符を含む)
+    cache.set("a", "x" * 10)
+    cache.set("b", "y" * 10)
+    assert cache.get("a") == "x" * 10  # a を最近参照したことにする
+    cache.set("c", "z" * 10)  # 3件で上限を超えるので、b が削除される
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "x" * 10 and cache.get("c") == "z" * 10
+    assert not os.path.exists(tmp_path / "b.json")
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] <= 30
+
+
+def test_entries_survive_a_new_instance(tmp_path):
+    """別のインスタンス (再起動後) からも、保存済みのエントリを読める"""
+    DiskLRUCache(str(tmp_path), max_bytes=1024).set("receipt", {"店舗名": "ライフ"})
+
+    cache = DiskLRUCache(str(tmp_path), max_bytes=1024)
+    assert cache.get("receipt") == {"店舗名": "ライフ"}
+    assert cache.stats()["hits"] == 1 and cache.stats()["size"] == 1
+
+
+def test_broken_entry_is_treated_as_miss(tmp_path):
+    """読み込めないファイルはミスとして扱い、エントリから取り除く"""
+    cache = DiskLRUCache(str(tmp_path), max_bytes=1024)
+    cache.set("receipt", {"合計": 100})
+    (tmp_path / "receipt.json").write_text("{broken", encoding="utf-8")
+
+    assert cache.get("receipt") is None
+    assert len(cache) == 0
+
+
+def test_entries_written_by_another_process_are_found(tmp_path):
+    """インデックスを読み込んだ後に他のプロセスが書き込んだエントリも読める"""
+    worker_a = DiskLRUCache(str(tmp_path), max_bytes=1024)
+    worker_b = DiskLRUCache(str(tmp_path), max_bytes=1024)
+    assert worker_b.get("receipt") is None  # ここで worker_b のインデックスが作られる
+
+    worker_a.set("receipt", {"店舗名": "ライフ"})
+
+    assert worker_b.get("receipt") == {"店舗名": "ライフ"}
+
+
+def test_size_limit_is_shared_between_processes(tmp_path):
+    """各プロセスが書き込んだ分を合わせて、ディレクトリ全体で max_bytes を守る"""
+    worker_a = DiskLRUCache(str(tmp_path), max_bytes=30)  # 1件12バイト
+    worker_b = DiskLRUCache(str(tmp_path), max_bytes=30)
+    worker_a.set("a", "x" * 10)
+    worker_b.set("b", "y" * 10)
+    worker_a.set("c", "z" * 10)
+    worker_b.set("d", "w" * 10)
+
+    total = sum(path.stat().st_size for path in tmp_path.glob("*.json"))
+    assert total <= 30
+    assert worker_b.get("d") == "w" * 10
+
+
+def test_failed_write_leaves_no_temporary_file(tmp_path):
+    """置き換えに失敗した場合は一時ファイルを削除し、エントリも登録しない"""
+    cache = DiskLRUCache(str(tmp_path), max_bytes=1024)
+    with patch("app.core.cache.os.replace", side_effect=OSError("disk full")):
+        cache.set("receipt", {"合計": 100})
+
+    assert list(tmp_path.iterdir()) == []
+    assert cache.get("receipt") is None
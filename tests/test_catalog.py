@@ -0,0 +1,103 @@
+from unittest.mock import patch
+
+from app.services import data_processor, db_manager
+from app.services.catalog import Catalog
+from app.api.v1.schemas.item import Item
+
+TEST_USER_ID = "test-user-uuid-123"
+
+
+def _item(item_id: int, name: str) -> Item:
+    return Item(id=item_id, name=name, user_id=TEST_USER_ID)
+
+
+def test_candidates_follow_upsert_and_remove():
+    """転置インデックスは、名称の変更や削除に追従する"""
+    catalog = Catalog([_item(1, "牛乳"), _item(2, "食パン")])
+    assert [e.id for e in catalog.candidates("牛乳パック", 10)[0]] == [1]
+
+    catalog.upsert(_item(1, "低脂肪乳"))
+    assert catalog.candidates("牛丼", 10) == ([], [])
+    assert [e.id for e in catalog.candidates("脂肪", 10)[0]] == [1]
+
+    catalog.remove(2)
+    assert catalog.candidates("パン", 10) == ([], [])
+    assert len(catalog) == 1
+
+
+def test_short_and_common_queries_get_candidates():
+    """1文字のクエリや、高頻度の n-gram だけのクエリにも候補を返す"""
+    catalog = Catalog([_item(i, f"商品{i:03d}") for i in range(100)] + [_item(100, "ヨーグルト")])
+    assert [e.id for e in catalog.candidates("よ", 10)[0]] == [100]
+
+    # 「商品」は全件の2割を超えて出現するが、それを含むものから limit 件を返す
+    entities, keys = catalog.candidates("商品", 10)
+    assert len(entities) == 10 and all(key.startswith("商品") for key in keys)
+    assert catalog.candidates("xyz", 10) == ([], [])
+
+
+def test_suggest_uses_index_without_full_scan():
+    """大きなカタログでは候補を絞り込み、候補が少なすぎる場合もカタログの一部だけで補う"""
+    items = [_item(i, f"商品{i:03d}") for i in range(100)] + [_item(100, "ヨーグルト")]
+    db_manager.catalog_cache.clear()
+    extract = data_processor.process.extract
+    with patch("app.db.database.get_items_by_user", return_value=items), patch.object(
+        data_processor, "NGRAM_INDEX_MIN_SIZE", 50
+    ), patch.object(data_processor, "NGRAM_CANDIDATE_LIMIT", 20), patch.object(
+        data_processor.process, "extract", wraps=extract
+    ) as mock_extract:
+        assert data_processor.suggest_items(TEST_USER_ID, "ヨーグルト")[0] == items[100]
+        # 共有する n-gram が無いクエリでも SUGGESTION_LIMIT 件返すが、類似度は全件ではなく一部とだけ計算する
+        assert len(data_processor.suggest_items(TEST_USER_ID, "xyz")) == data_processor.SUGGESTION_LIMIT
+        assert all(len(call.args[1]) <= 20 for call in mock_extract.call_args_list)
+    db_manager.catalog_cache.clear()
+
+
+def test_prefix_matches_are_served_without_fuzzy_scoring():
+    """前方一致が SUGGESTION_LIMIT 件以上あれば、類似度計算を行わずに名称順で返す"""
+    items = [_item(i, f"Milk {i:02d}") for i in range(12, 0, -1)] + [_item(99, "Bread")]
+    catalog = Catalog(items)
+    assert [e.name for e in catalog.prefix_matches("milk 1", 10)] == ["Milk 10", "Milk 11", "Milk 12"]
+
+    catalog.upsert(_item(12, "Butter"))
+    assert [e.name for e in catalog.prefix_matches("b", 10)] == ["Bread", "Butter"]
+
+    db_manager.catalog_cache.clear()
+    with patch("app.db.database.get_items_by_user", return_value=items):
+        suggestions, path = data_processor.suggest_items_with_path(TEST_USER_ID, "milk")
+        assert path == data_processor.SUGGEST_PATH_PREFIX
+        assert [e.id for e in suggestions] == list(range(1, 11))
+
+        _, path = data_processor.suggest_items_with_path(TEST_USER_ID, "milk 1")
+        assert path == data_processor.SUGGEST_PATH_FUZZY
+    db_manager.catalog_cache.clear()
+
+
+def test_exact_key_match_skips_fuzzy_scoring():
+    """正規化したキーが一致すれば、類似度計算を行わずに既存のものと判定する"""
+    catalog = Catalog([_item(1, "セブンイレブン"), _item(2, "ファミリーマート")])
+    assert catalog.lookup("せぶんいれぶん").id == 1
+
+    with patch.object(data_processor.process, "cdist") as mock_cdist:
+        matches = data_processor._match_names(["ｾﾌﾞﾝｲﾚﾌﾞﾝ"], catalog)
+    assert matches == {"ｾﾌﾞﾝｲﾚﾌﾞﾝ": (False, 1, "セブンイレブン")}
+    mock_cdist.assert_not_called()
+
+    catalog.upsert(_item(1, "セブン-イレブン"))
+    assert catalog.lookup("せぶんいれぶん") is None
+
+
+def test_resolution_tiers_are_tried_in_order():
+    """完全一致 -> 前方一致 -> 類似度計算 の順に試し、段階ごとの件数を数える"""
+    catalog = Catalog([_item(1, "ヨーグルト"), _item(2, "ヨーグルト 400g"), _item(3, "食パン 6枚切")])
+    before = data_processor.resolution_stats()
+
+    matches = data_processor._match_names(["よーぐると", "食パン 6枚", "食パン6枚切り", "キャビア"], catalog)
+
+    assert matches["よーぐると"] == (False, 1, "ヨーグルト")
+    assert matches["食パン 6枚"] == (False, 3, "食パン 6枚切")
+    assert matches["食パン6枚切り"] == (False, 3, "食パン 6枚切")
+    assert matches["キャビア"] == (True, None, "キャビア")
+    after = data_processor.resolution_stats()
+    for tier in (data_processor.TIER_EXACT, data_processor.TIER_PREFIX, data_processor.TIER_FUZZY, data_processor.TIER_NEW):
+        assert after[tier] == before[tier] + 1, tier
@@ -0,0 +1,21 @@
+import asyncio
+
+from app.db import client
+
+
+def test_clients_are_created_lazily_and_shared():
+    """クライアントは初回呼び出しで生成され、以降は同じインスタンスが共有される"""
+    asyncio.run(client.aclose())
+    assert client._supabase is None and client._async_supabase is None
+
+    sync_client = client.get_supabase()
+    async_client = client.get_async_supabase()
+
+    assert client.get_supabase() is sync_client
+    assert client.get_async_supabase() is async_client
+    # ログイン用の認証クライアントも、同期クライアントと同じコネクションプールを使う
+    assert client.new_auth_client()._http_client is client._http_client
+
+    asyncio.run(client.aclose())
+    assert client._http_client is None and client._async_http_client is None
+    assert client.get_supabase() is not sync_client
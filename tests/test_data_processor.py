@@ -5,8 +5,10 @@ from typing import List
 
 # テスト対象のモジュールと依存関係のインポート
 # 🚨 プロジェクトのルートディレクトリをPYTHONPATHに追加する必要があります
+from app.services import db_manager
 from app.services.data_processor import (
     normalize_ocr_data,
+    normalize_receipt,
     suggest_items,
     suggest_stores,
 )  # suggest_items, suggest_stores を追加
@@ -39,13 +41,13 @@ MOCK_EXISTING_STORES = [
 # ----------------------------------------------------------------------
 
 
-# @patchデコレーターのパスは、テスト対象のモジュール（data_processor.py）内でのインポート元を指定します
+# 既存データはDBアクセス層 (database.py) をモックし、db_manager のカタログキャッシュ経由で取得させる
 @patch(
-    "app.services.data_processor.db_manager.get_items_by_user",
+    "app.db.database.get_items_by_user",
     return_value=MOCK_EXISTING_ITEMS,
 )
 @patch(
-    "app.services.data_processor.db_manager.get_stores_by_user",
+    "app.db.database.get_stores_by_user",
     return_value=MOCK_EXISTING_STORES,
 )
 class TestNormalizeOCRData(unittest.TestCase):
@@ -53,6 +55,8 @@ class TestNormalizeOCRData(unittest.TestCase):
     def setUp(self):
         # 毎テスト実行前に実行される初期設定
         self.user_id = TEST_USER_ID
+        # テストごとに既存データを取得し直すよう、カタログのキャッシュを空にする
+        db_manager.catalog_cache.clear()
 
     def test_successful_name_matching(self, mock_get_stores, mock_get_items):
         """
@@ -196,6 +200,37 @@ class TestNormalizeOCRData(unittest.TestCase):
             "不正な日付は今日の日付になるべき",
         )
 
+    def test_normalize_receipt_fetches_existing_data_once(
+        self, mock_get_stores, mock_get_items
+    ):
+        """
+        レシート全体の正規化では、既存の店舗・商品の取得が1回ずつで済み、
+        行ごとの結果は normalize_ocr_data と一致することを確認
+        """
+        raw_data_list = [
+            {"store_name": "イオンモール（仮）", "item_name": "ポテトチップ うす塩", "price": "150", "purchase_date": "2024/05/15"},
+            {"store_name": "イオンモール（仮）", "item_name": "超高級キャビア", "price": "10000円", "purchase_date": "2024/05/15"},
+            {"store_name": "イオンモール（仮）", "item_name": "ポテトチップ うす塩", "price": "150", "purchase_date": "2024/05/15"},
+            {"store_name": "イオンモール（仮）", "item_name": None, "price": "1", "purchase_date": None},
+        ]
+
+        results = normalize_receipt(self.user_id, raw_data_list)
+
+        mock_get_stores.assert_called_once_with(user_id=self.user_id)
+        mock_get_items.assert_called_once_with(user_id=self.user_id)
+        self.assertEqual(len(results), len(raw_data_list))
+        for raw_data, result in zip(raw_data_list, results):
+            expected = normalize_ocr_data(
+                user_id=self.user_id,
+                raw_store_name=raw_data["store_name"],
+                raw_item_name=raw_data["item_name"],
+                raw_price=raw_data["price"],
+                raw_purchase_date=raw_data["purchase_date"],
+            )
+            self.assertEqual(result, expected)
+        self.assertEqual(results[0].suggested_item_id, 3)
+        self.assertTrue(results[1].is_new_item)
+
     # ----------------------------------------------------------------------
     # 新規追加：サジェスト機能のテスト
     # ----------------------------------------------------------------------
@@ -230,7 +265,7 @@ class TestNormalizeOCRData(unittest.TestCase):
 
         # このテストケースでのみモックを上書き
         with patch(
-            "app.services.data_processor.db_manager.get_items_by_user",
+            "app.db.database.get_items_by_user",
             return_value=MOCK_LARGE_ITEMS,
         ):
             query = "Query Match"
@@ -276,7 +311,7 @@ class TestNormalizeOCRData(unittest.TestCase):
 
         # このテストケースでのみモックを上書き
         with patch(
-            "app.services.data_processor.db_manager.get_stores_by_user",
+            "app.db.database.get_stores_by_user",
             return_value=MOCK_LARGE_STORES,
         ):
             query = "Query Match"
@@ -4,6 +4,7 @@ from app.api.v1.schemas.item import ItemCreate
 from app.api.v1.schemas.store import StoreCreate
 from app.api.v1.schemas.record import RecordCreate
 from app.db import database
+from app.db.client import get_supabase
 
 # 🚨 実際には、テスト用の設定を読み込むための準備が必要です。
 # 例: 環境変数を設定、またはテストフィクスチャでconfigをモックする。
@@ -20,11 +21,11 @@ TEST_USER_ID = "f405c50e-824a-4508-9218-571bba692713"  # 実際のUUIDに置き
 def cleanup_test_data(user_id: str):
     """テスト用に作成されたデータを削除（冪等性の確保）"""
     # 履歴を削除
-    database.supabase.table("purchases").delete().eq("user_id", user_id).execute()
+    get_supabase().table("purchases").delete().eq("user_id", user_id).execute()
     # 商品を削除
-    database.supabase.table("items").delete().eq("user_id", user_id).execute()
+    get_supabase().table("items").delete().eq("user_id", user_id).execute()
     # 店舗を削除
-    database.supabase.table("stores").delete().eq("user_id", user_id).execute()
+    get_supabase().table("stores").delete().eq("user_id", user_id).execute()
 
 
 # 各テストの開始前にクリーンアップを実行するフィクスチャ
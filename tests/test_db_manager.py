@@ -0,0 +1,167 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from app.services import db_manager
+from app.api.v1.schemas.item import Item, ItemCreate
+
+TEST_USER_ID = "test-user-uuid-123"
+
+
+@pytest.fixture(autouse=True)
+def clear_catalog_cache():
+    db_manager.catalog_cache.clear()
+    yield
+    db_manager.catalog_cache.clear()
+
+
+def test_items_are_fetched_once_and_served_from_cache():
+    """商品カタログは初回のみDBから取得し、以降はキャッシュから返す"""
+    items = [Item(id=1, name="牛乳", user_id=TEST_USER_ID)]
+    with patch("app.db.database.get_items_by_user", return_value=items) as mock_get:
+        assert db_manager.get_item_catalog(TEST_USER_ID).entities == items
+        assert db_manager.get_item_catalog(TEST_USER_ID).entities == items
+
+    mock_get.assert_called_once_with(user_id=TEST_USER_ID)
+
+
+def test_item_list_is_always_read_from_database():
+    """商品一覧は、他のワーカーでの変更も反映されるよう、カタログキャッシュを使わずに毎回DBから取得する"""
+    items = [Item(id=1, name="牛乳", user_id=TEST_USER_ID)]
+    with patch("app.db.database.get_items_by_user", return_value=items) as mock_get:
+        db_manager.get_item_catalog(TEST_USER_ID)
+        assert db_manager.get_items_by_user(TEST_USER_ID) == items
+    with patch("app.db.async_database.get_items_by_user", return_value=items) as mock_aget:
+        assert asyncio.run(db_manager.aget_items_by_user(TEST_USER_ID)) == items
+
+    assert mock_get.call_count == 2
+    mock_aget.assert_awaited_once_with(user_id=TEST_USER_ID)
+
+
+def test_writes_update_cached_catalog_in_place():
+    """登録・更新・削除の結果が、DBへの再問い合わせなしでキャッシュに反映される"""
+    milk = Item(id=1, name="牛乳", user_id=TEST_USER_ID)
+    egg = Item(id=2, name="卵", user_id=TEST_USER_ID)
+    with patch("app.db.database.get_items_by_user", return_value=[milk]) as mock_get:
+        db_manager.get_item_catalog(TEST_USER_ID)
+
+        with patch("app.db.database.create_item", return_value=egg):
+            db_manager.create_item(TEST_USER_ID, ItemCreate(name="卵"))
+        renamed = Item(id=1, name="低脂肪牛乳", user_id=TEST_USER_ID)
+        with patch("app.db.database.update_item", return_value=renamed):
+            db_manager.update_item(TEST_USER_ID, 1, ItemCreate(name="低脂肪牛乳"))
+        catalog = db_manager.get_item_catalog(TEST_USER_ID)
+        assert sorted(i.name for i in catalog.entities) == ["低脂肪牛乳", "卵"]
+
+        with patch("app.db.database.delete_item", return_value=True):
+            db_manager.delete_item(TEST_USER_ID, 2)
+        assert db_manager.get_item_catalog(TEST_USER_ID).entities == [renamed]
+
+    mock_get.assert_called_once()
+
+
+def test_delete_all_user_data_invalidates_catalogs():
+    """全データ削除後は、カタログを再取得する"""
+    with patch("app.db.database.get_items_by_user", return_value=[]) as mock_get:
+        db_manager.get_item_catalog(TEST_USER_ID)
+        with patch("app.db.database.delete_all_user_data", return_value=True):
+            db_manager.delete_all_user_data(TEST_USER_ID)
+        db_manager.get_item_catalog(TEST_USER_ID)
+
+    assert mock_get.call_count == 2
+
+
+def test_async_and_sync_share_the_same_catalog():
+    """非同期版で取得したカタログは、同期版からも利用される"""
+    items = [Item(id=1, name="牛乳", user_id=TEST_USER_ID)]
+    with patch("app.db.async_database.get_items_by_user", return_value=items) as mock_get:
+        assert asyncio.run(db_manager.aget_item_catalog(TEST_USER_ID)).entities == items
+    with patch("app.db.database.get_items_by_user") as mock_sync_get:
+        assert db_manager.get_item_catalog(TEST_USER_ID).entities == items
+
+    mock_get.assert_awaited_once()
+    mock_sync_get.assert_not_called()
+
+
+def test_confirmed_record_teaches_aliases():
+    """購入履歴の登録で、OCRの読み取り結果が別名として名寄せに使われるようになる"""
+    from app.api.v1.schemas.record import RecordCreate
+    from app.services import data_processor
+
+    items = [Item(id=1, name="牛乳", user_id=TEST_USER_ID)]
+    record_in = RecordCreate(
+        raw_item_name="ｷﾞｭｳﾆｭｳ ﾒｲﾗｸ",
+        raw_store_name="ファミマ",
+        raw_price="240",
+        raw_purchase_date="2024-05-15",
+        item_id=1,
+        store_id=201,
+        price=240.0,
+    )
+    with patch("app.db.database.get_items_by_user", return_value=items):
+        db_manager.get_item_catalog(TEST_USER_ID)
+        with patch("app.db.database.create_purchase_record"):
+            db_manager.create_purchase_record(TEST_USER_ID, record_in)
+
+        before = data_processor.resolution_stats()
+        item_match = data_processor._normalize_name(
+            TEST_USER_ID, "ｷﾞｭｳﾆｭｳ ﾒｲﾗｸ", db_manager.get_item_catalog
+        )
+
+    assert item_match == (False, 1, "牛乳")
+    after = data_processor.resolution_stats()
+    assert after[data_processor.TIER_ALIAS] == before[data_processor.TIER_ALIAS] + 1
+    assert after[data_processor.TIER_FUZZY] == before[data_processor.TIER_FUZZY]
+
+
+def test_stored_aliases_are_loaded_and_saved_with_canonical_keys():
+    """保存済みの別名はカタログ生成時に読み込まれ、新しい別名は正規化したキーで保存される"""
+    from app.api.v1.schemas.record import RecordCreate
+
+    items = [Item(id=1, name="牛乳", user_id=TEST_USER_ID)]
+    with patch("app.db.database.get_items_by_user", return_value=items), patch(
+        "app.db.database.get_name_aliases", return_value={"めいらく ぎゅうにゅう": 1}
+    ):
+        catalog = db_manager.get_item_catalog(TEST_USER_ID)
+    assert catalog.resolve_alias("めいらく ぎゅうにゅう") == items[0]
+
+    record_in = RecordCreate(
+        raw_item_name="ﾒｲﾗｸ ｷﾞｭｳﾆｭｳ",
+        raw_store_name="",
+        raw_price="240",
+        raw_purchase_date="2024-05-15",
+        item_id=1,
+        store_id=201,
+        price=240.0,
+    )
+    with patch("app.db.database.record_name_alias") as mock_record:
+        db_manager.save_aliases(TEST_USER_ID, record_in)
+    # 店舗名が空の場合は保存しない
+    mock_record.assert_called_once_with(TEST_USER_ID, db_manager.ITEMS, "めいらく ぎゅうにゅう", 1)
+
+
+def test_confirm_receipt_batch_updates_catalogs_with_created_entities():
+    """一括確定でDB側に作成された商品は、再取得なしでカタログに反映される"""
+    from datetime import date
+    from app.api.v1.schemas.record import ReceiptLineCreate, Record
+
+    line = ReceiptLineCreate(
+        raw_item_name="ﾁｮｺﾊﾟﾝ", raw_store_name="ライフ", raw_price="150", raw_purchase_date="2024-05-15",
+        item_name="チョコパン", store_id=2, price=150.0,
+    )
+    record = Record(
+        id=500, user_id=TEST_USER_ID, price=150.0, purchase_date=date.today(),
+        item_id=7, store_id=2, item_name="チョコパン", store_name="ライフ",
+    )
+    with patch("app.db.database.get_items_by_user", return_value=[]) as mock_get:
+        db_manager.get_item_catalog(TEST_USER_ID)
+        with patch("app.db.database.confirm_receipt_batch", return_value=[record]):
+            records, confirmed = db_manager.confirm_receipt_batch(TEST_USER_ID, [line])
+        catalog = db_manager.get_item_catalog(TEST_USER_ID)
+
+    assert records == [record]
+    assert confirmed[0].item_id == 7 and confirmed[0].store_id == 2
+    assert [item.name for item in catalog.entities] == ["チョコパン"]
+    assert catalog.resolve_alias("ちょこぱん") is None  # 正規化後に名称と一致する場合は別名にしない
+    mock_get.assert_called_once()
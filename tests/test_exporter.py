@@ -0,0 +1,95 @@
+import asyncio
+import gzip
+import io
+import json
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.services import exporter
+
+TEST_USER_ID = "test-user-uuid-123"
+
+
+def _row(i):
+    return {
+        "購入日": "2024-05-15",
+        "価格": 100 + i,
+        "商品名（レシート表記）": f"商品{i}",
+        "商品名（標準）": f"商品{i}",
+        "店舗名": "ライフ",
+    }
+
+
+def _collect(**kwargs):
+    async def run():
+        return [chunk async for chunk in exporter.iter_records_csv(TEST_USER_ID, **kwargs)]
+
+    return asyncio.run(run())
+
+
+def test_pages_are_streamed_until_cursor_runs_out():
+    """ヘッダーの後、DBの1ページごとにチャンクを返し、カーソルが None になったら終わる"""
+    pages = [([_row(1), _row(2)], 2), ([_row(3)], None)]
+    mock_page = AsyncMock(side_effect=pages)
+    with patch("app.services.db_manager.aget_export_records_page", mock_page):
+        chunks = _collect(page_size=2)
+
+    assert len(chunks) == 3
+    lines = b"".join(chunks).decode("utf-8").splitlines()
+    assert lines[0] == ",".join(exporter.EXPORT_COLUMNS)
+    assert lines[1:] == [f"2024-05-15,{100 + i},商品{i},商品{i},ライフ" for i in (1, 2, 3)]
+    assert [c.args for c in mock_page.await_args_list] == [
+        (TEST_USER_ID, 2, None),
+        (TEST_USER_ID, 2, 2),
+    ]
+
+
+def test_gzip_output_decompresses_to_same_csv():
+    """圧縮した場合も、展開すると非圧縮と同じCSVになる"""
+    pages = [([_row(1)], None)]
+    with patch("app.services.db_manager.aget_export_records_page", AsyncMock(side_effect=pages)):
+        plain = b"".join(_collect())
+    with patch("app.services.db_manager.aget_export_records_page", AsyncMock(side_effect=pages)):
+        compressed = b"".join(_collect(compress=True))
+
+    assert gzip.decompress(compressed) == plain
+
+
+def test_ndjson_keeps_price_as_number():
+    """NDJSONでは1行1件のJSONとして、価格を数値のまま出力する"""
+    pages = [([_row(1), _row(2)], None)]
+    with patch("app.services.db_manager.aget_export_records_page", AsyncMock(side_effect=pages)):
+        async def run():
+            return [c async for c in exporter.iter_records_ndjson(TEST_USER_ID)]
+
+        body = b"".join(asyncio.run(run())).decode("utf-8")
+
+    rows = [json.loads(line) for line in body.splitlines()]
+    assert rows == [_row(1), _row(2)]
+    assert isinstance(rows[0]["価格"], int)
+
+
+def test_parquet_is_written_in_typed_row_groups():
+    """Parquetは row_group_size 行ごとに書き出して返し、購入日・価格を型付きで保持する"""
+    pq = pytest.importorskip("pyarrow.parquet")
+    rows = [_row(i) for i in range(5)]
+    pages = [(rows[:3], 3), (rows[3:], None)]
+
+    async def run():
+        return [
+            c
+            async for c in exporter.iter_records_parquet(TEST_USER_ID, page_size=3, row_group_size=2)
+        ]
+
+    with patch("app.services.db_manager.aget_export_records_page", AsyncMock(side_effect=pages)):
+        chunks = asyncio.run(run())
+
+    parquet_file = pq.ParquetFile(io.BytesIO(b"".join(chunks)))
+    assert parquet_file.metadata.num_row_groups == 3
+    # 行グループ2つ分は、全件の取得を待たずに送信されている
+    assert len(chunks) == 3
+    table = parquet_file.read()
+    assert table.column_names == exporter.EXPORT_COLUMNS
+    assert str(table.schema.field("購入日").type) == "date32[day]"
+    assert table.column("価格").to_pylist() == [100.0, 101.0, 102.0, 103.0, 104.0]
@@ -0,0 +1,73 @@
+import io
+from unittest.mock import patch
+
+from app.core.config import settings
+from app.ocr.image_hash import NearDuplicateIndex, dhash, hamming_distance
+from tests.utils import make_receipt_image, make_receipt_photo
+
+TEST_USER_ID = "test-user-uuid-123"
+
+
+def _hash(*args, **kwargs):
+    return dhash(io.BytesIO(make_receipt_image(*args, **kwargs)))
+
+
+def test_retaken_photo_has_close_hash():
+    """解像度・圧縮率・形式が違うだけの同じレシートはハッシュが近く、別のレシートは遠い"""
+    base = _hash(seed=1, quality=95)
+
+    assert hamming_distance(base, _hash(seed=1, size=(300, 600), quality=60)) <= 20
+    assert hamming_distance(base, _hash(seed=1, format="PNG")) <= 20
+    assert hamming_distance(base, _hash(seed=2)) > 60
+
+
+def _photo_hash(*args, **kwargs):
+    return dhash(io.BytesIO(make_receipt_photo(*args, **kwargs)))
+
+
+def test_different_receipts_on_same_background_do_not_match():
+    """同じ机の上で撮った同じ店の別のレシートは、背景が共通でも同じレシートとみなさない"""
+    hashes = [_photo_hash(seed=seed) for seed in range(4)]
+
+    for i, a in enumerate(hashes):
+        for b in hashes[i + 1 :]:
+            assert hamming_distance(a, b) > settings.OCR_NEAR_DUPLICATE_MAX_DISTANCE
+
+
+def test_shifted_retaken_photo_matches():
+    """写る位置・大きさがずれた撮り直しも、同じレシートとみなす"""
+    base = _photo_hash(seed=1, quality=90)
+
+    for offset, scale in [((515, 150), 1.0), ((480, 170), 0.7), ((530, 120), 2.0)]:
+        retaken = _photo_hash(seed=1, offset=offset, scale=scale, quality=70)
+        assert hamming_distance(base, retaken) <= settings.OCR_NEAR_DUPLICATE_MAX_DISTANCE
+
+
+def test_unreadable_image_has_no_hash():
+    assert dhash(io.BytesIO(b"not an image")) is None
+
+
+def test_index_matches_only_same_user_within_ttl():
+    """同じユーザーの直近の画像だけを比較し、ttl を過ぎたものは対象外にする"""
+    index = NearDuplicateIndex(max_distance=2, ttl=60, max_entries=10)
+    with patch("app.ocr.image_hash.time.monotonic", return_value=1000.0):
+        index.add(TEST_USER_ID, 0b1111_0000, "key-a")
+        index.add(TEST_USER_ID, 0b0000_1111, "key-b")
+
+        assert index.find(TEST_USER_ID, 0b1111_0001) == "key-a"
+        assert index.find(TEST_USER_ID, 0b0011_1100) is None
+        assert index.find("another-user", 0b1111_0000) is None
+
+    with patch("app.ocr.image_hash.time.monotonic", return_value=1061.0):
+        assert index.find(TEST_USER_ID, 0b1111_0000) is None
+
+    assert index.stats()["hits"] == 1 and index.stats()["misses"] == 3
+
+
+def test_index_keeps_latest_entries_per_user():
+    index = NearDuplicateIndex(max_distance=0, ttl=60, max_entries=2)
+    for i, key in enumerate(["key-a", "key-b", "key-c"]):
+        index.add(TEST_USER_ID, 1 << i, key)
+
+    assert index.find(TEST_USER_ID, 1) is None
+    assert index.find(TEST_USER_ID, 1 << 2) == "key-c"
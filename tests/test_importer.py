@@ -0,0 +1,177 @@
+import asyncio
+import io
+import json
+from unittest.mock import patch
+
+import pytest
+
+from app.api.v1.schemas.item import Item
+from app.api.v1.schemas.record import Record
+from app.services import db_manager, importer
+
+TEST_USER_ID = "test-user-uuid-123"
+
+
+@pytest.fixture(autouse=True)
+def existing_catalog():
+    """既存の商品は「牛乳」(ID 1) だけ、店舗は無しとする"""
+    db_manager.catalog_cache.clear()
+    items = [Item(id=1, name="牛乳", user_id=TEST_USER_ID)]
+    with patch("app.db.database.get_items_by_user", return_value=items), patch(
+        "app.db.database.get_stores_by_user", return_value=[]
+    ):
+        yield
+    db_manager.catalog_cache.clear()
+
+
+def _fake_confirm(batches):
+    async def confirm(user_id, lines):
+        batches.append(lines)
+        records = [
+            Record(
+                id=index,
+                user_id=user_id,
+                price=line.final_price,
+                purchase_date=line.final_purchase_date,
+                item_id=line.item_id or 100 + index,
+                store_id=line.store_id or 200,
+                item_name=line.item_name or "牛乳",
+                store_name=line.store_name or "ライフ",
+            )
+            for index, line in enumerate(lines)
+        ]
+        return records, lines
+
+    return confirm
+
+
+def _run(body: bytes, format: str, batch_size: int):
+    async def run():
+        return [
+            event
+            async for event in importer.import_records(
+                TEST_USER_ID, io.BytesIO(body), format, batch_size
+            )
+        ]
+
+    return asyncio.run(run())
+
+
+def test_csv_rows_are_matched_and_inserted_in_batches():
+    """エクスポートと同じ列のCSVを batch_size 行ずつ名寄せし、1バッチ1回で登録する"""
+    body = (
+        "\ufeff購入日,価格,商品名（レシート表記）,商品名（標準）,店舗名\n"
+        "2024-05-01,200,ｷﾞｭｳﾆｭｳ,牛乳,ライフ\n"
+        "2024-05-02,120,タマゴ,卵,ライフ\n"
+        "2024-05-03,98,モヤシ,もやし,ライフ\n"
+    ).encode("utf-8")
+    batches = []
+    with patch("app.services.db_manager.aconfirm_receipt_batch", side_effect=_fake_confirm(batches)):
+        events = _run(body, "csv", batch_size=2)
+
+    assert [len(lines) for lines in batches] == [2, 1]
+    milk, egg = batches[0]
+    # 既存の商品はIDで、新規の商品・店舗は名称で指定する
+    assert (milk.item_id, milk.item_name, milk.raw_item_name) == (1, None, "ｷﾞｭｳﾆｭｳ")
+    assert (egg.item_id, egg.item_name) == (None, "卵")
+    assert (milk.store_id, milk.store_name) == (None, "ライフ")
+    assert events[-1] == {"done": True, "batches": 2, "rows": 3, "imported": 3, "failed": 0}
+
+
+def test_similar_names_are_not_merged_into_existing_items():
+    """取り込みでは類似度で既存の商品にまとめず、正規化したキーか別名が一致しないものは新規にする"""
+    body = (
+        "purchase_date,price,item_name,store_name\n"
+        "2024-05-01,180,低脂肪牛乳,ライフ\n"
+        "2024-05-02,200,ｷﾞｭｳﾆｭｳ,ライフ\n"
+        "2024-05-03,200,牛乳,ライフ\n"
+    ).encode("utf-8")
+    db_manager.get_item_catalog(TEST_USER_ID).add_alias("ギュウニュウ", 1)
+    batches = []
+    with patch("app.services.db_manager.aconfirm_receipt_batch", side_effect=_fake_confirm(batches)):
+        _run(body, "csv", batch_size=10)
+
+    low_fat, alias, exact = batches[0]
+    assert (low_fat.item_id, low_fat.item_name) == (None, "低脂肪牛乳")
+    assert (alias.item_id, alias.item_name) == (1, None)
+    assert (exact.item_id, exact.item_name) == (1, None)
+
+
+def test_prices_with_thousands_separators_are_imported():
+    """桁区切りや通貨記号の付いた価格はそのまま読み取り、数値として読み取れない価格は行エラーにする"""
+    body = (
+        "purchase_date,price,item_name,store_name\n"
+        '2024-05-01,"1,280",牛乳,ライフ\n'
+        '2024-05-02,"¥2,480円",牛乳,ライフ\n'
+        "2024-05-03,12a,牛乳,ライフ\n"
+    ).encode("utf-8")
+    batches = []
+    with patch("app.services.db_manager.aconfirm_receipt_batch", side_effect=_fake_confirm(batches)):
+        events = _run(body, "csv", batch_size=10)
+
+    assert [(line.final_price, line.raw_price) for line in batches[0]] == [(1280.0, "1,280"), (2480.0, "¥2,480円")]
+    assert events[0]["errors"] == [{"row": 4, "error": "invalid price: '12a'"}]
+
+
+def test_shift_jis_csv_is_imported():
+    """Excel で保存した Shift_JIS のCSVも読み込む"""
+    body = "購入日,価格,商品名（標準）,店舗名\n2024-05-01,200,牛乳,ライフ\n".encode("cp932")
+    batches = []
+    with patch("app.services.db_manager.aconfirm_receipt_batch", side_effect=_fake_confirm(batches)):
+        events = _run(body, "csv", batch_size=10)
+
+    assert (batches[0][0].item_id, batches[0][0].store_name) == (1, "ライフ")
+    assert events[-1]["imported"] == 1
+
+
+def test_undecodable_csv_is_reported_as_row_error():
+    """判定した文字コードで読めない行は、レスポンスを中断せずに行エラーとして返す"""
+    body = "purchase_date,price,item_name,store_name\n2024-05-01,200,牛乳,ライフ\n".encode("utf-8")
+    batches = []
+    with patch.object(importer, "ENCODING_SNIFF_BYTES", len(body)), patch(
+        "app.services.db_manager.aconfirm_receipt_batch", side_effect=_fake_confirm(batches)
+    ):
+        events = _run(body + "2024-05-02,200,牛乳,ライフ\n".encode("cp932"), "csv", batch_size=10)
+
+    assert len(batches[0]) == 1
+    assert events[0]["errors"] == [{"row": 3, "error": "could not decode the file as UTF-8"}]
+    assert events[-1]["done"] and events[-1]["failed"] == 1
+
+
+def test_invalid_rows_are_reported_without_failing_the_batch():
+    """読み取れない行は行番号付きのエラーとして返し、残りの行は登録する"""
+    body = "\n".join(
+        [
+            json.dumps({"purchase_date": "2024-05-01", "price": 200, "item_name": "牛乳", "store_name": "ライフ"}),
+            json.dumps({"purchase_date": "いつか", "price": 200, "item_name": "牛乳", "store_name": "ライフ"}),
+            "{not json",
+            json.dumps({"purchase_date": "2024-05-01", "price": 0, "item_name": "牛乳", "store_name": "ライフ"}),
+        ]
+    ).encode("utf-8")
+    batches = []
+    with patch("app.services.db_manager.aconfirm_receipt_batch", side_effect=_fake_confirm(batches)):
+        events = _run(body, "ndjson", batch_size=10)
+
+    assert len(batches[0]) == 1
+    assert [error["row"] for error in events[0]["errors"]] == [2, 3, 4]
+    assert (events[0]["imported"], events[0]["failed"]) == (1, 3)
+
+
+def test_failed_batch_is_reported_and_import_continues():
+    """DB側で失敗したバッチは登録されず、次のバッチの取り込みは続ける"""
+    body = (
+        "purchase_date,price,item_name,store_name\n"
+        "2024-05-01,200,牛乳,ライフ\n"
+        "2024-05-02,210,牛乳,ライフ\n"
+    ).encode("utf-8")
+    results = iter([None, ([Record(id=1, user_id=TEST_USER_ID, price=210, item_id=1, store_id=2, item_name="牛乳", store_name="ライフ")], [])])
+
+    async def confirm(user_id, lines):
+        return next(results)
+
+    with patch("app.services.db_manager.aconfirm_receipt_batch", side_effect=confirm):
+        events = _run(body, "csv", batch_size=1)
+
+    assert events[0]["imported"] == 0 and "could not be saved" in events[0]["errors"][0]["error"]
+    assert events[1]["imported"] == 1
+    assert events[-1]["imported"] == 1 and events[-1]["failed"] == 1
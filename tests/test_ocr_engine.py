@@ -0,0 +1,329 @@
+import asyncio
+import io
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from app.ocr import ocr_engine
+
+RESULT_URL = "https://ocr.example.com/results/1"
+
+
+class FakeClock:
+    """asyncio.sleep を実際には待たずに、経過時間だけ進める"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    fake = FakeClock()
+    with patch("app.ocr.ocr_engine.time", SimpleNamespace(monotonic=fake.monotonic, time=time.time)), patch(
+        "app.ocr.ocr_engine.asyncio", SimpleNamespace(sleep=fake.sleep)
+    ):
+        yield fake
+
+
+def _use_transport(handler):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return patch("app.ocr.ocr_engine._http_client", client)
+
+
+def test_retry_after_is_honored_and_polling_speeds_up_first(clock):
+    """429 は Retry-After だけ待って再送し、結果確認は短い間隔から始めて徐々に広げる"""
+    responses = iter(
+        [
+            httpx.Response(429, headers={"Retry-After": "3"}),
+            httpx.Response(202, headers={"operation-location": RESULT_URL}),
+            httpx.Response(200, json={"status": "running"}),
+            httpx.Response(200, json={"status": "running"}),
+            httpx.Response(200, json={"status": "succeeded", "analyzeResult": {}}),
+        ]
+    )
+    requests = []
+
+    def handler(request):
+        requests.append((request.method, str(request.url)))
+        return next(responses)
+
+    with _use_transport(handler):
+        result = asyncio.run(ocr_engine.azure_receipt_ocr(b"image"))
+
+    assert result["status"] == "succeeded"
+    assert [method for method, _ in requests] == ["POST", "POST", "GET", "GET", "GET"]
+    assert clock.sleeps == [3.0, 0.25, 0.375, 0.5625]
+
+
+def test_gives_up_at_deadline(clock):
+    """解析が終わらない場合、OCR_POLL_TIMEOUT を超えて待たずに空の結果を返す"""
+
+    def handler(request):
+        if request.method == "POST":
+            return httpx.Response(202, headers={"operation-location": RESULT_URL})
+        return httpx.Response(200, json={"status": "running"})
+
+    with _use_transport(handler):
+        assert asyncio.run(ocr_engine.azure_receipt_ocr(b"image")) == {}
+
+    assert clock.now <= ocr_engine.settings.OCR_POLL_TIMEOUT
+    assert max(clock.sleeps) == ocr_engine.settings.OCR_POLL_MAX_INTERVAL
+
+
+def test_http_error_returns_empty_result(clock):
+    """APIがエラーを返した場合は例外にせず、空の結果を返す"""
+    with _use_transport(lambda request: httpx.Response(401)):
+        assert asyncio.run(ocr_engine.azure_receipt_ocr(b"image")) == {}
+
+
+def test_polling_error_is_retried_only_when_transient(clock):
+    """結果確認の 5xx は再送し、4xx やJSONでない応答は期限まで待たずに空の結果を返す"""
+    for poll_responses, expected in [
+        ([httpx.Response(500, text="busy"), httpx.Response(200, json={"status": "succeeded"})], {"status": "succeeded"}),
+        ([httpx.Response(404, json={"error": {"code": "NotFound"}})], {}),
+        ([httpx.Response(200, text="<html>gateway</html>")], {}),
+    ]:
+        clock.now = 0.0
+        responses = iter([httpx.Response(202, headers={"operation-location": RESULT_URL}), *poll_responses])
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return next(responses)
+
+        with _use_transport(handler):
+            assert asyncio.run(ocr_engine.azure_receipt_ocr(b"image")) == expected
+
+        assert len(requests) == 1 + len(poll_responses)
+        assert clock.now < ocr_engine.settings.OCR_POLL_TIMEOUT
+
+
+def test_memoryview_is_sent_as_is_with_content_length(clock):
+    """memoryview はコピーせずに、Content-Length 付きの本文として送信する"""
+    sent = []
+
+    def handler(request):
+        if request.method == "POST":
+            sent.append((request.headers.get("content-length"), request.content))
+            return httpx.Response(202, headers={"operation-location": RESULT_URL})
+        return httpx.Response(200, json={"status": "succeeded"})
+
+    buffer = bytearray(b"\xff\xd8receipt")
+    with _use_transport(handler):
+        asyncio.run(ocr_engine.azure_receipt_ocr(memoryview(buffer)))
+
+    assert sent == [(str(len(buffer)), bytes(buffer))]
+
+
+def test_memoryview_is_sent_again_when_retried(clock):
+    """memoryview の本文も、429 の後の再送で同じ内容を送る"""
+    bodies = []
+    responses = iter(
+        [
+            httpx.Response(429, headers={"Retry-After": "1"}),
+            httpx.Response(503, headers={"Retry-After": "1"}),
+            httpx.Response(202, headers={"operation-location": RESULT_URL}),
+            httpx.Response(200, json={"status": "succeeded"}),
+        ]
+    )
+
+    def handler(request):
+        if request.method == "POST":
+            bodies.append((request.headers.get("content-length"), request.content))
+        return next(responses)
+
+    buffer = bytearray(b"imagebytes")
+    with _use_transport(handler):
+        assert asyncio.run(ocr_engine.azure_receipt_ocr(memoryview(buffer)))["status"] == "succeeded"
+
+    assert bodies == [("10", b"imagebytes")] * 3
+
+
+def test_file_stream_is_read_again_when_retried(clock):
+    """FileStream は再送時に先頭から読み直し、2回とも同じ内容を送る"""
+    from starlette.datastructures import UploadFile
+
+    upload = UploadFile(file=io.BytesIO(b"x" * 200_000), size=200_000)
+    bodies = []
+    responses = iter(
+        [
+            httpx.Response(429, headers={"Retry-After": "1"}),
+            httpx.Response(202, headers={"operation-location": RESULT_URL}),
+            httpx.Response(200, json={"status": "succeeded"}),
+        ]
+    )
+
+    def handler(request):
+        if request.method == "POST":
+            bodies.append(request.content)
+        return next(responses)
+
+    stream = ocr_engine.FileStream(upload, size=upload.size, chunk_size=64 * 1024)
+    with _use_transport(handler):
+        assert asyncio.run(ocr_engine.azure_receipt_ocr(stream))["status"] == "succeeded"
+
+    assert [len(body) for body in bodies] == [200_000, 200_000]
+
+
+def test_one_shot_stream_is_not_retried(clock):
+    """1度しか読めない非同期ジェネレーターは、429 の場合に再送せず失敗とする"""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(429, headers={"Retry-After": "1"})
+
+    async def chunks():
+        yield b"receipt"
+
+    with _use_transport(handler):
+        assert asyncio.run(ocr_engine.azure_receipt_ocr(chunks())) == {}
+
+    assert len(requests) == 1
+
+
+def test_same_image_is_served_from_cache(tmp_path):
+    """同じ画像の2回目以降は、OCR APIを呼び出さずにキャッシュ済みの解析結果を使う"""
+    from unittest.mock import AsyncMock
+
+    from app.core.cache import DiskLRUCache
+
+    result_json = {
+        "analyzeResult": {
+            "pages": [{"lines": [{"content": "牛乳 ¥198"}]}],
+            "documents": [{"fields": {"MerchantName": {"valueString": "ライフ"}}}],
+        }
+    }
+    cache = DiskLRUCache(str(tmp_path), max_bytes=1024 * 1024)
+    ocr = AsyncMock(return_value=result_json)
+    with patch("app.ocr.ocr_engine.ocr_cache", cache), patch("app.ocr.ocr_engine.azure_receipt_ocr", ocr):
+        first = asyncio.run(ocr_engine.process_image(b"same image"))
+        second = asyncio.run(ocr_engine.process_image(memoryview(b"same image")))
+        # キャッシュを使わない指定の場合は、解析し直す
+        asyncio.run(ocr_engine.process_image(b"same image", use_cache=False))
+
+    assert first == second and first[0]["item_name"] == "牛乳"
+    assert ocr.await_count == 2
+    assert cache.stats()["hits"] == 1 and cache.stats()["size"] == 1
+
+
+def test_failed_ocr_is_not_cached(tmp_path):
+    """解析に失敗した結果はキャッシュせず、次回は再度OCR APIを呼び出す"""
+    from unittest.mock import AsyncMock
+
+    from app.core.cache import DiskLRUCache
+
+    cache = DiskLRUCache(str(tmp_path), max_bytes=1024 * 1024)
+    ocr = AsyncMock(return_value={})
+    with patch("app.ocr.ocr_engine.ocr_cache", cache), patch("app.ocr.ocr_engine.azure_receipt_ocr", ocr):
+        asyncio.run(ocr_engine.process_image(b"blurry"))
+        asyncio.run(ocr_engine.process_image(b"blurry"))
+
+    assert ocr.await_count == 2 and len(cache) == 0
+
+
+def test_retaken_photo_reuses_previous_result(tmp_path):
+    """同じユーザーが同じレシートを撮り直した場合は、以前の解析結果を使う (別のユーザーには使わない)"""
+    from unittest.mock import AsyncMock
+
+    from app.core.cache import DiskLRUCache
+    from app.ocr.image_hash import NearDuplicateIndex
+    from tests.utils import make_receipt_photo
+
+    result_json = {
+        "analyzeResult": {
+            "pages": [{"lines": [{"content": "牛乳 ¥198"}]}],
+            "documents": [{"fields": {"MerchantName": {"valueString": "ライフ"}}}],
+        }
+    }
+    cache = DiskLRUCache(str(tmp_path), max_bytes=1024 * 1024)
+    index = NearDuplicateIndex(
+        max_distance=ocr_engine.settings.OCR_NEAR_DUPLICATE_MAX_DISTANCE, ttl=3600, max_entries=10
+    )
+    ocr = AsyncMock(return_value=result_json)
+    with patch("app.ocr.ocr_engine.ocr_cache", cache), patch(
+        "app.ocr.ocr_engine.near_duplicates", index
+    ), patch("app.ocr.ocr_engine.azure_receipt_ocr", ocr):
+        retaken_photo = make_receipt_photo(offset=(520, 170), scale=0.8, quality=70)
+        first = asyncio.run(ocr_engine.process_image(make_receipt_photo(quality=90), user_id="user-a"))
+        retaken = asyncio.run(ocr_engine.process_image(retaken_photo, user_id="user-a"))
+        assert ocr.await_count == 1
+        # 他のユーザーの画像とは比較しない (バイト列が同じ場合のみキャッシュを使う)
+        asyncio.run(ocr_engine.process_image(retaken_photo, user_id="user-b"))
+        asyncio.run(ocr_engine.process_image(make_receipt_photo(quality=80), user_id="user-b"))
+
+    assert first == retaken and first[0]["item_name"] == "牛乳"
+    assert ocr.await_count == 2
+    assert index.stats()["hits"] == 1 and cache.stats()["hits"] == 2
+
+
+def test_preprocessed_image_is_sent_to_ocr(tmp_path):
+    """前処理で小さくした画像をOCR APIに送り、結果の信頼度を集計する"""
+    from unittest.mock import AsyncMock
+
+    from app.core.cache import DiskLRUCache
+    from tests.utils import make_receipt_image
+
+    result_json = {
+        "analyzeResult": {
+            "pages": [{"lines": [{"content": "牛乳 ¥198"}], "words": [{"confidence": 0.5}, {"confidence": 1.0}]}],
+            "documents": [{"fields": {"MerchantName": {"valueString": "ライフ"}}}],
+        }
+    }
+    photo = make_receipt_image(size=(1600, 3200), quality=95)
+    ocr = AsyncMock(return_value=result_json)
+    with patch("app.ocr.ocr_engine.ocr_cache", DiskLRUCache(str(tmp_path), max_bytes=1024 * 1024)), patch(
+        "app.ocr.ocr_engine.azure_receipt_ocr", ocr
+    ), patch("app.ocr.ocr_engine.record_confidence") as record:
+        asyncio.run(ocr_engine.process_image(photo))
+
+    sent = ocr.await_args[0][0]
+    assert isinstance(sent, bytes) and len(sent) < len(photo)
+    record.assert_called_once_with(True, 0.75)
+
+
+def test_cache_is_accessed_off_the_event_loop(tmp_path):
+    """ディスク上のキャッシュの読み書きは、イベントループのスレッドで行わない"""
+    import threading
+    from unittest.mock import AsyncMock
+
+    from app.core.cache import DiskLRUCache
+
+    class RecordingCache(DiskLRUCache):
+        def __init__(self, *args):
+            super().__init__(*args)
+            self.threads = []
+
+        def get(self, key):
+            self.threads.append(threading.get_ident())
+            return super().get(key)
+
+        def set(self, key, value):
+            self.threads.append(threading.get_ident())
+            super().set(key, value)
+
+    async def run():
+        loop_thread = threading.get_ident()
+        await ocr_engine.process_image(b"image")
+        await ocr_engine.process_image(b"image")
+        return loop_thread
+
+    cache = RecordingCache(str(tmp_path), 1024 * 1024)
+    result_json = {"analyzeResult": {"documents": [{"fields": {}}], "pages": []}}
+    with patch("app.ocr.ocr_engine.ocr_cache", cache), patch(
+        "app.ocr.ocr_engine.azure_receipt_ocr", AsyncMock(return_value=result_json)
+    ):
+        loop_thread = asyncio.run(run())
+
+    assert len(cache.threads) == 3 and loop_thread not in cache.threads
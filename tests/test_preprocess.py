@@ -0,0 +1,89 @@
+import random
+from unittest.mock import patch
+
+import cv2
+import numpy as np
+
+from app.ocr import preprocess
+
+# 300dpi で幅 80mm のレシートの幅 (px)
+TARGET_WIDTH = round(80 / 25.4 * 300)
+
+
+def _photo(size=(3024, 4032), receipt=(700, 400, 1500, 3400), seed=0) -> bytes:
+    """暗い机の上に置いたレシートを撮影したような、大きなカラー写真 (JPEG) を作る"""
+    rnd = random.Random(seed)
+    width, height = size
+    noise = np.random.default_rng(seed).integers(0, 40, (height, width, 3), dtype=np.uint8)
+    img = (np.full((height, width, 3), 60, dtype=np.uint8) + noise).astype(np.uint8)
+    x, y, w, h = receipt
+    img[y : y + h, x : x + w] = (235, 240, 245)
+    for line_y in range(y + 60, y + h - 60, 70):
+        left = x + 60
+        while True:
+            word = rnd.randint(40, 200)
+            if left + word > x + w - 60:
+                break
+            cv2.rectangle(img, (left, line_y), (left + word, line_y + 35), (20, 20, 20), -1)
+            left += word + rnd.randint(20, 80)
+    ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    return encoded.tobytes()
+
+
+def test_photo_is_cropped_to_receipt_and_downscaled():
+    """レシート部分だけを切り抜き、幅を目標の解像度に縮小したグレースケールの JPEG にする"""
+    photo = _photo()
+    result = preprocess.preprocess_image(photo)
+
+    assert result is not None and len(result) < len(photo) / 4
+    decoded = cv2.imdecode(np.frombuffer(result, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    assert decoded.ndim == 2
+    height, width = decoded.shape
+    assert abs(width - TARGET_WIDTH) <= 2
+    # 切り抜いたレシート (1500x3400 と余白) の縦横比が保たれている
+    assert 3400 / 1500 * 0.9 < height / width < 3400 / 1500 * 1.1
+
+
+def test_sideways_receipt_is_scaled_by_its_short_side():
+    """横向きに写ったレシートも、長さではなく短辺 (用紙の幅) が目標の解像度になるよう縮小する"""
+    photo = _photo(size=(4032, 3024), receipt=(300, 900, 3400, 1200))
+    result = preprocess.preprocess_image(photo)
+
+    decoded = cv2.imdecode(np.frombuffer(result, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    height, width = decoded.shape
+    assert abs(height - TARGET_WIDTH) <= 2
+    assert width > height * 2
+
+
+def test_photo_without_receipt_outline_is_only_downscaled():
+    """レシートが写真の全体に写っている場合は切り抜かず、長辺を上限に収める"""
+    photo = _photo(size=(1600, 3200), receipt=(0, 0, 1600, 3200))
+    with patch.object(preprocess.settings, "OCR_PREPROCESS_MAX_DIMENSION", 2048):
+        result = preprocess.preprocess_image(photo)
+
+    decoded = cv2.imdecode(np.frombuffer(result, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    assert decoded.shape == (2048, 1024)
+
+
+def test_unsupported_or_already_small_image_is_sent_as_is():
+    """読み込めない形式や、小さくならない画像は None を返し、元の画像をそのまま送る"""
+    small = cv2.imencode(".jpg", np.zeros((20, 20), dtype=np.uint8), [cv2.IMWRITE_JPEG_QUALITY, 10])[1]
+
+    assert preprocess.preprocess_image(b"not an image") is None
+    assert preprocess.preprocess_image(small.tobytes()) is None
+
+
+def test_stats_report_byte_ratio_and_confidence():
+    with patch.object(preprocess, "_stats", dict.fromkeys(preprocess._stats, 0)), patch.object(
+        preprocess, "_confidence", {"preprocessed": (0.0, 0), "original": (0.0, 0)}
+    ):
+        preprocess.preprocess_image(_photo())
+        preprocess.record_confidence(True, 0.9)
+        preprocess.record_confidence(True, 0.8)
+        preprocess.record_confidence(False, None)
+        stats = preprocess.preprocess_stats()
+
+    assert stats["images"] == 1 and stats["cropped"] == 1
+    assert 0 < stats["byte_ratio"] < 0.25
+    assert abs(stats["preprocessed_confidence"] - 0.85) < 1e-9
+    assert stats["original_confidence"] is None
@@ -0,0 +1,214 @@
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from jose import jwt
+
+from app.core import security
+from app.core.config import settings
+from app.api.v1.schemas.user import User
+
+TEST_USER_UUID = "00000000-0000-0000-0000-000000000001"
+
+
+def make_token(**overrides) -> str:
+    """Supabaseが発行するアクセストークンのクレーム構造を模倣したJWTを生成する"""
+    claims = {
+        "sub": TEST_USER_UUID,
+        "email": "test@example.com",
+        "aud": settings.JWT_AUDIENCE,
+        "iss": security._jwt_issuer(),
+        "exp": int(time.time()) + 3600,
+        "user_metadata": {"username": "testuser"},
+    }
+    claims.update(overrides)
+    secret = claims.pop("secret", settings.SUPABASE_JWT_SECRET)
+    return jwt.encode(claims, secret, algorithm=settings.JWT_ALGORITHM)
+
+
+def authenticate(token: str) -> User:
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    return security.get_current_active_user(credentials)
+
+
+@pytest.fixture(autouse=True)
+def clear_token_cache():
+    """テスト間でトークンキャッシュの状態を持ち越さない"""
+    security.token_cache.clear()
+    yield
+    security.token_cache.clear()
+
+
+@patch("app.core.security._verify_token_remotely")
+def test_local_verification_builds_user_from_claims(mock_remote):
+    """有効なトークンはSupabaseに問い合わせずにUserが構築される"""
+    user = authenticate(make_token())
+
+    assert user.id == TEST_USER_UUID
+    assert user.email == "test@example.com"
+    assert user.username == "testuser"
+    mock_remote.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "overrides, username, email",
+    [
+        ({"user_metadata": {"username": "u" * 51}}, "test@example.com", "test@example.com"),
+        ({"user_metadata": {"username": 123}}, "test@example.com", "test@example.com"),
+        ({"user_metadata": None, "email": "e" * 120}, "e" * 50, "e" * 100),
+    ],
+)
+def test_unusual_claims_are_normalized(overrides, username, email):
+    """長すぎる・文字列でないユーザー名はメールアドレスで補い、上限を超える分は切り詰める"""
+    user = authenticate(make_token(**overrides))
+
+    assert (user.username, user.email) == (username, email)
+
+
+def test_invalid_user_claims_are_rejected_and_cached():
+    """クレームから User を構築できない場合は、503 ではなく 401 とし、失敗としてキャッシュする"""
+
+    def invalid_user(token):
+        return User(id=TEST_USER_UUID, email="test@example.com", username="u" * 51)
+
+    token = make_token()
+    with patch("app.core.security._verify_token_locally", side_effect=invalid_user) as mock_local:
+        for _ in range(2):
+            with pytest.raises(HTTPException) as exc_info:
+                authenticate(token)
+            assert exc_info.value.status_code == 401
+
+    mock_local.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    "overrides",
+    [
+        {"exp": int(time.time()) - 10},  # 期限切れ
+        {"aud": "anon"},  # audが不一致
+        {"iss": "https://evil.example.com/auth/v1"},  # issが不一致
+        {"secret": "wrong-secret"},  # 署名が不正
+    ],
+)
+@patch("app.core.security._verify_token_remotely")
+def test_local_verification_rejects_invalid_tokens(mock_remote, overrides):
+    """署名・exp・aud・iss のいずれかが不正な場合は401になる"""
+    with pytest.raises(HTTPException) as exc_info:
+        authenticate(make_token(**overrides))
+
+    assert exc_info.value.status_code == 401
+    mock_remote.assert_not_called()
+
+
+@patch("app.core.security._verify_token_remotely")
+def test_remote_fallback_when_configured(mock_remote):
+    """JWT_REMOTE_FALLBACK が有効な場合のみ、ローカル検証失敗時にリモート検証する"""
+    remote_user = User(id=TEST_USER_UUID, username="remote", email="r@example.com")
+    mock_remote.return_value = remote_user
+    token = make_token(secret="rotated-secret")
+
+    with patch.object(settings, "JWT_REMOTE_FALLBACK", True):
+        assert authenticate(token) == remote_user
+    mock_remote.assert_called_once_with(token)
+
+    # 期限切れトークンはフォールバックしない
+    mock_remote.reset_mock()
+    with patch.object(settings, "JWT_REMOTE_FALLBACK", True):
+        with pytest.raises(HTTPException):
+            authenticate(make_token(exp=int(time.time()) - 10))
+    mock_remote.assert_not_called()
+
+
+def test_token_cache_skips_repeated_validation():
+    """同じトークンは2回目以降キャッシュから返され、再検証されない"""
+    token = make_token()
+    hits_before = security.token_cache.hits
+
+    with patch(
+        "app.core.security._verify_token_locally",
+        wraps=security._verify_token_locally,
+    ) as mock_local:
+        first = authenticate(token)
+        second = authenticate(token)
+
+    assert first == second
+    mock_local.assert_called_once_with(token)
+    assert security.token_cache.hits == hits_before + 1
+
+
+def test_token_cache_caches_failures_briefly():
+    """検証に失敗したトークンもキャッシュされ、連続したリクエストで再検証されない"""
+    token = make_token(secret="wrong-secret")
+
+    with patch(
+        "app.core.security._verify_token_locally",
+        wraps=security._verify_token_locally,
+    ) as mock_local:
+        for _ in range(3):
+            with pytest.raises(HTTPException):
+                authenticate(token)
+
+    mock_local.assert_called_once_with(token)
+
+
+def test_token_cache_ttl_is_bounded_by_exp():
+    """キャッシュ期間はトークンのexpと TOKEN_CACHE_MAX_TTL の早い方になる"""
+    soon = make_token(exp=int(time.time()) + 30)
+    later = make_token(exp=int(time.time()) + 36000)
+
+    assert security._token_cache_ttl(soon) <= 30
+    assert security._token_cache_ttl(later) == settings.TOKEN_CACHE_MAX_TTL
+
+
+def test_transient_remote_errors_are_not_cached():
+    """Supabase Authへの通信エラーは 503 にし、失敗としてキャッシュしない (次のリクエストで再検証する)"""
+    import httpx
+
+    token = make_token(secret="rotated-secret")
+    remote_user = User(id=TEST_USER_UUID, username="remote", email="r@example.com")
+
+    with patch.object(settings, "JWT_REMOTE_FALLBACK", True), patch(
+        "app.core.security._verify_token_remotely",
+        side_effect=[httpx.ConnectError("connection refused"), remote_user],
+    ):
+        with pytest.raises(HTTPException) as exc_info:
+            authenticate(token)
+        assert exc_info.value.status_code == 503
+        assert authenticate(token) == remote_user
+
+
+def test_remote_rejection_is_cached():
+    """Supabase Authがトークンを拒否した (4xx) 場合は、失敗としてキャッシュする"""
+
+    class AuthApiError(Exception):
+        status = 401
+
+    token = make_token(secret="rotated-secret")
+    with patch.object(settings, "JWT_REMOTE_FALLBACK", True), patch(
+        "app.core.security._verify_token_remotely", side_effect=AuthApiError("invalid JWT")
+    ) as mock_remote:
+        for _ in range(2):
+            with pytest.raises(HTTPException) as exc_info:
+                authenticate(token)
+            assert exc_info.value.status_code == 401
+
+    mock_remote.assert_called_once_with(token)
+
+
+def test_stats_requires_admin():
+    """/stats は ADMIN_USER_IDS に含まれるユーザーのみ取得できる"""
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    client = TestClient(app)
+    headers = {"Authorization": f"Bearer {make_token()}"}
+
+    assert client.get("/stats").status_code in (401, 403)
+    assert client.get("/stats", headers=headers).status_code == 403
+    with patch.object(settings, "ADMIN_USER_IDS", [TEST_USER_UUID]):
+        response = client.get("/stats", headers=headers)
+    assert response.status_code == 200
+    assert "token_cache" in response.json()
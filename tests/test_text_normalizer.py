@@ -0,0 +1,24 @@
+import pytest
+
+from app.services.text_normalizer import canonical_key
+
+
+@pytest.mark.parametrize(
+    "a, b",
+    [
+        ("ﾎﾟﾃﾄﾁｯﾌﾟｽ", "ポテトチップス"),  # 半角カナ
+        ("ポテトチップス", "ぽてとちっぷす"),  # カタカナ/ひらがな
+        ("牛乳　１Ｌ", "牛乳 1l"),  # 全角英数字・全角空白
+        ("セブン−イレブン", "セブン-イレブン"),  # ハイフンの表記ゆれ
+        ("  Coke   Zero ", "coke zero"),  # 連続する空白
+    ],
+)
+def test_canonical_key_absorbs_notation_variants(a, b):
+    """OCRでよく見られる表記ゆれが、同じキーに正規化される"""
+    assert canonical_key(a) == canonical_key(b)
+
+
+def test_canonical_key_keeps_distinct_names_apart():
+    """長音記号や漢字など、意味の異なる違いは残す"""
+    assert canonical_key("コーヒー") != canonical_key("コヒ")
+    assert canonical_key("牛乳") != canonical_key("豆乳")
@@ -1,4 +1,6 @@
 # tests/utils.py
+import io
+import random
 
 from jose import jwt
 
@@ -17,4 +19,57 @@ def create_mock_jwt(user_uuid: str = TEST_USER_UUID, secret: str = settings.SUPA
         secret, 
         algorithm="HS256"
     )
-    return encoded_jwt
\ No newline at end of file
+    return encoded_jwt
+
+
+def _draw_receipt(seed: int):
+    """文字の代わりに黒い長方形を並べた、400x800 のレシート風の画像 (同じ seed からは同じ内容)"""
+    from PIL import Image, ImageDraw
+
+    rnd = random.Random(seed)
+    img = Image.new("RGB", (400, 800), "white")
+    draw = ImageDraw.Draw(img)
+    # 同じ店のレシートを想定し、店名の部分は seed によらず同じにする
+    draw.rectangle([120, 30, 280, 60], fill="black")
+    for y in range(90, 770, 28):
+        x = 20
+        while True:
+            width = rnd.randint(15, 70)
+            if x + width > 380:
+                break
+            draw.rectangle([x, y, x + width, y + 14], fill="black")
+            x += width + rnd.randint(8, 40)
+    return img
+
+
+def _encode(img, format: str, **options) -> bytes:
+    buffer = io.BytesIO()
+    img.save(buffer, format=format, **options)
+    return buffer.getvalue()
+
+
+def make_receipt_image(seed: int = 0, size=(400, 800), format: str = "JPEG", **options) -> bytes:
+    """
+    テスト用のレシート風の画像 (レシートだけが写ったもの) を生成する。
+    同じ seed からは同じ内容の画像になり、size や options (quality など) で写り方だけを変えられる。
+    """
+    return _encode(_draw_receipt(seed).resize(size), format, **options)
+
+
+def make_receipt_photo(seed: int = 0, offset=(500, 150), scale: float = 1.0, **options) -> bytes:
+    """
+    テスト用の、机の上に置いたレシートを撮影したような写真 (JPEG) を生成する。
+    背景 (明るさにむらのある暗い机) はどの seed でも同じで、offset でレシートを置く位置を変えられる。
+    """
+    import numpy as np
+    from PIL import Image
+
+    width, height = 1400, 1100
+    rng = np.random.default_rng(99)
+    texture = np.kron(rng.normal(0, 15, (height // 20, width // 20)), np.ones((20, 20)))
+    gradient = np.linspace(40, 110, width)[None, :]
+    background = Image.fromarray(np.clip(gradient + texture, 0, 255).astype(np.uint8)).convert("RGB")
+    background.paste(_draw_receipt(seed), offset)
+    if scale != 1.0:
+        background = background.resize((int(width * scale), int(height * scale)))
+    return _encode(background, "JPEG", **options)